@@ -1,7 +1,14 @@
 from flask import Flask
 from config import Config
-from flask_sqlalchemy import SQLAlchemy
 from flask_rest_jsonapi import Api
+from application.cache import CountCache, LRUCache, ResponseCache
+from application.database import SQLAlchemy, configure_engine, init_replicas
+from application.encoding import get_encoder
+from application.index_advisor import FilterUsage
+from application.instrumentation import init_instrumentation
+from application.metrics import init_metrics
+import logging
+import os
 
 
 # Initialize SQLAlchemy
@@ -27,6 +34,52 @@ def create_app(config_class=Config):
     db.init_app(app)
     api.init_app(app)
 
+    # Read replicas, registered as binds before the engines are created
+    if app.config['SQLALCHEMY_REPLICAS']:
+        init_replicas(app)
+
+    # Pragmas of the SQLite connections, set before the engines open any connection
+    engines = {bind: db.get_engine(app, bind) for bind in [None] + list(app.config['SQLALCHEMY_BINDS'] or ())}
+    for engine in engines.values():
+        configure_engine(app, engine)
+
+    # Statement counts and timings of each endpoint
+    if app.config['INSTRUMENTATION']:
+        init_instrumentation(app, engines.values())
+
+    # Prometheus metrics of the routes of the api, the connection pools and the caches
+    if app.config['METRICS']:
+        init_metrics(app, api, engines)
+
+    # Encoder of the documents returned by the resources
+    app.extensions['jsonapi_encoder'] = get_encoder(app.config['JSONAPI_ENCODER'])
+
+    # Serializers compiled from the schemas, see api_bp/serializer.py
+    app.extensions['compiled_schemas'] = dict()
+
+    # Cache of meta.count, used by the 'cached' COUNT_MODE
+    app.extensions['count_cache'] = CountCache(LRUCache(app.config['COUNT_CACHE_SIZE']),
+                                               app.config['COUNT_CACHE_TIMEOUT'])
+
+    # Cache of the responses of GET requests
+    if app.config['RESPONSE_CACHE']:
+        backend = app.config['RESPONSE_CACHE_BACKEND'] or LRUCache(app.config['RESPONSE_CACHE_SIZE'])
+        app.extensions['response_cache'] = ResponseCache(backend, app.config['RESPONSE_CACHE_TIMEOUT'])
+
+    # Cache of the sqlalchemy filters compiled from the filter querystring parameter
+    app.extensions['filter_cache'] = LRUCache(app.config['FILTER_CACHE_SIZE'])
+
+    # Count of the columns compared by filters, used by the index advisor
+    app.extensions['filter_usage'] = FilterUsage()
+    if app.config['FILTER_USAGE_LOG']:
+        filter_usage_logger = logging.getLogger('application.index_advisor')
+        filter_usage_logger.setLevel(logging.INFO)
+        log_path = os.path.abspath(app.config['FILTER_USAGE_LOG'])
+        if log_path not in [getattr(handler, 'baseFilename', None) for handler in filter_usage_logger.handlers]:
+            handler = logging.FileHandler(log_path)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            filter_usage_logger.addHandler(handler)
+
     # Register all blueprints with the application
     from application.api_bp import api_bp
     app.register_blueprint(api_bp)
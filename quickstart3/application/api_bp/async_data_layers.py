@@ -0,0 +1,316 @@
+"""Data layer of the resource managers served with async sessions, see application/asgi.py"""
+
+from application.api_bp.data_layers import DataLayer, get_identity_key
+from flask import current_app
+from flask_rest_jsonapi.exceptions import JsonApiException, ObjectNotFound, RelatedObjectNotFound
+from flask_rest_jsonapi.schema import get_relationships, get_schema_field
+from sqlalchemy import func, orm, select
+
+
+class AsyncDataLayer(DataLayer):
+    """Data layer whose statements are executed by an AsyncSession (see 'session')
+
+    The statements are built by the methods of DataLayer: the filters (compiled and cached the
+    same way), the sorting, the offset pagination, the count modes and the eager loads of the
+    relationships that are serialized are the ones of the WSGI application. Building a statement
+    reads the request and the configuration, so it is done under the request context, by the
+    synchronous methods. The coroutines only execute the statements, outside of any context:
+    the contexts of Flask are shared by all the coroutines of the event loop.
+
+    An AsyncSession can not lazy load, so the objects are always loaded with the eager loads
+    of eagerload_includes, and reloaded with them after a write. The hooks that read the
+    database (eg. after_get_collection) are coroutines.
+    """
+
+    def query(self, view_kwargs):
+        """Construct the base statement to retrieve wanted data
+
+        :param dict view_kwargs: kwargs from the resource view
+        :return Select: the statement
+        """
+        return select(self.model)
+
+    def count_query(self, query, qs, view_kwargs):
+        """Count the objects of a statement according to the count mode of the request, see DataLayer.count_query
+
+        :param Select query: the statement of the objects
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :param dict view_kwargs: kwargs from the resource view
+        :return coroutine: the count, to await outside of the request context
+        """
+        count_mode = self.get_count_mode(qs)
+        count_cap = current_app.config['COUNT_CAP']
+        count_cache = current_app.extensions['count_cache']
+        key = self.get_count_key(qs, view_kwargs) if count_mode == 'cached' else None
+        cached_count = count_cache.get(key) if key is not None else None
+
+        # count the primary keys, rather than a subquery of all the columns
+        query = query.order_by(None).with_only_columns(*orm.class_mapper(self.model).primary_key)
+        if count_mode == 'capped':
+            query = query.limit(count_cap + 1)
+        statement = select(func.count()).select_from(query.subquery())
+
+        async def count():
+            if count_mode == 'none':
+                return None
+            if cached_count is not None:
+                return cached_count
+            object_count = await self.session.scalar(statement)
+            if count_mode == 'capped' and object_count > count_cap:
+                return '{}+'.format(count_cap)
+            if key is not None:
+                count_cache.set(key, object_count)
+            return object_count
+
+        return count()
+
+    def get_object_query(self, qs):
+        """Build the statement of the object of a detail request, without its identifier
+
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :return Select: the statement
+        """
+        query = select(self.model)
+
+        if getattr(self, 'load_dumped_columns', True):
+            query = self.load_dumped_columns(query, qs)
+
+        if getattr(self, 'eagerload_includes', True):
+            query = self.eagerload_includes(query, qs)
+
+        return query
+
+    async def get_collection(self, object_count, query, qs, view_kwargs):
+        """Retrieve a page of objects, from the count and the statement of get_page_query
+
+        :param coroutine object_count: the count of the objects
+        :param Select query: the statement of the page
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :param dict view_kwargs: kwargs from the resource view
+        :return tuple: the number of objects and the list of objects
+        """
+        object_count = await object_count
+
+        collection = (await self.session.execute(query)).scalars().unique().all()
+
+        collection = await self.after_get_collection(collection, qs, view_kwargs)
+
+        return object_count, collection
+
+    async def get_object(self, query, view_kwargs):
+        """Retrieve an object, from the statement of get_object_query
+
+        :param Select query: the statement of the object
+        :param dict view_kwargs: kwargs from the resource view
+        :return DeclarativeMeta: an object from sqlalchemy
+        """
+        await self.before_get_object(view_kwargs)
+
+        id_field = getattr(self, 'id_field', orm.class_mapper(self.model).primary_key[0].key)
+        try:
+            filter_field = getattr(self.model, id_field)
+        except Exception:
+            raise Exception("{} has no attribute {}".format(self.model.__name__, id_field))
+
+        url_field = getattr(self, 'url_field', 'id')
+        filter_value = view_kwargs[url_field]
+
+        obj = None
+        if filter_value is not None:
+            result = await self.session.execute(query.where(filter_field == filter_value))
+            obj = result.scalars().unique().one_or_none()
+
+        await self.after_get_object(obj, view_kwargs)
+
+        return obj
+
+    async def create_object(self, data, query, view_kwargs):
+        """Create an object, and reload it with the statement of get_object_query
+
+        :param dict data: the data validated by marshmallow
+        :param Select query: the statement of the object
+        :param dict view_kwargs: kwargs from the resource view
+        :return DeclarativeMeta: an object from sqlalchemy
+        """
+        await self.before_create_object(data, view_kwargs)
+
+        relationship_fields = get_relationships(self.resource.schema, model_field=True)
+        obj = self.model(**{key: value
+                            for (key, value) in data.items() if key not in relationship_fields})
+        await self.apply_relationships(data, obj)
+
+        self.session.add(obj)
+        try:
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            raise JsonApiException("Object creation error: " + str(e), source={'pointer': '/data'})
+
+        obj = await self.reload_object(obj, query)
+
+        await self.after_create_object(obj, data, view_kwargs)
+
+        return obj
+
+    async def update_object(self, obj, data, query, view_kwargs):
+        """Update an object loaded by get_object, and reload it with the statement of get_object_query
+
+        :param DeclarativeMeta obj: an object from sqlalchemy
+        :param dict data: the data validated by marshmallow
+        :param Select query: the statement of the object
+        :param dict view_kwargs: kwargs from the resource view
+        :return DeclarativeMeta: the object
+        """
+        if obj is None:
+            url_field = getattr(self, 'url_field', 'id')
+            filter_value = view_kwargs[url_field]
+            raise ObjectNotFound('{}: {} not found'.format(self.model.__name__, filter_value),
+                                 source={'parameter': url_field})
+
+        await self.before_update_object(obj, data, view_kwargs)
+
+        relationship_fields = get_relationships(self.resource.schema, model_field=True)
+        for key, value in data.items():
+            if hasattr(obj, key) and key not in relationship_fields:
+                setattr(obj, key, value)
+
+        await self.apply_relationships(data, obj)
+
+        try:
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            raise JsonApiException("Update object error: " + str(e), source={'pointer': '/data'})
+
+        obj = await self.reload_object(obj, query)
+
+        await self.after_update_object(obj, data, view_kwargs)
+
+        return obj
+
+    async def delete_object(self, obj, view_kwargs):
+        """Delete an object loaded by get_object
+
+        :param DeclarativeMeta obj: an object from sqlalchemy
+        :param dict view_kwargs: kwargs from the resource view
+        """
+        if obj is None:
+            url_field = getattr(self, 'url_field', 'id')
+            filter_value = view_kwargs[url_field]
+            raise ObjectNotFound('{}: {} not found'.format(self.model.__name__, filter_value),
+                                 source={'parameter': url_field})
+
+        await self.before_delete_object(obj, view_kwargs)
+
+        await self.session.delete(obj)
+        try:
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            raise JsonApiException("Delete object error: " + str(e))
+
+        await self.after_delete_object(obj, view_kwargs)
+
+    async def reload_object(self, obj, query):
+        """Load an object again after a write, with the columns and relationships that will be serialized
+
+        :param DeclarativeMeta obj: an object from sqlalchemy
+        :param Select query: the statement of the object, see get_object_query
+        :return DeclarativeMeta: the object
+        """
+        pk_column = orm.class_mapper(self.model).primary_key[0]
+        result = await self.session.execute(query.where(getattr(self.model, pk_column.key) ==
+                                                        orm.attributes.instance_state(obj).identity[0])
+                                                 .execution_options(populate_existing=True))
+        return result.scalars().unique().one()
+
+    async def apply_relationships(self, data, obj):
+        """Apply relationship provided by data to obj
+
+        :param dict data: data provided by the client
+        :param DeclarativeMeta obj: the sqlalchemy object to plug relationships to
+        """
+        relationship_fields = get_relationships(self.resource.schema, model_field=True)
+        for key, value in data.items():
+            if key not in relationship_fields:
+                continue
+            related_model = getattr(obj.__class__, key).property.mapper.class_
+            schema_field = get_schema_field(self.resource.schema, key)
+            related_id_field = self.resource.schema._declared_fields[schema_field].id_field
+
+            if isinstance(value, list):
+                related_object = [await self.get_related_object(related_model, related_id_field, {'id': identifier})
+                                  for identifier in value]
+            elif value is not None:
+                related_object = await self.get_related_object(related_model, related_id_field, {'id': value})
+            else:
+                related_object = None
+            setattr(obj, key, related_object)
+
+    async def get_related_object(self, related_model, related_id_field, obj):
+        """Get a related object
+
+        :param Model related_model: an sqlalchemy model
+        :param str related_id_field: the identifier field of the related model
+        :param dict obj: the identifier of the related object
+        :return DeclarativeMeta: a related object
+        """
+        if related_id_field == orm.class_mapper(related_model).primary_key[0].key:
+            related_object = await self.load_object(related_model, obj['id'])
+        else:
+            result = await self.session.execute(select(related_model)
+                                                .where(getattr(related_model, related_id_field) == obj['id']))
+            related_object = result.scalars().one_or_none()
+        if related_object is None:
+            raise RelatedObjectNotFound("{}.{}: {} not found".format(related_model.__name__,
+                                                                     related_id_field,
+                                                                     obj['id']))
+        return related_object
+
+    async def load_object(self, model, id_):
+        """Return an object by primary key, from the identity map of the session if it is there
+
+        :param DeclarativeMeta model: an sqlalchemy model
+        :param id_: the primary key of the object, as given by the client
+        :return DeclarativeMeta: the object, or None if there is no such object
+        """
+        key = get_identity_key(model, id_)
+        if key is None:
+            return None
+        return await self.session.get(model, key[1])
+
+    async def before_create_object(self, data, view_kwargs):
+        """Provide additional data before object creation"""
+        pass
+
+    async def after_create_object(self, obj, data, view_kwargs):
+        """Provide additional data after object creation"""
+        pass
+
+    async def before_get_object(self, view_kwargs):
+        """Make work before to retrieve an object"""
+        pass
+
+    async def after_get_object(self, obj, view_kwargs):
+        """Make work after to retrieve an object"""
+        pass
+
+    async def after_get_collection(self, collection, qs, view_kwargs):
+        """Make work after to retrieve a collection of objects"""
+        return collection
+
+    async def before_update_object(self, obj, data, view_kwargs):
+        """Make checks or provide additional data before update object"""
+        pass
+
+    async def after_update_object(self, obj, data, view_kwargs):
+        """Make work after update object"""
+        pass
+
+    async def before_delete_object(self, obj, view_kwargs):
+        """Make checks before delete object"""
+        pass
+
+    async def after_delete_object(self, obj, view_kwargs):
+        """Make work after delete object"""
+        pass
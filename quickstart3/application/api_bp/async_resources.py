@@ -0,0 +1,237 @@
+"""Base classes of the resource managers served with async sessions, see application/asgi.py"""
+
+from application.api_bp.data_layers import invalidate_caches
+from application.api_bp.querystring import QueryStringManager as QSManager
+from application.api_bp.resources import CachedResource, EncodedResource, ResourceList, get_related_types,\
+    is_bulk, load_json_data
+from application.api_bp.serializer import dump
+from flask import request
+from flask_rest_jsonapi.decorators import check_headers
+from flask_rest_jsonapi.errors import jsonapi_errors
+from flask_rest_jsonapi.exceptions import BadRequest, JsonApiException
+from flask_rest_jsonapi.schema import compute_schema
+
+
+class AsyncResource(object):
+    """Resource manager whose requests are coroutines, reading the database through an AsyncSession
+
+    A request runs in turns: its request context is pushed to parse the request and build
+    the statements, popped while the statements are awaited, and pushed again to dump the
+    objects. The contexts of Flask are shared by all the coroutines of the event loop, so a
+    coroutine never awaits while a context is pushed.
+
+    The responses are the ones of the WSGI resource managers, tagged with an ETag like
+    ConditionalResource does, and the writes renew the generation tokens of the response
+    cache and the count cache like CachedResource does. The responses are not cached.
+
+    A method returns None to leave the request to the WSGI application, see application/asgi.py.
+
+    :param Flask app: the application
+    :param str view: the endpoint of the request
+    :param dict environ: the WSGI environ of the request
+    :param AsyncSession session: the session of the request
+    """
+
+    def __init__(self, app, view, environ, session):
+        self.app = app
+        self.view = view
+        self.environ = environ
+        self._data_layer = self.data_layer['class'](dict(self.data_layer, session=session))
+        self._data_layer.resource = type(self)
+
+    def request_context(self):
+        """Return the request context of the request, to push around synchronous code only"""
+        # each context reads the body again
+        self.environ['wsgi.input'].seek(0)
+        return self.app.request_context(self.environ)
+
+    async def dispatch(self, view_kwargs):
+        """Handle the request
+
+        :param dict view_kwargs: the view arguments of the request
+        :return Response: the response, or None to leave the request to the WSGI application
+        """
+        method = getattr(self, 'get' if self.environ['REQUEST_METHOD'] == 'HEAD'
+                         else self.environ['REQUEST_METHOD'].lower(), None)
+        if method is None:
+            return None
+
+        with self.request_context():
+            response = check_headers(lambda: None)()
+            if response is not None:
+                return response
+
+        try:
+            return await method(view_kwargs)
+        except JsonApiException as e:
+            with self.request_context():
+                return self.make_response(jsonapi_errors([e.to_dict()]), e.status)
+        except Exception as e:
+            if self.app.config['DEBUG'] is True:
+                raise e
+            exc = JsonApiException(getattr(e, 'detail', str(e)),
+                                   source=getattr(e, 'source', ''),
+                                   title=getattr(e, 'title', None),
+                                   status=getattr(e, 'status', None),
+                                   code=getattr(e, 'code', None),
+                                   id_=getattr(e, 'id', None),
+                                   links=getattr(e, 'links', None),
+                                   meta=getattr(e, 'meta', None))
+            with self.request_context():
+                return self.make_response(jsonapi_errors([exc.to_dict()]), exc.status)
+
+    @staticmethod
+    def make_response(data, status, headers=None):
+        """Return the response of a document, conditional for a GET or HEAD request, under the request context"""
+        if isinstance(data, dict):
+            data.update({'jsonapi': {'version': '1.0'}})
+        response = EncodedResource.make_response(data, status, headers)
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            response.add_etag()
+            response.make_conditional(request.environ)
+        return response
+
+    def get_written_types(self):
+        """Return the resource types changed by the write of the current request"""
+        return CachedResource.get_written_types(self)
+
+
+class AsyncResourceList(AsyncResource):
+    """Resource list manager served with an AsyncSession
+
+    Keyset pagination, streamed pages and bulk requests are left to the WSGI application.
+    """
+
+    async def get(self, view_kwargs):
+        """Retrieve a collection of objects"""
+        with self.request_context():
+            qs = QSManager(request.args, self.schema)
+            if qs.is_keyset_pagination() or ResourceList.is_streamed(self, qs):
+                return None
+
+            schema_kwargs = dict(getattr(self, 'get_schema_kwargs', dict()))
+            schema_kwargs.update({'many': True})
+
+            schema = compute_schema(self.schema,
+                                    schema_kwargs,
+                                    qs,
+                                    qs.include)
+
+            objects_count, query = self._data_layer.get_page_query(qs, view_kwargs)
+
+        objects_count, objects = await self._data_layer.get_collection(objects_count, query, qs, view_kwargs)
+
+        with self.request_context():
+            result = dump(schema, objects)
+            ResourceList.add_collection_links(self, result, objects_count, objects, qs)
+            return self.make_response(result, 200)
+
+    async def post(self, view_kwargs):
+        """Create an object"""
+        with self.request_context():
+            json_data = request.get_json()
+            if is_bulk(json_data):
+                return None
+
+            qs = QSManager(request.args, self.schema)
+            schema = compute_schema(self.schema,
+                                    getattr(self, 'post_schema_kwargs', dict()),
+                                    qs,
+                                    qs.include)
+
+            data, errors = load_json_data(schema, json_data)
+            if errors is not None:
+                return self.make_response(*errors)
+
+            query = self._data_layer.get_object_query(qs)
+
+        obj = await self._data_layer.create_object(data, query, view_kwargs)
+
+        with self.request_context():
+            result = dump(schema, obj)
+            invalidate_caches(self.get_written_types())
+            return self.make_response(result, 201, {'Location': result['data']['links']['self']})
+
+    def get_written_types(self):
+        """Return the resource types changed by the write of the current request"""
+        types = super(AsyncResourceList, self).get_written_types()
+        if request.view_args:
+            # objects created in a nested collection are related to its parent
+            types.update(get_related_types(self.schema).values())
+        return types
+
+
+class AsyncResourceDetail(AsyncResource):
+    """Resource detail manager served with an AsyncSession
+
+    The writes with an If-Match header are left to the WSGI application.
+    """
+
+    async def get(self, view_kwargs):
+        """Get object details"""
+        with self.request_context():
+            qs = QSManager(request.args, self.schema)
+            schema = compute_schema(self.schema,
+                                    getattr(self, 'get_schema_kwargs', dict()),
+                                    qs,
+                                    qs.include)
+
+            query = self._data_layer.get_object_query(qs)
+
+        obj = await self._data_layer.get_object(query, view_kwargs)
+
+        with self.request_context():
+            return self.make_response(dump(schema, obj), 200)
+
+    async def patch(self, view_kwargs):
+        """Update an object"""
+        with self.request_context():
+            if request.if_match:
+                return None
+
+            json_data = request.get_json()
+            qs = QSManager(request.args, self.schema)
+            schema_kwargs = dict(getattr(self, 'patch_schema_kwargs', dict()))
+            schema_kwargs.update({'partial': True})
+
+            schema = compute_schema(self.schema,
+                                    schema_kwargs,
+                                    qs,
+                                    qs.include)
+
+            data, errors = load_json_data(schema, json_data)
+            if errors is not None:
+                return self.make_response(*errors)
+
+            if 'id' not in json_data['data']:
+                raise BadRequest('Missing id in "data" node',
+                                 source={'pointer': '/data/id'})
+            if json_data['data']['id'] != str(view_kwargs[self.data_layer.get('url_field', 'id')]):
+                raise BadRequest('Value of id does not match the resource identifier in url',
+                                 source={'pointer': '/data/id'})
+
+            query = self._data_layer.get_object_query(qs)
+
+        obj = await self._data_layer.get_object(query, view_kwargs)
+        obj = await self._data_layer.update_object(obj, data, query, view_kwargs)
+
+        with self.request_context():
+            result = dump(schema, obj)
+            invalidate_caches(self.get_written_types())
+            return self.make_response(result, 200)
+
+    async def delete(self, view_kwargs):
+        """Delete an object"""
+        with self.request_context():
+            if request.if_match:
+                return None
+
+            # the relationships are loaded with the object, for the foreign keys of the related objects
+            query = self._data_layer.get_object_query(QSManager(dict(), self.schema))
+
+        obj = await self._data_layer.get_object(query, view_kwargs)
+        await self._data_layer.delete_object(obj, view_kwargs)
+
+        with self.request_context():
+            invalidate_caches(self.get_written_types())
+            return self.make_response({'meta': {'message': 'Object successfully deleted'}}, 200)
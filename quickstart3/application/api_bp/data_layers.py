@@ -0,0 +1,1204 @@
+import itertools
+import json
+from collections import OrderedDict
+
+from application.api_bp.filtering import SemiJoinNode, create_filters, parameterize_filters
+from application.api_bp.pagination import CursorPage, decode_cursor, encode_cursor
+from application.api_bp.querystring import QueryStringManager as QSManager
+from flask import current_app, g, has_request_context, request
+from flask_rest_jsonapi.data_layers.alchemy import SqlalchemyDataLayer
+from flask_rest_jsonapi.data_layers.filtering.alchemy import Node
+from flask_rest_jsonapi.exceptions import BadRequest, InvalidInclude, InvalidSort, JsonApiException, ObjectNotFound,\
+    RelatedObjectNotFound
+from flask_rest_jsonapi.schema import get_model_field, get_related_schema, get_relationships, get_schema_field
+from marshmallow import class_registry
+from marshmallow.base import SchemaABC
+from marshmallow_jsonapi.fields import Relationship
+from sqlalchemy import and_, false, func, or_, orm
+from sqlalchemy.orm.exc import NoResultFound
+
+
+# Loader strategies that can be used in the 'eagerload_strategies' option of a
+# data layer, mapped to the name of the sqlalchemy loader option.
+# The 'ids' strategy batch loads only the primary key of the related objects,
+# which is all that is needed to serialize the links of a relationship.
+LOADER_STRATEGIES = {'joined': 'joinedload',
+                     'selectin': 'selectinload',
+                     'subquery': 'subqueryload',
+                     'lazy': 'lazyload',
+                     'noload': 'noload',
+                     'ids': None}
+
+# Filter compilers selectable with the 'relationship_filter_strategy' data layer option
+FILTER_NODES = {'exists': Node,
+                'in': SemiJoinNode}
+
+# Maximum number of values in the IN clauses of bulk requests (SQLite allows 999 parameters)
+BULK_CHUNK_SIZE = 500
+
+
+def get_related_schema_class(schema_cls, field):
+    """Return the schema class of a relationship field"""
+    related_schema_cls = get_related_schema(schema_cls, field)
+    if isinstance(related_schema_cls, SchemaABC):
+        return related_schema_cls.__class__
+    if isinstance(related_schema_cls, str):
+        return class_registry.get_class(related_schema_cls)
+    return related_schema_cls
+
+
+def get_schema_type(schema_cls):
+    """Return the resource type of a schema"""
+    return schema_cls.Meta.type_
+
+
+def get_shown_types(schema_cls):
+    """Return the resource types a response of a schema can show, through included objects
+
+    :param schema_cls: the schema class
+    :return set: the resource types of the schema and of the schemas reachable from it
+    """
+    types = set()
+    schemas = [schema_cls]
+    while schemas:
+        schema_cls = schemas.pop()
+        if get_schema_type(schema_cls) in types:
+            continue
+        types.add(get_schema_type(schema_cls))
+        schemas.extend(get_related_schema_class(schema_cls, field) for field in get_relationships(schema_cls))
+    return types
+
+
+def invalidate_caches(types):
+    """Renew the generation tokens of resource types after a write, in the response cache and the count cache
+
+    :param iterable types: the resource types that were written to
+    """
+    for name in ('response_cache', 'count_cache'):
+        cache = current_app.extensions.get(name)
+        if cache is not None:
+            cache.invalidate(types)
+
+
+def get_dumped_relationships(schema_cls, qs):
+    """Return the relationship fields that a schema will dump for a request
+
+    :param Schema schema_cls: the schema class
+    :param QueryStringManager qs: the querystring of the request
+    :return list: the names of the relationship fields
+    """
+    sparse_fields = qs.fields.get(schema_cls.opts.type_)
+    return [name for (name, field) in schema_cls._declared_fields.items()
+            if isinstance(field, Relationship) and not field.load_only
+            and (sparse_fields is None or name in sparse_fields)]
+
+
+def get_dumped_columns(schema_cls, model, qs):
+    """Return the columns that a schema will read from the objects of a model for a request
+
+    The columns are the primary key, the foreign keys, and the columns of the attributes dumped
+    by the schema (respecting sparse fieldsets). A field that computes its value from other
+    columns lists their model attributes in its depends_on metadata, eg.:
+
+        display_name = fields.Function(lambda obj: obj.name.upper(), depends_on=('name',))
+
+    :param Schema schema_cls: the schema class
+    :param DeclarativeMeta model: the sqlalchemy model
+    :param QueryStringManager qs: the querystring of the request
+    :return set: the keys of the column attributes, or None if a dumped field does not tell
+                 which columns it reads
+    """
+    mapper = orm.class_mapper(model)
+    column_keys = {column_attr.key for column_attr in mapper.column_attrs}
+    dumped_columns = {column.key for column in mapper.primary_key}
+    dumped_columns.update(column_attr.key for column_attr in mapper.column_attrs
+                          if any(column.foreign_keys for column in column_attr.columns))
+
+    sparse_fields = qs.fields.get(schema_cls.opts.type_)
+    for name, field in schema_cls._declared_fields.items():
+        if isinstance(field, Relationship) or field.load_only\
+                or (sparse_fields is not None and name not in sparse_fields and name != 'id'):
+            continue
+        if 'depends_on' in field.metadata:
+            dumped_columns.update(field.metadata['depends_on'])
+        elif (field.attribute or name) in column_keys:
+            dumped_columns.add(field.attribute or name)
+        else:
+            return None
+
+    return dumped_columns
+
+
+def get_exported_columns(schema_cls, model, qs):
+    """Return the fields that a resource export writes, and the columns they are read from
+
+    The fields are the id, the attributes of the schema that are columns of the model and
+    the to-one relationships, exported as their foreign key, respecting sparse fieldsets.
+    Load only fields and fields computed by the schema (eg. Function fields) are not exported.
+
+    :param Schema schema_cls: the schema class
+    :param DeclarativeMeta model: the sqlalchemy model
+    :param QueryStringManager qs: the querystring of the request
+    :return tuple: the names of the fields and the columns
+    """
+    mapper = orm.class_mapper(model)
+    sparse_fields = qs.fields.get(schema_cls.opts.type_)
+    names = []
+    columns = []
+    for name, field in schema_cls._declared_fields.items():
+        if field.load_only or (sparse_fields is not None and name not in sparse_fields and name != 'id'):
+            continue
+        prop = mapper.attrs.get(get_model_field(schema_cls, name))
+        if isinstance(prop, orm.ColumnProperty) and len(prop.columns) == 1:
+            column = getattr(model, prop.key)
+        elif isinstance(prop, orm.RelationshipProperty) and prop.direction is orm.interfaces.MANYTOONE\
+                and len(prop.local_columns) == 1:
+            column = next(iter(prop.local_columns))
+        else:
+            continue
+        if name == 'id':
+            names.insert(0, name)
+            columns.insert(0, column)
+        else:
+            names.append(name)
+            columns.append(column)
+
+    return names, columns
+
+
+def get_filtered_columns(model, schema_cls, filter_info):
+    """Return the columns that a filter compares, with the operator of each comparison
+
+    A filter on a relationship (eg. computers any) compares the foreign key columns
+    of the join for equality, and the columns of the filter on the related objects.
+
+    :param DeclarativeMeta model: the sqlalchemy model
+    :param Schema schema_cls: the schema class
+    :param list filter_info: the filters of the request
+    :return list: (table, column, operator) names
+    """
+    columns = []
+    for filter_ in filter_info:
+        if 'or' in filter_ or 'and' in filter_:
+            columns.extend(get_filtered_columns(model, schema_cls, filter_.get('or', filter_.get('and'))))
+            continue
+        if 'not' in filter_:
+            columns.extend(get_filtered_columns(model, schema_cls, [filter_['not']]))
+            continue
+
+        field = filter_['name'].split('__')[0]
+        prop = getattr(model, get_model_field(schema_cls, field)).property
+        if isinstance(prop, orm.RelationshipProperty):
+            for local_column, remote_column in prop.local_remote_pairs:
+                for column in (local_column, remote_column):
+                    if column.foreign_keys:
+                        columns.append((column.table.name, column.name, 'eq'))
+            if isinstance(filter_.get('val'), dict):
+                columns.extend(get_filtered_columns(prop.mapper.class_,
+                                                    get_related_schema_class(schema_cls, field),
+                                                    [filter_['val']]))
+        else:
+            columns.extend((column.table.name, column.name, filter_['op']) for column in prop.columns)
+
+    return columns
+
+
+# Marks the primary keys that load_object found no object for
+NO_OBJECT = object()
+
+
+def get_loaded_objects():
+    """Return the objects loaded during the current request, keyed by identity key
+
+    They are kept in the environ of the request, so they are dropped with the request even
+    when the application context outlives it (eg. in the tests). Outside of a request, they
+    are kept in the application context.
+    """
+    if has_request_context():
+        return request.environ.setdefault('application.loaded_objects', dict())
+    return g.setdefault('loaded_objects', dict())
+
+
+def get_identity_key(model, id_):
+    """Return the identity key of an object, from its primary key as given by the client
+
+    :param DeclarativeMeta model: an sqlalchemy model
+    :param id_: the primary key of the object
+    :return tuple: the identity key, or None if id_ is not a valid primary key
+    """
+    pk_column = orm.class_mapper(model).primary_key[0]
+    try:
+        return orm.util.identity_key(model, pk_column.type.python_type(id_))
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def chunked(values, size):
+    """Split a list of values into lists of at most size values"""
+    return [values[index:index + size] for index in range(0, len(values), size)]
+
+
+# Flask-REST-JSONAPI: Data layer used by all resource managers
+class DataLayer(SqlalchemyDataLayer):
+    """Sqlalchemy data layer that eager loads the relationships dumped by the schema.
+
+    Every relationship the schema serializes (respecting sparse fieldsets) and
+    every relationship requested through the include querystring parameter is
+    loaded together with the objects of the request, instead of being lazy
+    loaded one object at a time during serialization.
+
+    By default included many-to-one relationships are loaded with a joined
+    eager load and included collections with a selectin eager load.
+    Relationships that are serialized without being included only need the
+    ids of the related objects, so these are batch loaded with the 'ids'
+    strategy: one query for all objects of the request, reading only the
+    primary key column of the related table.
+
+    Set 'eagerload_strategies' in the data_layer of a resource to override
+    the strategy per relationship path, eg.:
+
+        data_layer = {...
+                      'eagerload_strategies': {'computers': 'subquery',
+                                               'computers.owner': 'lazy'}}
+
+    Setting 'eagerload_includes' to False disables eager loading altogether.
+
+    The objects of the request and the included objects are loaded with the
+    columns their schema dumps only (see get_dumped_columns), so sparse
+    fieldsets and columns that are never serialized are not read from the
+    database. Setting 'load_dumped_columns' to False loads all the columns.
+
+    Filters on relationships (any / has) compile into correlated EXISTS
+    subqueries. Set 'relationship_filter_strategy' to 'in' to compile them
+    into uncorrelated IN subqueries instead, see SemiJoinNode.
+
+    Bulk requests create, update or delete many objects in a single transaction,
+    see create_objects, update_objects and delete_objects. The writes of one-to-many
+    relationships are bulk UPDATEs of the foreign keys, see get_bulk_relationship.
+
+    The objects loaded during a request are kept until its end, so the hooks and the
+    related objects do not fetch the same row twice, see load_object.
+
+    Set 'keyset_pagination' to True in the data_layer of a resource list to let
+    clients page with cursors (page[after] / page[before]) instead of page
+    numbers. A keyset page seeks on the sort keys followed by the primary key,
+    so its cost does not grow with the depth of the page, and no count of the
+    objects is made.
+
+    Large pages are streamed by the resource lists (see STREAM_PAGE_SIZE in
+    config.py), their objects are fetched in batches by stream_page. Resource
+    exports read the rows of the exported columns with export_rows.
+    """
+
+    def get_collection(self, qs, view_kwargs):
+        """Retrieve a collection of objects through sqlalchemy
+
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :param dict view_kwargs: kwargs from the resource view
+        :return tuple: the number of objects and the list of objects; with keyset pagination the
+                       number of objects is None and the list is a CursorPage
+        """
+        if not qs.is_keyset_pagination():
+            return self.get_page(qs, view_kwargs)
+
+        if not getattr(self, 'keyset_pagination', False):
+            raise BadRequest("Keyset pagination is not available for this resource",
+                             source={'parameter': 'page'})
+
+        self.before_get_collection(qs, view_kwargs)
+
+        query = self.query(view_kwargs)
+
+        if qs.filters:
+            query = self.filter_query(query, qs.filters, self.model)
+
+        if getattr(self, 'load_dumped_columns', True):
+            query = self.load_dumped_columns(query, qs)
+
+        if getattr(self, 'eagerload_includes', True):
+            query = self.eagerload_includes(query, qs)
+
+        collection = self.paginate_keyset(query, qs)
+
+        collection = self.after_get_collection(collection, qs, view_kwargs)
+
+        return None, collection
+
+    def filter_query(self, query, filter_info, model):
+        """Filter query according to jsonapi 1.0, with cached filters, recording the filtered columns
+
+        :param Query query: sqlalchemy query to filter
+        :param filter_info: filter information
+        :type filter_info: dict or None
+        :param DeclarativeMeta model: an sqlalchemy model
+        :return Query: the filtered query
+        """
+        if filter_info:
+            strategy = getattr(self, 'relationship_filter_strategy', 'exists')
+            if strategy not in FILTER_NODES:
+                raise Exception("Unknown relationship filter strategy {}".format(strategy))
+
+            # the filters compiled from a template are cached, see parameterize_filters
+            key, template, values = parameterize_filters(filter_info)
+            key = (self.resource.__name__, model.__name__, strategy, key)
+            filter_cache = current_app.extensions['filter_cache']
+            compiled = filter_cache.get(key)
+            if compiled is None:
+                compiled = (create_filters(model, template, self.resource, FILTER_NODES[strategy]),
+                            get_filtered_columns(model, self.resource.schema, filter_info))
+                filter_cache.set(key, compiled)
+            filters, filtered_columns = compiled
+
+            query = query.filter(*filters).params(**values)
+
+            current_app.extensions['filter_usage'].record(filtered_columns)
+
+        return query
+
+    def sort_query(self, query, sort_info):
+        """Sort query according to jsonapi 1.0, then by primary key
+
+        The primary key makes the order total, so objects with equal sort keys keep the same
+        order from one page to the next, whatever plan the database uses.
+
+        :param Query query: sqlalchemy query to sort
+        :param list sort_info: sort information
+        :return Query: the sorted query
+        """
+        query = super(DataLayer, self).sort_query(query, sort_info)
+
+        sort_fields = [sort_opt['field'] for sort_opt in sort_info]
+        for column in orm.class_mapper(self.model).primary_key:
+            if column.key not in sort_fields:
+                query = query.order_by(getattr(self.model, column.key))
+
+        return query
+
+    def get_page(self, qs, view_kwargs):
+        """Retrieve a page of objects with offset pagination, counting the objects as configured
+
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :param dict view_kwargs: kwargs from the resource view
+        :return tuple: the number of objects (see count_query) and the list of objects
+        """
+        object_count, query = self.get_page_query(qs, view_kwargs)
+
+        collection = query.all()
+
+        collection = self.after_get_collection(collection, qs, view_kwargs)
+
+        return object_count, collection
+
+    def stream_page(self, qs, view_kwargs):
+        """Retrieve a page of objects like get_page, as an iterator fetching them in batches
+
+        The objects are fetched STREAM_YIELD_PER at a time, so only one batch of objects is
+        in memory. The after_get_collection hook receives the first batch of objects, which
+        tells whether the collection is empty.
+
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :param dict view_kwargs: kwargs from the resource view
+        :return tuple: the number of objects (see count_query) and an iterator over the objects
+        """
+        yield_per = current_app.config['STREAM_YIELD_PER']
+        object_count, query = self.get_page_query(qs, view_kwargs, yield_per=True)
+
+        objects = iter(query.yield_per(yield_per))
+        first_batch = list(itertools.islice(objects, yield_per))
+
+        first_batch = self.after_get_collection(first_batch, qs, view_kwargs)
+
+        return object_count, itertools.chain(first_batch, objects)
+
+    def export_rows(self, qs, view_kwargs):
+        """Retrieve the rows of a resource export, filtered and sorted like a collection
+
+        The query selects the exported columns only (see get_exported_columns), so the rows
+        are tuples instead of objects, and they are fetched EXPORT_YIELD_PER at a time with a
+        server side cursor where the database supports it.
+
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :param dict view_kwargs: kwargs from the resource view
+        :return tuple: the names of the exported fields and an iterator over the rows
+        """
+        self.before_get_collection(qs, view_kwargs)
+
+        query = self.query(view_kwargs)
+
+        if qs.filters:
+            query = self.filter_query(query, qs.filters, self.model)
+
+        if qs.sorting:
+            query = self.sort_query(query, qs.sorting)
+        else:
+            query = self.sort_query(query, [])
+
+        names, columns = get_exported_columns(self.resource.schema, self.model, qs)
+        query = query.with_entities(*columns)
+
+        return names, iter(query.yield_per(current_app.config['EXPORT_YIELD_PER']))
+
+    def get_page_query(self, qs, view_kwargs, yield_per=False):
+        """Build the query of a page of objects with offset pagination, and count the objects
+
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :param dict view_kwargs: kwargs from the resource view
+        :param bool yield_per: True if the query will be iterated with yield_per
+        :return tuple: the number of objects (see count_query) and the query
+        """
+        self.before_get_collection(qs, view_kwargs)
+
+        query = self.query(view_kwargs)
+
+        if qs.filters:
+            query = self.filter_query(query, qs.filters, self.model)
+
+        if qs.sorting:
+            query = self.sort_query(query, qs.sorting)
+
+        object_count = self.count_query(query, qs, view_kwargs)
+
+        if getattr(self, 'load_dumped_columns', True):
+            query = self.load_dumped_columns(query, qs)
+
+        if getattr(self, 'eagerload_includes', True):
+            query = self.eagerload_includes(query, qs, yield_per=yield_per)
+
+        query = self.paginate_query(query, qs.pagination)
+
+        return object_count, query
+
+    def count_query(self, query, qs, view_kwargs):
+        """Count the objects of a query according to the count mode of the request
+
+        The count mode is taken from the page[count] querystring parameter, the 'count_mode'
+        option of the data layer or the COUNT_MODE configuration, in that order.
+
+        :param Query query: sqlalchemy queryset
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :param dict view_kwargs: kwargs from the resource view
+        :return: the number of objects, None if it is not counted, or a string like "1000+" if
+                 there are more objects than COUNT_CAP
+        """
+        count_mode = self.get_count_mode(qs)
+
+        if count_mode == 'none':
+            return None
+
+        # count the primary keys, rather than a subquery of all the columns
+        query = query.order_by(None).with_entities(*orm.class_mapper(self.model).primary_key)
+
+        if count_mode == 'capped':
+            count_cap = current_app.config['COUNT_CAP']
+            object_count = self.session.query(func.count())\
+                                       .select_from(query.limit(count_cap + 1).subquery())\
+                                       .scalar()
+            return object_count if object_count <= count_cap else '{}+'.format(count_cap)
+
+        if count_mode == 'cached':
+            key = self.get_count_key(qs, view_kwargs)
+            count_cache = current_app.extensions['count_cache']
+            object_count = count_cache.get(key)
+            if object_count is None:
+                object_count = query.count()
+                count_cache.set(key, object_count)
+            return object_count
+
+        return query.count()
+
+    def get_count_mode(self, qs):
+        """Return the count mode of a request, see count_query"""
+        return qs.pagination.get('count') or getattr(self, 'count_mode', None) or current_app.config['COUNT_MODE']
+
+    def get_count_key(self, qs, view_kwargs):
+        """Return the key of the count of a request in the cache of the 'cached' count mode
+
+        The key contains the generation tokens of the types the filters can reach, so the writes
+        to these types invalidate the count, see invalidate_caches.
+        """
+        return current_app.extensions['count_cache'].make_key(get_shown_types(self.resource.schema),
+                                                              (self.resource.__name__,
+                                                               tuple(sorted(view_kwargs.items())),
+                                                               json.dumps(qs.filters, sort_keys=True)))
+
+    def paginate_keyset(self, query, qs):
+        """Retrieve a page of objects by seeking on the sort keys of the query
+
+        The sort keys are the sort fields of the request followed by the primary key, which makes
+        the order total. NULL values are ordered as the smallest values, like SQLite does.
+
+        :param Query query: sqlalchemy queryset, without sorting
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :return CursorPage: the page of objects
+        """
+        sort_keys = []
+        for sort_opt in qs.sorting:
+            if not hasattr(self.model, sort_opt['field']):
+                raise InvalidSort("{} has no attribute {}".format(self.model.__name__, sort_opt['field']))
+            sort_keys.append((getattr(self.model, sort_opt['field']), sort_opt['order'] == 'desc'))
+        for column in orm.class_mapper(self.model).primary_key:
+            if column.key not in [sort_opt['field'] for sort_opt in qs.sorting]:
+                sort_keys.append((getattr(self.model, column.key), False))
+
+        pagination = qs.pagination
+        backwards = 'before' in pagination
+        parameter = 'page[before]' if backwards else 'page[after]'
+        cursor = pagination['before'] if backwards else pagination['after']
+
+        if cursor:
+            values = decode_cursor(cursor, [column for (column, descending) in sort_keys], parameter)
+            query = query.filter(self._seek_filter(sort_keys, values, backwards))
+
+        for column, descending in sort_keys:
+            query = query.order_by(column.desc() if descending != backwards else column.asc())
+
+        page_size = int(pagination.get('size', 0)) or current_app.config['PAGE_SIZE']
+        objects = query.limit(page_size + 1).all()
+        has_more = len(objects) > page_size
+        objects = objects[:page_size]
+        if backwards:
+            objects.reverse()
+
+        def get_cursor(obj):
+            return encode_cursor([getattr(obj, column.key) for (column, descending) in sort_keys])
+
+        next_cursor = prev_cursor = None
+        if objects:
+            if has_more or backwards:
+                next_cursor = get_cursor(objects[-1])
+            if (has_more and backwards) or (cursor and not backwards):
+                prev_cursor = get_cursor(objects[0])
+
+        return CursorPage(objects, next_cursor, prev_cursor)
+
+    @staticmethod
+    def _seek_filter(sort_keys, values, backwards):
+        """Create the filter selecting the rows that come after (or before) the given sort key values"""
+        def comes_after(column, value, descending):
+            if descending:
+                # NULL values are the smallest, so they come last
+                return false() if value is None else or_(column < value, column.is_(None))
+            return column.isnot(None) if value is None else column > value
+
+        def equals(column, value):
+            return column.is_(None) if value is None else column == value
+
+        clauses = []
+        for i, (column, descending) in enumerate(sort_keys):
+            clause = [equals(previous_column, value)
+                      for ((previous_column, previous_descending), value) in zip(sort_keys[:i], values)]
+            clause.append(comes_after(column, values[i], descending != backwards))
+            clauses.append(and_(*clause))
+
+        return or_(*clauses)
+
+    def get_object(self, view_kwargs):
+        """Retrieve an object through sqlalchemy, eager loading its relationships
+
+        :params dict view_kwargs: kwargs from the resource view
+        :return DeclarativeMeta: an object from sqlalchemy
+        """
+        self.before_get_object(view_kwargs)
+
+        id_field = getattr(self, 'id_field', orm.class_mapper(self.model).primary_key[0].key)
+        try:
+            filter_field = getattr(self.model, id_field)
+        except Exception:
+            raise Exception("{} has no attribute {}".format(self.model.__name__, id_field))
+
+        url_field = getattr(self, 'url_field', 'id')
+        filter_value = view_kwargs[url_field]
+        qs = QSManager(request.args, self.resource.schema)
+
+        obj = None
+        if filter_value is not None:
+            if filter_field.property.columns[0].primary_key:
+                column_keys = None
+                if getattr(self, 'load_dumped_columns', True):
+                    column_keys = get_dumped_columns(self.resource.schema, self.model, qs)
+                obj = self.get_loaded_object(self.model, filter_value, column_keys)
+
+            if obj is None:
+                query = self.session.query(self.model).filter(filter_field == filter_value)
+
+                if getattr(self, 'load_dumped_columns', True):
+                    query = self.load_dumped_columns(query, qs)
+
+                if getattr(self, 'eagerload_includes', True):
+                    query = self.eagerload_includes(query, qs)
+
+                try:
+                    obj = query.one()
+                except NoResultFound:
+                    obj = None
+                else:
+                    self.add_loaded_object(obj)
+
+        self.after_get_object(obj, view_kwargs)
+
+        return obj
+
+    def create_objects(self, data_list, view_kwargs):
+        """Create objects through sqlalchemy, in a single transaction
+
+        :param list data_list: the data of each object, validated by marshmallow
+        :param dict view_kwargs: kwargs from the resource view
+        :return list: the objects from sqlalchemy, in the order of data_list
+        """
+        self.load_related_objects(data_list)
+
+        relationship_fields = get_relationships(self.resource.schema, model_field=True)
+        objects = []
+        try:
+            for data in data_list:
+                self.before_create_object(data, view_kwargs)
+                obj = self.model(**{key: value
+                                    for (key, value) in data.items() if key not in relationship_fields})
+                self.apply_relationships(data, obj)
+                objects.append(obj)
+        except Exception:
+            # the objects may have been cascaded into the session by their relationships
+            self.session.rollback()
+            raise
+
+        self.session.add_all(objects)
+        try:
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise JsonApiException("Object creation error: " + str(e), source={'pointer': '/data'})
+
+        self.reload_objects(objects)
+
+        for obj, data in zip(objects, data_list):
+            self.after_create_object(obj, data, view_kwargs)
+
+        return objects
+
+    def update_objects(self, ids, data_list, view_kwargs):
+        """Update objects through sqlalchemy, in a single transaction
+
+        :param list ids: the identifier of each object
+        :param list data_list: the data of each object, validated by marshmallow
+        :param dict view_kwargs: kwargs from the resource view
+        :return list: the objects from sqlalchemy, in the order of ids
+        """
+        objects = self.get_objects(ids, view_kwargs)
+        self.load_related_objects(data_list)
+
+        relationship_fields = get_relationships(self.resource.schema, model_field=True)
+        try:
+            for obj, data in zip(objects, data_list):
+                self.before_update_object(obj, data, view_kwargs)
+                for key, value in data.items():
+                    if hasattr(obj, key) and key not in relationship_fields:
+                        setattr(obj, key, value)
+                self.apply_relationships(data, obj)
+        except Exception:
+            # do not leave the objects updated before the error in the session
+            self.session.rollback()
+            raise
+
+        try:
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise JsonApiException("Update object error: " + str(e), source={'pointer': '/data'})
+
+        self.reload_objects(objects)
+
+        for obj, data in zip(objects, data_list):
+            self.after_update_object(obj, data, view_kwargs)
+
+        return objects
+
+    def delete_objects(self, ids, view_kwargs):
+        """Delete objects through sqlalchemy, in a single transaction
+
+        :param list ids: the identifier of each object
+        :param dict view_kwargs: kwargs from the resource view
+        """
+        objects = self.get_objects(ids, view_kwargs)
+
+        for obj in objects:
+            self.before_delete_object(obj, view_kwargs)
+            self.session.delete(obj)
+
+        try:
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise JsonApiException("Delete object error: " + str(e))
+
+        for obj in objects:
+            self.after_delete_object(obj, view_kwargs)
+
+    def get_objects(self, ids, view_kwargs):
+        """Retrieve the objects of a bulk request, with one query per BULK_CHUNK_SIZE objects
+
+        :param list ids: the identifier of each object, as given by the client
+        :param dict view_kwargs: kwargs from the resource view
+        :return list: the objects from sqlalchemy, in the order of ids
+        """
+        pk_column = orm.class_mapper(self.model).primary_key[0]
+        objects = dict()
+        for chunk in chunked(ids, BULK_CHUNK_SIZE):
+            for obj in self.query(view_kwargs).filter(pk_column.in_(chunk)):
+                objects[str(getattr(obj, pk_column.key))] = obj
+
+        for index, id_ in enumerate(ids):
+            if str(id_) not in objects:
+                raise ObjectNotFound('{}: {} not found'.format(self.model.__name__, id_),
+                                     source={'pointer': '/data/{}/id'.format(index)})
+
+        return [objects[str(id_)] for id_ in ids]
+
+    def load_related_objects(self, data_list):
+        """Load the objects that the relationships of a bulk request refer to, with one query per
+        related model and BULK_CHUNK_SIZE objects, so get_related_object does not query them one by one
+
+        :param list data_list: the data of each object, validated by marshmallow
+        """
+        for field in get_relationships(self.resource.schema):
+            model_field = get_model_field(self.resource.schema, field)
+            related_model = getattr(self.model, model_field).property.mapper.class_
+            if self.resource.schema._declared_fields[field].id_field\
+                    != orm.class_mapper(related_model).primary_key[0].key:
+                continue
+
+            ids = set()
+            for data in data_list:
+                value = data.get(model_field)
+                if isinstance(value, list):
+                    ids.update(value)
+                elif value is not None:
+                    ids.add(value)
+
+            pk_column = orm.class_mapper(related_model).primary_key[0]
+            try:
+                ids = sorted({pk_column.type.python_type(id_) for id_ in ids})
+            except (ValueError, TypeError, NotImplementedError):
+                continue
+            for chunk in chunked(ids, BULK_CHUNK_SIZE):
+                for related_object in self.session.query(related_model).filter(pk_column.in_(chunk)):
+                    self.add_loaded_object(related_object)
+
+    def get_related_object(self, related_model, related_id_field, obj):
+        """Get a related object, with load_object when it is identified by its primary key,
+        so the objects loaded by load_related_objects or by the hooks are not queried again
+
+        :param Model related_model: an sqlalchemy model
+        :param str related_id_field: the identifier field of the related model
+        :param DeclarativeMeta obj: the sqlalchemy object to retrieve related objects from
+        :return DeclarativeMeta: a related object
+        """
+        if related_id_field == orm.class_mapper(related_model).primary_key[0].key:
+            related_object = self.load_object(related_model, obj['id'])
+            if related_object is None:
+                raise RelatedObjectNotFound("{}.{}: {} not found".format(related_model.__name__,
+                                                                         related_id_field,
+                                                                         obj['id']))
+            return related_object
+
+        return super(DataLayer, self).get_related_object(related_model, related_id_field, obj)
+
+    def create_relationship(self, json_data, relationship_field, related_id_field, view_kwargs):
+        """Add related objects to a one-to-many relationship with bulk UPDATEs of their foreign key,
+        see get_bulk_relationship; other relationships are created by the default data layer
+
+        :param dict json_data: the request params
+        :param str relationship_field: the model attribute used for relationship
+        :param str related_id_field: the identifier field of the related model
+        :param dict view_kwargs: kwargs from the resource view
+        :return tuple: the object, and True if the relationship has changed else False
+        """
+        prop = self.get_bulk_relationship(relationship_field, related_id_field)
+        if prop is None or not isinstance(json_data['data'], list):
+            return super(DataLayer, self).create_relationship(json_data, relationship_field, related_id_field,
+                                                              view_kwargs)
+
+        self.before_create_relationship(json_data, relationship_field, related_id_field, view_kwargs)
+
+        obj = self.get_relationship_object(view_kwargs)
+        foreign_keys = self.get_related_foreign_keys(prop, related_id_field, json_data['data'])
+        value = self.get_foreign_key_value(prop, obj)
+        added = [id_ for id_, foreign_key in foreign_keys.items() if foreign_key != value]
+
+        self.update_foreign_keys(prop, added, value, "Create relationship error: ")
+
+        if bool(added):
+            self.reload_relationship_object(obj, relationship_field)
+
+        self.after_create_relationship(obj, bool(added), json_data, relationship_field, related_id_field,
+                                       view_kwargs)
+
+        return obj, bool(added)
+
+    def update_relationship(self, json_data, relationship_field, related_id_field, view_kwargs):
+        """Replace the related objects of a one-to-many relationship with bulk UPDATEs of their
+        foreign key, see get_bulk_relationship; other relationships are updated by the default data layer
+
+        :param dict json_data: the request params
+        :param str relationship_field: the model attribute used for relationship
+        :param str related_id_field: the identifier field of the related model
+        :param dict view_kwargs: kwargs from the resource view
+        :return tuple: the object, and True if the relationship has changed else False
+        """
+        prop = self.get_bulk_relationship(relationship_field, related_id_field)
+        if prop is None or not isinstance(json_data['data'], list):
+            return super(DataLayer, self).update_relationship(json_data, relationship_field, related_id_field,
+                                                              view_kwargs)
+
+        self.before_update_relationship(json_data, relationship_field, related_id_field, view_kwargs)
+
+        obj = self.get_relationship_object(view_kwargs)
+        foreign_keys = self.get_related_foreign_keys(prop, related_id_field, json_data['data'])
+        value = self.get_foreign_key_value(prop, obj)
+        added = [id_ for id_, foreign_key in foreign_keys.items() if foreign_key != value]
+        removed = sorted(set(self.get_related_ids(prop, value)) - set(foreign_keys))
+
+        self.update_foreign_keys(prop, removed, None, "Update relationship error: ", commit=False)
+        self.update_foreign_keys(prop, added, value, "Update relationship error: ")
+
+        updated = bool(added or removed)
+        if updated:
+            self.reload_relationship_object(obj, relationship_field)
+
+        self.after_update_relationship(obj, updated, json_data, relationship_field, related_id_field, view_kwargs)
+
+        return obj, updated
+
+    def delete_relationship(self, json_data, relationship_field, related_id_field, view_kwargs):
+        """Remove related objects from a one-to-many relationship with bulk UPDATEs of their
+        foreign key, see get_bulk_relationship; other relationships are deleted by the default data layer
+
+        As with the default data layer, the ids that are not related to the object are ignored.
+
+        :param dict json_data: the request params
+        :param str relationship_field: the model attribute used for relationship
+        :param str related_id_field: the identifier field of the related model
+        :param dict view_kwargs: kwargs from the resource view
+        :return tuple: the object, and True if the relationship has changed else False
+        """
+        prop = self.get_bulk_relationship(relationship_field, related_id_field)
+        if prop is None or not isinstance(json_data['data'], list):
+            return super(DataLayer, self).delete_relationship(json_data, relationship_field, related_id_field,
+                                                              view_kwargs)
+
+        self.before_delete_relationship(json_data, relationship_field, related_id_field, view_kwargs)
+
+        obj = self.get_relationship_object(view_kwargs)
+        value = self.get_foreign_key_value(prop, obj)
+        requested = {identifier['id'] for identifier in json_data['data']}
+        removed = [id_ for id_ in self.get_related_ids(prop, value) if str(id_) in requested]
+
+        self.update_foreign_keys(prop, removed, None, "Delete relationship error: ")
+
+        if bool(removed):
+            self.reload_relationship_object(obj, relationship_field)
+
+        self.after_delete_relationship(obj, bool(removed), json_data, relationship_field, related_id_field,
+                                       view_kwargs)
+
+        return obj, bool(removed)
+
+    def get_bulk_relationship(self, relationship_field, related_id_field):
+        """Return the relationship property of a relationship whose writes are bulk UPDATEs
+
+        The writes of a one-to-many relationship, identified by the primary key of the related
+        model, only change the foreign key column of the related objects. Instead of loading the
+        related objects one by one and changing the collection, their ids are checked with one IN
+        query per BULK_CHUNK_SIZE ids, and their foreign keys are set with one UPDATE per
+        BULK_CHUNK_SIZE ids. Setting 'bulk_relationship_updates' to False in the data_layer of a
+        resource disables this.
+
+        :param str relationship_field: the model attribute used for relationship
+        :param str related_id_field: the identifier field of the related model
+        :return RelationshipProperty: the relationship, or None if it is written by the default data layer
+        """
+        if not getattr(self, 'bulk_relationship_updates', True):
+            return None
+        prop = getattr(getattr(self.model, relationship_field, None), 'property', None)
+        if not isinstance(prop, orm.RelationshipProperty) or prop.direction is not orm.interfaces.ONETOMANY\
+                or prop.secondary is not None or len(prop.local_remote_pairs) != 1:
+            return None
+        if related_id_field != prop.mapper.primary_key[0].key or len(prop.mapper.primary_key) != 1:
+            return None
+        return prop
+
+    def reload_relationship_object(self, obj, relationship_field):
+        """Load the object of a relationship request expired by the commit, with the related
+        objects, which the response of the request includes
+
+        :param DeclarativeMeta obj: the object from sqlalchemy
+        :param str relationship_field: the model attribute used for relationship
+        """
+        field = get_schema_field(self.resource.schema, relationship_field)
+        args = request.args.to_dict()
+        include = QSManager(args, self.resource.schema).include
+        if field not in include:
+            args['include'] = ','.join(include + [field])
+        self.reload_objects([obj], QSManager(args, self.resource.schema))
+
+    def get_relationship_object(self, view_kwargs):
+        """Return the object of a relationship request, like the default data layer does
+
+        :param dict view_kwargs: kwargs from the resource view
+        :return DeclarativeMeta: the object
+        """
+        obj = self.get_object(view_kwargs)
+        if obj is None:
+            url_field = getattr(self, 'url_field', 'id')
+            raise ObjectNotFound('{}: {} not found'.format(self.model.__name__, view_kwargs[url_field]),
+                                 source={'parameter': url_field})
+        return obj
+
+    @staticmethod
+    def get_foreign_key_value(prop, obj):
+        """Return the value the foreign key of the objects related to obj by a relationship has"""
+        local_column, remote_column = prop.local_remote_pairs[0]
+        return getattr(obj, prop.parent.get_property_by_column(local_column).key)
+
+    def get_related_foreign_keys(self, prop, related_id_field, identifiers):
+        """Check that the objects of resource identifiers exist, and return their foreign keys
+
+        :param RelationshipProperty prop: the relationship
+        :param str related_id_field: the identifier field of the related model
+        :param list identifiers: the resource identifiers of the request
+        :return OrderedDict: the foreign key of each related object, by primary key, in the order of identifiers
+        """
+        pk_column = prop.mapper.primary_key[0]
+        local_column, remote_column = prop.local_remote_pairs[0]
+        ids = []
+        for identifier in identifiers:
+            try:
+                ids.append(pk_column.type.python_type(identifier['id']))
+            except (ValueError, TypeError):
+                ids.append(None)
+
+        foreign_keys = dict()
+        for chunk in chunked(sorted({id_ for id_ in ids if id_ is not None}), BULK_CHUNK_SIZE):
+            foreign_keys.update(self.session.query(pk_column, remote_column).filter(pk_column.in_(chunk)))
+
+        for identifier, id_ in zip(identifiers, ids):
+            if id_ not in foreign_keys:
+                raise RelatedObjectNotFound("{}.{}: {} not found".format(prop.mapper.class_.__name__,
+                                                                         related_id_field,
+                                                                         identifier['id']))
+
+        return OrderedDict((id_, foreign_keys[id_]) for id_ in ids)
+
+    def get_related_ids(self, prop, value):
+        """Return the primary keys of the objects whose foreign key of a relationship has a value"""
+        pk_column = prop.mapper.primary_key[0]
+        local_column, remote_column = prop.local_remote_pairs[0]
+        return [id_ for id_, in self.session.query(pk_column).filter(remote_column == value).order_by(pk_column)]
+
+    def update_foreign_keys(self, prop, ids, value, error_message, commit=True):
+        """Set the foreign key of a relationship of related objects, with one UPDATE per BULK_CHUNK_SIZE objects
+
+        :param RelationshipProperty prop: the relationship
+        :param list ids: the primary keys of the related objects
+        :param value: the new value of the foreign key
+        :param str error_message: the prefix of the error raised if the UPDATEs fail
+        :param bool commit: commit the transaction
+        """
+        pk_column = prop.mapper.primary_key[0]
+        local_column, remote_column = prop.local_remote_pairs[0]
+        try:
+            for chunk in chunked(ids, BULK_CHUNK_SIZE):
+                self.session.execute(remote_column.table.update()
+                                                  .where(pk_column.in_(chunk))
+                                                  .values({remote_column.name: value}))
+            if commit:
+                self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise JsonApiException(error_message + str(e))
+
+    def reload_objects(self, objects, qs=None):
+        """Load the objects expired by a commit, with the columns and relationships that will be
+        serialized, so they are not refreshed one at a time during serialization
+
+        :param list objects: objects from sqlalchemy
+        :param QueryStringManager qs: the querystring of the serialization, the one of the request by default
+        """
+        if qs is None:
+            qs = QSManager(request.args, self.resource.schema)
+        pk_column = orm.class_mapper(self.model).primary_key[0]
+        ids = [orm.attributes.instance_state(obj).identity[0] for obj in objects]
+        for chunk in chunked(ids, BULK_CHUNK_SIZE):
+            query = self.session.query(self.model).filter(pk_column.in_(chunk))
+            if getattr(self, 'load_dumped_columns', True):
+                query = self.load_dumped_columns(query, qs)
+            if getattr(self, 'eagerload_includes', True):
+                query = self.eagerload_includes(query, qs)
+            query.all()
+
+    def add_loaded_object(self, obj):
+        """Hand an object loaded by a hook (eg. before_get_object) to the data layer
+
+        The object is kept for the rest of the request, so that get_object, load_object and
+        get_related_object can use it instead of querying it again.
+
+        :param DeclarativeMeta obj: an object from sqlalchemy
+        """
+        get_loaded_objects()[orm.util.identity_key(instance=obj)] = obj
+
+    def get_loaded_object(self, model, id_, column_keys=None):
+        """Return an object loaded during the request, without emitting any sql
+
+        :param DeclarativeMeta model: an sqlalchemy model
+        :param id_: the primary key of the object
+        :param set column_keys: the column attributes that must be loaded, None for all of them
+        :return DeclarativeMeta: the object, or None if it is not loaded or has expired attributes
+        """
+        key = get_identity_key(model, id_)
+        obj = get_loaded_objects().get(key) if key is not None else None
+        if obj is None or obj is NO_OBJECT:
+            return None
+
+        if column_keys is None:
+            column_keys = {attribute.key for attribute in orm.class_mapper(model).column_attrs}
+        if set(column_keys) & orm.attributes.instance_state(obj).unloaded:
+            return None
+
+        return obj
+
+    def load_object(self, model, id_):
+        """Return an object by primary key, fetching it at most once per request
+
+        The object is looked up in the objects loaded during the request, then in the identity
+        map of the session, and only then queried. It is kept for the rest of the request, and
+        so is the absence of an object, so the hooks can call load_object to check that an
+        object exists without repeating the query.
+
+        :param DeclarativeMeta model: an sqlalchemy model
+        :param id_: the primary key of the object, as given by the client
+        :return DeclarativeMeta: the object, or None if there is no such object
+        """
+        key = get_identity_key(model, id_)
+        if key is None:
+            return None
+        loaded_objects = get_loaded_objects()
+        if loaded_objects.get(key) is NO_OBJECT:
+            return None
+
+        obj = self.get_loaded_object(model, id_)
+        if obj is None:
+            obj = self.session.query(model).get(key[1])
+            loaded_objects[key] = NO_OBJECT if obj is None else obj
+        return obj
+
+    def load_dumped_columns(self, query, qs):
+        """Load only the columns of the objects of the request that will be serialized
+
+        The columns of the sort keys are loaded too, as keyset pagination reads them.
+
+        :param Query query: sqlalchemy queryset
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :return Query: the query with the other columns deferred
+        """
+        column_keys = get_dumped_columns(self.resource.schema, self.model, qs)
+        if column_keys is None:
+            return query
+
+        column_keys.update(sort_opt['field'] for sort_opt in qs.sorting
+                           if sort_opt['field'] in orm.class_mapper(self.model).column_attrs)
+        return query.options(orm.Load(self.model).load_only(*sorted(column_keys)))
+
+    def eagerload_includes(self, query, qs, yield_per=False):
+        """Eager load the relationships that will be serialized or included
+
+        :param Query query: sqlalchemy queryset
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :param bool yield_per: True if the query will be iterated with yield_per, which only
+                               supports the selectin eager load of collections
+        :return Query: the query with relationships eagerloaded
+        """
+        strategies = self.get_eagerload_strategies(qs)
+
+        for path in sorted(strategies):
+            option = None
+            model = self.model
+            schema_cls = self.resource.schema
+            for depth in range(1, len(path) + 1):
+                attribute = getattr(model, path[depth - 1][1])
+                strategy = strategies[path[:depth]]
+                if strategy == 'ids':
+                    loader = 'selectinload' if attribute.property.uselist else 'joinedload'
+                elif yield_per and strategy in ('joined', 'subquery') and attribute.property.uselist:
+                    loader = 'selectinload'
+                else:
+                    loader = LOADER_STRATEGIES[strategy]
+                option = getattr(orm if option is None else option, loader)(attribute)
+                model = attribute.property.mapper.class_
+                schema_cls = get_related_schema_class(schema_cls, path[depth - 1][0])
+                if strategy == 'ids':
+                    option = option.load_only(*[column.key for column in orm.class_mapper(model).primary_key])
+                elif depth == len(path) and strategy not in ('lazy', 'noload')\
+                        and getattr(self, 'load_dumped_columns', True):
+                    column_keys = get_dumped_columns(schema_cls, model, qs)
+                    if column_keys is not None:
+                        option = option.load_only(*sorted(column_keys))
+            query = query.options(option)
+
+        return query
+
+    def get_eagerload_strategies(self, qs):
+        """Compute the loader strategy of each relationship path used by a request
+
+        :param QueryStringManager qs: a querystring manager to retrieve information from url
+        :return dict: loader strategy names keyed by relationship path, a path being a tuple of
+                      (schema field, model field) pairs
+        """
+        overrides = getattr(self, 'eagerload_strategies', dict())
+        strategies = {}
+
+        def add_path(path, model, parent_property=None, links_only=False):
+            key = '.'.join(field for (field, model_field) in path)
+            relationship_property = getattr(model, path[-1][1]).property
+            if key in overrides:
+                strategy = overrides[key]
+            elif not relationship_property.uselist and parent_property is not None\
+                    and parent_property in relationship_property._reverse_property:
+                # the object on the other side is the one just loaded: a lazy load of a many-to-one
+                # relationship is resolved from the identity map without emitting any sql
+                strategy = 'lazy'
+            elif links_only:
+                strategy = 'ids'
+            elif relationship_property.uselist:
+                strategy = 'selectin'
+            else:
+                strategy = 'joined'
+            if strategy not in LOADER_STRATEGIES:
+                raise Exception("Unknown loader strategy {} for {}".format(strategy, key))
+            strategies[path] = strategy
+
+        def add_dumped_relationships(schema_cls, model, prefix, parent_property=None):
+            for field in get_dumped_relationships(schema_cls, qs):
+                path = prefix + ((field, get_model_field(schema_cls, field)),)
+                if path not in strategies:
+                    add_path(path, model, parent_property, links_only=True)
+
+        add_dumped_relationships(self.resource.schema, self.model, tuple())
+
+        for include in qs.include:
+            schema_cls = self.resource.schema
+            model = self.model
+            path = tuple()
+            parent_property = None
+            for field in include.split('.'):
+                try:
+                    model_field = get_model_field(schema_cls, field)
+                    model_attribute = getattr(model, model_field)
+                except Exception as e:
+                    raise InvalidInclude(str(e))
+                path += ((field, model_field),)
+                add_path(path, model, parent_property)
+                schema_cls = get_related_schema_class(schema_cls, field)
+                model = model_attribute.property.mapper.class_
+                parent_property = model_attribute.property
+            add_dumped_relationships(schema_cls, model, path, parent_property)
+
+        return strategies
@@ -1,10 +1,19 @@
 from application import api
 from application.api_bp.resource_managers import \
-     PersonList, PersonDetail, PersonRelationship,\
-     ComputerList, ComputerDetail, ComputerRelationship
+     PersonList, PersonDetail, PersonRelationship, PersonExport,\
+     ComputerList, ComputerDetail, ComputerRelationship, ComputerExport,\
+     AsyncPersonList, AsyncPersonDetail, AsyncComputerList, AsyncComputerDetail
 from flask_rest_jsonapi import Api
 
 
+# The resource managers of the views served with async sessions in the ASGI serving mode,
+# see application/asgi.py. The other views are served by the WSGI application.
+ASYNC_RESOURCES = {'person_list': AsyncPersonList,
+                   'person_detail': AsyncPersonDetail,
+                   'computer_list': AsyncComputerList,
+                   'computer_detail': AsyncComputerDetail}
+
+
 # Flask-REST-JSONAPI: Create endpoints
 def create_api_endpoints():
     #http://flask-rest-jsonapi.readthedocs.io/en/latest/flask-rest-jsonapi.html
@@ -40,3 +49,8 @@ def create_api_endpoints():
     api.route(ComputerRelationship, 'computer_person',
               '/computers/<int:id>/relationships/owner')
 
+    api.route(PersonExport, 'person_export',
+              '/persons/export')
+
+    api.route(ComputerExport, 'computer_export',
+              '/computers/export')
@@ -0,0 +1,55 @@
+"""Formats of the resource exports, writing the rows of the exported columns"""
+
+import csv
+import io
+import itertools
+
+from application.instrumentation import timed_serialization
+from flask import current_app
+
+
+def iter_batches(rows):
+    """Split rows into lists of EXPORT_YIELD_PER rows, so the response is written in chunks"""
+    size = current_app.config['EXPORT_YIELD_PER']
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_ndjson(names, rows):
+    """Write rows as newline delimited JSON objects, keyed by the names of the fields
+
+    Values are encoded by the encoder of the application, so dates are in ISO 8601.
+    """
+    encode = current_app.extensions['jsonapi_encoder']
+    for batch in iter_batches(rows):
+        with timed_serialization():
+            chunk = b''.join(encode(dict(zip(names, row))) + b'\n' for row in batch)
+        yield chunk
+
+
+def iter_csv(names, rows):
+    """Write rows as CSV, with a header of the names of the fields
+
+    None is written as an empty value, and the other values as their str (dates in ISO 8601).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for batch in iter_batches(rows):
+        with timed_serialization():
+            writer.writerows(batch)
+            chunk = buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        yield chunk
+    if buffer.tell():
+        # the header of an empty export
+        yield buffer.getvalue().encode()
+
+
+# The formats of the format querystring parameter of the exports, with their mimetype and writer
+EXPORT_FORMATS = {'ndjson': ('application/x-ndjson', iter_ndjson),
+                  'csv': ('text/csv', iter_csv)}
@@ -0,0 +1,132 @@
+import json
+
+from flask_rest_jsonapi.data_layers.filtering.alchemy import Node
+from sqlalchemy import and_, bindparam, literal, not_, or_, select
+from sqlalchemy.orm import RelationshipProperty
+
+
+# Operators whose value is a list, bound with an expanding bind parameter
+LIST_OPERATORS = ('in', 'in_', 'notin', 'notin_')
+
+
+def create_filters(model, filter_info, resource, node_class=Node):
+    """Apply filters from filters information to base query
+
+    :param DeclarativeMeta model: the model of the node
+    :param dict filter_info: current node filter information
+    :param Resource resource: the resource
+    :param type node_class: the class of the nodes of the filter tree
+    """
+    return [node_class(model, filter_, resource, resource.schema).resolve() for filter_ in filter_info]
+
+
+def parameterize_filters(filter_info):
+    """Split filters into a template, whose values are replaced by bind parameters, and the values
+
+    Filters that only differ by their values share the same template, so the template can be
+    compiled into sqlalchemy filters once, and the values bound to them with Query.params.
+    A bind parameter has the type of its value, like a literal value compared to a column of
+    another type (eg. a date as a string). None and boolean values are part of the template,
+    as IS NULL / IS TRUE can not be bound.
+
+    :param list filter_info: the filters of the request
+    :return tuple: the key of the template, the template and the values of the bind parameters
+    """
+    values = dict()
+
+    def parameterize(node):
+        if isinstance(node, list):
+            return [parameterize(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+
+        template = dict()
+        for key, value in node.items():
+            if key in ('or', 'and', 'not') or (key == 'val' and isinstance(value, dict)):
+                template[key] = parameterize(value)
+            elif key == 'val' and is_bindable(value):
+                name = 'filter_{}'.format(len(values))
+                values[name] = value
+                template[key] = bindparam(name, type_=literal(value).type)
+            elif key == 'val' and isinstance(value, list) and node.get('op') in LIST_OPERATORS and value\
+                    and all(is_bindable(item) and type(item) is type(value[0]) for item in value):
+                name = 'filter_{}'.format(len(values))
+                values[name] = value
+                template[key] = bindparam(name, type_=literal(value[0]).type, expanding=True)
+            else:
+                template[key] = value
+        return template
+
+    template = parameterize(filter_info)
+    key = json.dumps(template, sort_keys=True,
+                     default=lambda parameter: {'bindparam': parameter.key,
+                                                'type': parameter.type.__class__.__name__,
+                                                'expanding': parameter.expanding})
+    return key, template, values
+
+
+def is_bindable(value):
+    """Return True if a filter value can be replaced by a bind parameter"""
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+class SemiJoinNode(Node):
+    """Filter node that compiles any/has filters on relationships into uncorrelated IN subqueries
+
+    The default Node compiles {"name": "computers", "op": "any", "val": {...}} into a correlated
+    EXISTS, evaluated once per row of the outer query. A SemiJoinNode compiles it into
+    person.id IN (SELECT computer.person_id FROM computer WHERE ...), which the database
+    evaluates once and can match against the index of the join column.
+
+    Relationships through a secondary table or with a composite join fall back to EXISTS.
+    """
+
+    def resolve(self):
+        """Create filter for a particular node of the filter tree"""
+        if 'or' not in self.filter_ and 'and' not in self.filter_ and 'not' not in self.filter_:
+            value = self.value
+
+            if isinstance(value, dict):
+                if self.op in ('any', 'has'):
+                    semi_join = self.semi_join(value)
+                    if semi_join is not None:
+                        return semi_join
+                value = self.__class__(self.related_model, value, self.resource, self.related_schema).resolve()
+
+            if '__' in self.filter_.get('name', ''):
+                value = {self.filter_['name'].split('__')[1]: value}
+
+            if isinstance(value, dict):
+                return getattr(self.column, self.operator)(**value)
+            else:
+                return getattr(self.column, self.operator)(value)
+
+        if 'or' in self.filter_:
+            return or_(self.__class__(self.model, filt, self.resource, self.schema).resolve()
+                       for filt in self.filter_['or'])
+        if 'and' in self.filter_:
+            return and_(self.__class__(self.model, filt, self.resource, self.schema).resolve()
+                        for filt in self.filter_['and'])
+        if 'not' in self.filter_:
+            return not_(self.__class__(self.model, self.filter_['not'], self.resource, self.schema).resolve())
+
+    def semi_join(self, value):
+        """Create the IN subquery of an any/has filter on a relationship
+
+        :param dict value: the filter on the related objects
+        :return: the filter, or None if the relationship can not be semi-joined
+        """
+        relationship_property = self.column.property
+        if not isinstance(relationship_property, RelationshipProperty)\
+                or relationship_property.secondary is not None\
+                or len(relationship_property.local_remote_pairs) != 1:
+            return None
+
+        local_column, remote_column = relationship_property.local_remote_pairs[0]
+        criterion = self.__class__(self.related_model, value, self.resource, self.related_schema).resolve()
+        subquery = select([remote_column]).where(and_(remote_column.isnot(None), criterion)).correlate(None)
+
+        # unlike EXISTS, IN is NULL on a NULL join column, which "not" would not turn into true
+        if local_column.nullable:
+            return and_(local_column.isnot(None), local_column.in_(subquery))
+        return local_column.in_(subquery)
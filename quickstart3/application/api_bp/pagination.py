@@ -0,0 +1,145 @@
+import base64
+import datetime
+import json
+from copy import copy
+from urllib.parse import urlencode
+
+from flask import current_app
+from flask_rest_jsonapi.exceptions import BadRequest
+
+
+class CursorPage(list):
+    """A page of objects retrieved with keyset pagination
+
+    :param list objects: the objects of the page
+    :param str next_cursor: cursor of the next page, None if this is the last page
+    :param str prev_cursor: cursor of the previous page, None if this is the first page
+    """
+
+    def __init__(self, objects, next_cursor=None, prev_cursor=None):
+        super(CursorPage, self).__init__(objects)
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def encode_cursor(values):
+    """Encode the sort key values of an object into an opaque cursor
+
+    :param list values: the values of the sort keys
+    :return str: the cursor
+    """
+    values = [value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+              for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor, columns, parameter):
+    """Decode a cursor into the values of the sort keys
+
+    :param str cursor: the cursor
+    :param list columns: the sort key columns, used to convert the values back to their type
+    :param str parameter: the querystring parameter holding the cursor, used for error reporting
+    :return list: the values of the sort keys
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        raise BadRequest("Invalid cursor", source={'parameter': parameter})
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise BadRequest("The cursor does not match the sort order", source={'parameter': parameter})
+
+    try:
+        return [_convert_value(value, column) for (value, column) in zip(values, columns)]
+    except (ValueError, TypeError):
+        raise BadRequest("Invalid cursor", source={'parameter': parameter})
+
+
+def _convert_value(value, column):
+    """Convert a value decoded from a cursor to the python type of its column"""
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime.datetime:
+        for format_ in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+            try:
+                return datetime.datetime.strptime(value, format_)
+            except ValueError:
+                pass
+        raise ValueError(value)
+    if python_type is datetime.date:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    return python_type(value)
+
+
+def add_cursor_pagination_links(data, page, querystring, base_url):
+    """Add the links of keyset pagination to result
+
+    :param dict data: the result of the view
+    :param CursorPage page: the page of objects
+    :param QueryStringManager querystring: the managed querystring fields and values
+    :param str base_url: the base url for pagination
+    """
+    links = {}
+    all_qs_args = copy(querystring.querystring)
+
+    links['self'] = base_url
+    if all_qs_args:
+        links['self'] += '?' + urlencode(all_qs_args)
+
+    all_qs_args.pop('page[after]', None)
+    all_qs_args.pop('page[before]', None)
+
+    all_qs_args['page[after]'] = ''
+    links['first'] = '?'.join((base_url, urlencode(all_qs_args)))
+
+    if page.prev_cursor is not None:
+        all_qs_args.pop('page[after]')
+        all_qs_args['page[before]'] = page.prev_cursor
+        links['prev'] = '?'.join((base_url, urlencode(all_qs_args)))
+        all_qs_args.pop('page[before]')
+
+    if page.next_cursor is not None:
+        all_qs_args['page[after]'] = page.next_cursor
+        links['next'] = '?'.join((base_url, urlencode(all_qs_args)))
+
+    data['links'] = links
+
+
+def add_uncounted_pagination_links(data, objects, querystring, base_url):
+    """Add pagination links to result when the total number of objects is not known
+
+    There is no last link, and a next link is added whenever the page is full.
+
+    :param dict data: the result of the view
+    :param list objects: the objects of the page
+    :param QueryStringManager querystring: the managed querystring fields and values
+    :param str base_url: the base url for pagination
+    """
+    links = {}
+    all_qs_args = copy(querystring.querystring)
+
+    links['self'] = base_url
+    if all_qs_args:
+        links['self'] += '?' + urlencode(all_qs_args)
+
+    if querystring.pagination.get('size') != '0':
+        page_size = int(querystring.pagination.get('size', 0)) or current_app.config['PAGE_SIZE']
+        current_page = int(querystring.pagination.get('number', 0)) or 1
+
+        all_qs_args.pop('page[number]', None)
+        links['first'] = base_url
+        if all_qs_args:
+            links['first'] += '?' + urlencode(all_qs_args)
+
+        if current_page > 1:
+            all_qs_args.update({'page[number]': current_page - 1})
+            links['prev'] = '?'.join((base_url, urlencode(all_qs_args)))
+        if len(objects) >= page_size:
+            all_qs_args.update({'page[number]': current_page + 1})
+            links['next'] = '?'.join((base_url, urlencode(all_qs_args)))
+
+    data['links'] = links
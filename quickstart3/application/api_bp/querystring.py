@@ -0,0 +1,70 @@
+from flask import current_app
+from flask_rest_jsonapi.exceptions import BadRequest
+from flask_rest_jsonapi.querystring import QueryStringManager as BaseQueryStringManager
+
+
+# The ways a resource list can report meta.count, see COUNT_MODE in config.py
+COUNT_MODES = ('exact', 'none', 'capped', 'cached')
+
+
+# Flask-REST-JSONAPI: Querystring parser used by all resource managers
+class QueryStringManager(BaseQueryStringManager):
+    """Querystring parser that also accepts the parameters of keyset pagination and counting
+
+    Besides page[number] and page[size], the page parameter accepts:
+      - page[after]: a cursor, return the objects that come after it.
+                     Use an empty cursor to get the first page.
+      - page[before]: a cursor, return the objects that come before it.
+      - page[count]: how to report meta.count, one of COUNT_MODES.
+    """
+
+    CURSOR_KEYS = ('after', 'before')
+
+    @property
+    def pagination(self):
+        """Return all page parameters as a dict.
+
+        :return dict: a dict of pagination information
+        """
+        result = self._get_key_values('page')
+        for key, value in result.items():
+            if key in self.CURSOR_KEYS:
+                if not isinstance(value, str):
+                    raise BadRequest("Parse error", source={'parameter': 'page[{}]'.format(key)})
+                continue
+            if key == 'count':
+                if value not in COUNT_MODES:
+                    raise BadRequest("page[count] must be one of {}".format(', '.join(COUNT_MODES)),
+                                     source={'parameter': 'page[count]'})
+                continue
+            if key not in ('number', 'size'):
+                raise BadRequest("{} is not a valid parameter of pagination".format(key), source={'parameter': 'page'})
+            try:
+                int(value)
+            except (ValueError, TypeError):
+                raise BadRequest("Parse error", source={'parameter': 'page[{}]'.format(key)})
+
+        if 'after' in result and 'before' in result:
+            raise BadRequest("page[after] and page[before] can not be combined", source={'parameter': 'page'})
+
+        if 'number' in result and self.is_keyset_pagination(result):
+            raise BadRequest("page[number] can not be combined with a cursor", source={'parameter': 'page[number]'})
+
+        if current_app.config.get('ALLOW_DISABLE_PAGINATION', True) is False and int(result.get('size', 1)) == 0:
+            raise BadRequest("You are not allowed to disable pagination", source={'parameter': 'page[size]'})
+
+        if current_app.config.get('MAX_PAGE_SIZE') is not None and 'size' in result:
+            if int(result['size']) > current_app.config['MAX_PAGE_SIZE']:
+                raise BadRequest("Maximum page size is {}".format(current_app.config['MAX_PAGE_SIZE']),
+                                 source={'parameter': 'page[size]'})
+
+        return result
+
+    def is_keyset_pagination(self, pagination=None):
+        """Return True if the client asks for keyset pagination
+
+        :param dict pagination: pagination information, parsed from the querystring if not given
+        """
+        if pagination is None:
+            pagination = self.pagination
+        return any(key in pagination for key in self.CURSOR_KEYS)
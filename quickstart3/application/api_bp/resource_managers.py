@@ -1,75 +1,185 @@
 from application import db
 from application.models import Person, Computer
 from application.api_bp.schemas import PersonSchema, ComputerSchema
-from flask_rest_jsonapi import ResourceDetail, ResourceList, ResourceRelationship
+from application.api_bp.async_data_layers import AsyncDataLayer
+from application.api_bp.async_resources import AsyncResourceList, AsyncResourceDetail
+from application.api_bp.data_layers import DataLayer
+from application.api_bp.querystring import QueryStringManager as QSManager
+from application.api_bp.resources import ResourceList, ResourceDetail, ResourceRelationship, ResourceExport
+from flask import request
 from flask_rest_jsonapi.exceptions import ObjectNotFound
+from sqlalchemy import select
 from sqlalchemy.orm.exc import NoResultFound
 
 
 # Flask-REST-JSONAPI: Create resource managers
 class PersonList(ResourceList):
     schema = PersonSchema
-    data_layer = {'session': db.session,
-                  'model': Person}
+    data_layer = {'class': DataLayer,
+                  'session': db.session,
+                  'model': Person,
+                  'keyset_pagination': True,
+                  'relationship_filter_strategy': 'in'}
 
 
 class PersonDetail(ResourceDetail):
     def before_get_object(self, view_kwargs):
         if view_kwargs.get('computer_id') is not None:
+            # Resolve the owner in a single query: the person_id column tells whether the
+            # computer exists, and the owner loaded with it is handed to the data layer,
+            # so get_object does not query it again.
+            query_ = self.session.query(Computer.person_id, Person)\
+                                 .select_from(Computer)\
+                                 .outerjoin(Computer.person)\
+                                 .filter(Computer.id == view_kwargs['computer_id'])
+            qs = QSManager(request.args, self.resource.schema)
+            query_ = self.load_dumped_columns(query_, qs)
+            query_ = self.eagerload_includes(query_, qs)
             try:
-                computer = self.session.query(Computer).filter_by(id=view_kwargs['computer_id']).one()
+                person_id, person = query_.one()
             except NoResultFound:
-                raise ObjectNotFound({'parameter': 'computer_id'},
-                                     "Computer: {} not found".format(view_kwargs['computer_id']))
+                raise ObjectNotFound("Computer: {} not found".format(view_kwargs['computer_id']),
+                                     source={'parameter': 'computer_id'})
             else:
-                if computer.person is not None:
-                    view_kwargs['id'] = computer.person.id
-                else:
-                    view_kwargs['id'] = None
+                if person is not None:
+                    self.add_loaded_object(person)
+                view_kwargs['id'] = person_id
 
     schema = PersonSchema
-    data_layer = {'session': db.session,
+    data_layer = {'class': DataLayer,
+                  'session': db.session,
                   'model': Person,
                   'methods': {'before_get_object': before_get_object}}
 
 
 class PersonRelationship(ResourceRelationship):
     schema = PersonSchema
-    data_layer = {'session': db.session,
+    data_layer = {'class': DataLayer,
+                  'session': db.session,
                   'model': Person}
 
 
+class PersonExport(ResourceExport):
+    schema = PersonSchema
+    data_layer = {'class': DataLayer,
+                  'session': db.session,
+                  'model': Person,
+                  'relationship_filter_strategy': 'in'}
+
+
 class ComputerList(ResourceList):
     def query(self, view_kwargs):
         query_ = self.session.query(Computer)
         if view_kwargs.get('id') is not None:
-            try:
-                self.session.query(Person).filter_by(id=view_kwargs['id']).one()
-            except NoResultFound:
-                raise ObjectNotFound({'parameter': 'id'}, "Person: {} not found".format(view_kwargs['id']))
-            else:
-                query_ = query_.join(Person).filter(Person.id == view_kwargs['id'])
+            query_ = query_.filter(Computer.person_id == view_kwargs['id'])
         return query_
 
+    def after_get_collection(self, collection, qs, view_kwargs):
+        # Computers found for the person prove it exists, so the person is only
+        # looked up when the result is empty.
+        if view_kwargs.get('id') is not None and not collection:
+            if self.load_object(Person, view_kwargs['id']) is None:
+                raise ObjectNotFound("Person: {} not found".format(view_kwargs['id']), source={'parameter': 'id'})
+        return collection
+
     def before_create_object(self, data, view_kwargs):
         if view_kwargs.get('id') is not None:
-            person = self.session.query(Person).filter_by(id=view_kwargs['id']).one()
+            person = self.load_object(Person, view_kwargs['id'])
+            if person is None:
+                raise ObjectNotFound("Person: {} not found".format(view_kwargs['id']), source={'parameter': 'id'})
             data['person_id'] = person.id
 
     schema = ComputerSchema
-    data_layer = {'session': db.session,
+    data_layer = {'class': DataLayer,
+                  'session': db.session,
                   'model': Computer,
+                  'keyset_pagination': True,
+                  'relationship_filter_strategy': 'in',
                   'methods': {'query': query,
+                              'after_get_collection': after_get_collection,
                               'before_create_object': before_create_object}}
 
 
 class ComputerDetail(ResourceDetail):
     schema = ComputerSchema
-    data_layer = {'session': db.session,
+    data_layer = {'class': DataLayer,
+                  'session': db.session,
                   'model': Computer}
 
 
 class ComputerRelationship(ResourceRelationship):
     schema = ComputerSchema
-    data_layer = {'session': db.session,
+    data_layer = {'class': DataLayer,
+                  'session': db.session,
+                  'model': Computer}
+
+
+class ComputerExport(ResourceExport):
+    schema = ComputerSchema
+    data_layer = {'class': DataLayer,
+                  'session': db.session,
+                  'model': Computer,
+                  'relationship_filter_strategy': 'in'}
+
+
+# Resource managers served with async sessions by the ASGI application, see application/asgi.py
+class AsyncPersonList(AsyncResourceList):
+    schema = PersonSchema
+    data_layer = {'class': AsyncDataLayer,
+                  'model': Person,
+                  'relationship_filter_strategy': 'in'}
+
+
+class AsyncPersonDetail(AsyncResourceDetail):
+    async def before_get_object(self, view_kwargs):
+        if view_kwargs.get('computer_id') is not None:
+            # the person_id column tells whether the computer exists
+            result = await self.session.execute(select(Computer.person_id)
+                                                .where(Computer.id == view_kwargs['computer_id']))
+            row = result.one_or_none()
+            if row is None:
+                raise ObjectNotFound("Computer: {} not found".format(view_kwargs['computer_id']),
+                                     source={'parameter': 'computer_id'})
+            view_kwargs['id'] = row.person_id
+
+    schema = PersonSchema
+    data_layer = {'class': AsyncDataLayer,
+                  'model': Person,
+                  'methods': {'before_get_object': before_get_object}}
+
+
+class AsyncComputerList(AsyncResourceList):
+    def query(self, view_kwargs):
+        query_ = select(Computer)
+        if view_kwargs.get('id') is not None:
+            query_ = query_.where(Computer.person_id == view_kwargs['id'])
+        return query_
+
+    async def after_get_collection(self, collection, qs, view_kwargs):
+        # Computers found for the person prove it exists, so the person is only
+        # looked up when the result is empty.
+        if view_kwargs.get('id') is not None and not collection:
+            if await self.load_object(Person, view_kwargs['id']) is None:
+                raise ObjectNotFound("Person: {} not found".format(view_kwargs['id']), source={'parameter': 'id'})
+        return collection
+
+    async def before_create_object(self, data, view_kwargs):
+        if view_kwargs.get('id') is not None:
+            person = await self.load_object(Person, view_kwargs['id'])
+            if person is None:
+                raise ObjectNotFound("Person: {} not found".format(view_kwargs['id']), source={'parameter': 'id'})
+            data['person_id'] = person.id
+
+    schema = ComputerSchema
+    data_layer = {'class': AsyncDataLayer,
+                  'model': Computer,
+                  'relationship_filter_strategy': 'in',
+                  'methods': {'query': query,
+                              'after_get_collection': after_get_collection,
+                              'before_create_object': before_create_object}}
+
+
+class AsyncComputerDetail(AsyncResourceDetail):
+    schema = ComputerSchema
+    data_layer = {'class': AsyncDataLayer,
                   'model': Computer}
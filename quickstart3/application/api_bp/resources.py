@@ -0,0 +1,542 @@
+from application.api_bp.data_layers import get_schema_type, get_shown_types, invalidate_caches
+from application.api_bp.export import EXPORT_FORMATS
+from application.api_bp.pagination import CursorPage, add_cursor_pagination_links, add_uncounted_pagination_links
+from application.api_bp.querystring import QueryStringManager as QSManager
+from application.api_bp.serializer import dump, dump_items, dump_tail
+from application.instrumentation import timed_serialization
+from flask import current_app, request, stream_with_context, url_for
+from flask_rest_jsonapi import resource
+from flask_rest_jsonapi.decorators import check_method_requirements
+from flask_rest_jsonapi.errors import jsonapi_errors
+from flask_rest_jsonapi.exceptions import BadRequest, InvalidType, JsonApiException, ObjectNotFound
+from flask_rest_jsonapi.pagination import add_pagination_links
+from flask_rest_jsonapi.schema import compute_schema, get_relationships
+from marshmallow import ValidationError
+from marshmallow_jsonapi.exceptions import IncorrectTypeError
+from werkzeug.http import generate_etag
+from werkzeug.wrappers import Response
+
+
+class PreconditionFailed(JsonApiException):
+    """Error to warn that the resource has changed since the client retrieved it"""
+
+    title = 'Precondition failed'
+    status = '412'
+
+
+def get_related_types(schema_cls):
+    """Return the resource types a schema is related to
+
+    :param schema_cls: the schema class
+    :return dict: the resource type of each relationship field
+    """
+    return {field: schema_cls._declared_fields[field].type_ for field in get_relationships(schema_cls)}
+
+
+def is_bulk(json_data):
+    """Return True if the json data of a request holds an array of resource objects"""
+    return isinstance(json_data, dict) and isinstance(json_data.get('data'), list)
+
+
+def load_json_data(schema, json_data):
+    """Validate the json data of a request with a schema, like the default resource managers do
+
+    :param Schema schema: the schema
+    :param dict json_data: the json data of the request
+    :return tuple: the data and None, or None and the error response
+    """
+    try:
+        data, errors = schema.load(json_data)
+    except IncorrectTypeError as e:
+        errors = e.messages
+        for error in errors['errors']:
+            error['status'] = '409'
+            error['title'] = "Incorrect type"
+        return None, (errors, 409)
+    except ValidationError as e:
+        errors = e.messages
+        for message in errors['errors']:
+            message['status'] = '422'
+            message['title'] = "Validation error"
+        return None, (errors, 422)
+
+    if errors:
+        for error in errors['errors']:
+            error['status'] = "422"
+            error['title'] = "Validation error"
+        return None, (errors, 422)
+
+    return data, None
+
+
+def encode_document(document):
+    """Encode a document with the encoder of the application, see JSONAPI_ENCODER in config.py"""
+    with timed_serialization():
+        return current_app.extensions['jsonapi_encoder'](document)
+
+
+# Flask-REST-JSONAPI: Base classes of the resource managers
+class EncodedResource(object):
+    """Resource manager mixin that encodes the documents with the encoder of the application
+
+    It replaces the dispatch of the default resource managers, which encode the documents
+    with the pretty printing jsonify of Flask.
+    """
+
+    def dispatch_request(self, *args, **kwargs):
+        """Logic of how to handle a request"""
+        method = getattr(self, request.method.lower(), None)
+        if method is None and request.method == 'HEAD':
+            method = getattr(self, 'get', None)
+        assert method is not None, 'Unimplemented method {}'.format(request.method)
+
+        try:
+            response = method(*args, **kwargs)
+        except JsonApiException as e:
+            return self.make_response(jsonapi_errors([e.to_dict()]), e.status)
+        except Exception as e:
+            if current_app.config['DEBUG'] is True:
+                raise e
+            exc = JsonApiException(getattr(e, 'detail', str(e)),
+                                   source=getattr(e, 'source', ''),
+                                   title=getattr(e, 'title', None),
+                                   status=getattr(e, 'status', None),
+                                   code=getattr(e, 'code', None),
+                                   id_=getattr(e, 'id', None),
+                                   links=getattr(e, 'links', None),
+                                   meta=getattr(e, 'meta', None))
+            return self.make_response(jsonapi_errors([exc.to_dict()]), exc.status)
+
+        if isinstance(response, Response):
+            return response
+
+        if not isinstance(response, tuple):
+            response = (response, 200)
+
+        data, status_code, headers = response if len(response) == 3 else response + (dict(),)
+        if isinstance(data, dict):
+            data.update({'jsonapi': {'version': '1.0'}})
+
+        return self.make_response(data, status_code, headers)
+
+    @staticmethod
+    def make_response(data, status, headers=None):
+        """Return the response of an encoded document"""
+        response = Response(encode_document(data), status=status, headers=headers)
+        response.content_type = 'application/vnd.api+json'
+        return response
+
+
+class ConditionalResource(object):
+    """Resource manager mixin that tags the responses of GET and HEAD requests with a strong ETag
+
+    The ETag is a hash of the document, and a request whose If-None-Match header
+    matches it gets an empty 304 Not Modified response. The 412 Precondition Failed
+    responses of conditional writes are empty too, werkzeug never sends their body.
+    """
+
+    def dispatch_request(self, *args, **kwargs):
+        """Add the ETag of GET and HEAD responses, and make them conditional"""
+        response = super(ConditionalResource, self).dispatch_request(*args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code == 200 and not response.is_streamed:
+            response.add_etag()
+            response.make_conditional(request.environ)
+        elif response.status_code == 412:
+            # werkzeug sends 412 responses without their body and entity headers, so the
+            # PreconditionFailed error document is dropped here already, with its Content-Type,
+            # and the after_request hooks see the response that is sent
+            response.set_data(b'')
+            del response.headers['Content-Type']
+        return response
+
+
+class CachedResource(object):
+    """Resource manager mixin that caches the responses of GET requests
+
+    The cache is the 'response_cache' extension of the application, see RESPONSE_CACHE
+    in config.py. A response is cached with the generation tokens of all the types it
+    can show through relationships and included objects. Successful writes renew the
+    tokens of the types they change, in the response cache and in the count cache.
+    """
+
+    def dispatch_request(self, *args, **kwargs):
+        """Serve GET requests from the cache, and invalidate the caches on writes"""
+        response_cache = current_app.extensions.get('response_cache')
+        if request.method == 'GET' and response_cache is not None:
+            key = response_cache.make_key(get_shown_types(self.schema), request)
+            cached = response_cache.get(key)
+            if cached is not None:
+                status, headers, data = cached
+                return Response(data, status=status, headers=headers)
+
+            response = super(CachedResource, self).dispatch_request(*args, **kwargs)
+            if response.status_code == 200 and not response.is_streamed:
+                # computed once for all the hits, instead of by ConditionalResource
+                response.add_etag()
+                response_cache.set(key, response)
+            return response
+
+        response = super(CachedResource, self).dispatch_request(*args, **kwargs)
+        if request.method in ('POST', 'PATCH', 'DELETE') and response.status_code < 400:
+            invalidate_caches(self.get_written_types())
+        return response
+
+    def get_written_types(self):
+        """Return the resource types changed by the write of the current request"""
+        related_types = get_related_types(self.schema)
+        types = {get_schema_type(self.schema)}
+        if request.method == 'DELETE':
+            # the foreign keys of the related objects may be updated
+            types.update(related_types.values())
+        else:
+            json_data = request.get_json(silent=True) or dict()
+            items = json_data.get('data') if is_bulk(json_data) else [json_data.get('data')]
+            for item in items:
+                relationships = (item or dict()).get('relationships') or dict()
+                types.update(related_types[field] for field in relationships if field in related_types)
+        return types
+
+
+class ResourceList(ConditionalResource, CachedResource, EncodedResource, resource.ResourceList):
+    """Resource list manager that supports keyset pagination, uncounted collections and bulk requests
+
+    A bulk request has an array of resource objects as data:
+      - POST creates the objects,
+      - PATCH updates the objects, identified by their id,
+      - DELETE deletes the objects, given as resource identifiers.
+    All the objects are validated before any is written, and written in a single transaction.
+
+    Large pages are streamed, see STREAM_PAGE_SIZE in config.py.
+    """
+
+    @check_method_requirements
+    def get(self, *args, **kwargs):
+        """Retrieve a collection of objects"""
+        self.before_get(args, kwargs)
+
+        qs = QSManager(request.args, self.schema)
+        if self.is_streamed(qs):
+            return self.get_streamed(qs, kwargs)
+
+        objects_count, objects = self._data_layer.get_collection(qs, kwargs)
+
+        schema_kwargs = getattr(self, 'get_schema_kwargs', dict())
+        schema_kwargs.update({'many': True})
+
+        schema = compute_schema(self.schema,
+                                schema_kwargs,
+                                qs,
+                                qs.include)
+
+        result = dump(schema, objects)
+
+        self.add_collection_links(result, objects_count, objects, qs)
+
+        self.after_get(result)
+
+        return result
+
+    def is_streamed(self, qs):
+        """Return True if the page of the request is streamed
+
+        Pages of STREAM_PAGE_SIZE objects or more and unpaginated requests are streamed,
+        unless they are paged with cursors.
+        """
+        stream_page_size = current_app.config['STREAM_PAGE_SIZE']
+        if stream_page_size is None or not hasattr(self._data_layer, 'stream_page')\
+                or qs.is_keyset_pagination():
+            return False
+        page_size = int(qs.pagination.get('size', current_app.config['PAGE_SIZE']))
+        return page_size == 0 or page_size >= stream_page_size
+
+    def get_streamed(self, qs, kwargs):
+        """Retrieve a collection of objects as a streamed response
+
+        The resource objects are dumped and encoded as they are fetched, then the links, the
+        included objects and meta are encoded after the data. The after_get hook receives the
+        document without its data. An error raised while streaming interrupts the response.
+        """
+        objects_count, objects = self._data_layer.stream_page(qs, kwargs)
+
+        schema_kwargs = dict(getattr(self, 'get_schema_kwargs', dict()))
+        schema_kwargs.update({'many': True})
+
+        schema = compute_schema(self.schema,
+                                schema_kwargs,
+                                qs,
+                                qs.include)
+
+        def generate():
+            yield b'{"data":['
+            streamed = 0
+            for item in dump_items(schema, objects):
+                yield encode_document(item) if streamed == 0 else b',' + encode_document(item)
+                streamed += 1
+            yield b']'
+
+            result = dump_tail(schema)
+            # the uncounted pagination links only need the number of objects
+            self.add_collection_links(result, objects_count, range(streamed), qs)
+            self.after_get(result)
+            result.update({'jsonapi': {'version': '1.0'}})
+            yield b',' + encode_document(result)[1:]
+
+        return Response(stream_with_context(generate()), status=200, content_type='application/vnd.api+json')
+
+    def add_collection_links(self, result, objects_count, objects, qs):
+        """Add the pagination links, and the number of objects if it is known, to a document"""
+        view_kwargs = request.view_args if getattr(self, 'view_kwargs', None) is True else dict()
+        if isinstance(objects, CursorPage):
+            add_cursor_pagination_links(result,
+                                        objects,
+                                        qs,
+                                        url_for(self.view, **view_kwargs))
+        else:
+            if isinstance(objects_count, int):
+                add_pagination_links(result,
+                                     objects_count,
+                                     qs,
+                                     url_for(self.view, **view_kwargs))
+            else:
+                add_uncounted_pagination_links(result,
+                                               objects,
+                                               qs,
+                                               url_for(self.view, **view_kwargs))
+
+            if objects_count is not None:
+                result.update({'meta': {'count': objects_count}})
+
+    @check_method_requirements
+    def post(self, *args, **kwargs):
+        """Create an object, or the objects of a bulk request"""
+        json_data = request.get_json()
+        if not is_bulk(json_data):
+            return super(ResourceList, self).post(*args, **kwargs)
+
+        qs = QSManager(request.args, self.schema)
+        schema_kwargs = dict(getattr(self, 'post_schema_kwargs', dict()))
+        schema_kwargs.update({'many': True})
+
+        schema = compute_schema(self.schema,
+                                schema_kwargs,
+                                qs,
+                                qs.include)
+
+        self.check_bulk_types(json_data)
+
+        data, errors = load_json_data(schema, json_data)
+        if errors is not None:
+            return errors
+
+        self.before_post(args, kwargs, data=data)
+
+        objects = self._data_layer.create_objects(data, kwargs)
+
+        result = dump(schema, objects)
+
+        self.after_post(result)
+
+        return result, 201
+
+    @check_method_requirements
+    def patch(self, *args, **kwargs):
+        """Update the objects of a bulk request"""
+        json_data = request.get_json()
+        if not is_bulk(json_data):
+            raise BadRequest('You must provide an array of resource objects in "data"',
+                             source={'pointer': '/data'})
+
+        qs = QSManager(request.args, self.schema)
+        schema_kwargs = dict(getattr(self, 'patch_schema_kwargs', dict()))
+        schema_kwargs.update({'many': True, 'partial': True})
+
+        schema = compute_schema(self.schema,
+                                schema_kwargs,
+                                qs,
+                                qs.include)
+
+        self.check_bulk_types(json_data)
+
+        data, errors = load_json_data(schema, json_data)
+        if errors is not None:
+            return errors
+
+        ids = self.get_bulk_ids(json_data)
+
+        self.before_patch(args, kwargs, data=data)
+
+        objects = self._data_layer.update_objects(ids, data, kwargs)
+
+        result = dump(schema, objects)
+
+        self.after_patch(result)
+
+        return result
+
+    @check_method_requirements
+    def delete(self, *args, **kwargs):
+        """Delete the objects of a bulk request"""
+        json_data = request.get_json()
+        if not is_bulk(json_data):
+            raise BadRequest('You must provide an array of resource identifiers in "data"',
+                             source={'pointer': '/data'})
+
+        self.check_bulk_types(json_data)
+
+        ids = self.get_bulk_ids(json_data)
+
+        self.before_delete(args, kwargs)
+
+        self._data_layer.delete_objects(ids, kwargs)
+
+        result = {'meta': {'message': 'Objects successfully deleted'}}
+
+        self.after_delete(result)
+
+        return result
+
+    def check_bulk_types(self, json_data):
+        """Raise InvalidType, pointing at the item, if a resource object of a bulk request
+        is not of the type of the resource
+
+        Checked before the items are loaded, because the schema reports a wrong type
+        without the index of the item.
+        """
+        for index, item in enumerate(json_data['data']):
+            if not isinstance(item, dict) or item.get('type') != get_schema_type(self.schema):
+                raise InvalidType('Invalid type. Expected "{}"'.format(get_schema_type(self.schema)),
+                                  source={'pointer': '/data/{}/type'.format(index)})
+
+    @staticmethod
+    def get_bulk_ids(json_data):
+        """Return the ids of the resource objects of a bulk request"""
+        ids = []
+        for index, item in enumerate(json_data['data']):
+            if 'id' not in item:
+                raise BadRequest('Missing id in "data" node',
+                                 source={'pointer': '/data/{}/id'.format(index)})
+            ids.append(item['id'])
+        return ids
+
+    def before_patch(self, args, kwargs, data=None):
+        """Hook to make custom work before patch method"""
+        pass
+
+    def after_patch(self, result):
+        """Hook to make custom work after patch method"""
+        pass
+
+    def before_delete(self, args, kwargs):
+        """Hook to make custom work before delete method"""
+        pass
+
+    def after_delete(self, result):
+        """Hook to make custom work after delete method"""
+        pass
+
+    def get_written_types(self):
+        """Return the resource types changed by the write of the current request"""
+        types = super(ResourceList, self).get_written_types()
+        if request.view_args:
+            # objects created in a nested collection are related to its parent
+            types.update(get_related_types(self.schema).values())
+        return types
+
+
+class ResourceDetail(ConditionalResource, CachedResource, EncodedResource, resource.ResourceDetail):
+    """Resource detail manager whose GET responses are cached, and whose writes can be conditional
+
+    A PATCH or DELETE request with an If-Match header only succeeds if the header matches
+    the ETag of the object, as returned by a GET request without querystring parameters.
+    Otherwise it fails with an empty 412 response, see ConditionalResource, or with a 404
+    response if there is no such object.
+    """
+
+    @check_method_requirements
+    def get(self, *args, **kwargs):
+        """Get object details"""
+        return self.get_document(args, kwargs, QSManager(request.args, self.schema))
+
+    def get_document(self, args, kwargs, qs):
+        """Return the document of the object, as returned by a GET request
+
+        :param QueryStringManager qs: the querystring parameters of the GET request
+        """
+        self.before_get(args, kwargs)
+
+        obj = self._data_layer.get_object(kwargs)
+
+        schema = compute_schema(self.schema,
+                                getattr(self, 'get_schema_kwargs', dict()),
+                                qs,
+                                qs.include)
+
+        result = dump(schema, obj)
+
+        self.after_get(result)
+
+        return result
+
+    def patch(self, *args, **kwargs):
+        """Update an object"""
+        self.check_if_match(args, kwargs)
+        return super(ResourceDetail, self).patch(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """Delete an object"""
+        self.check_if_match(args, kwargs)
+        return super(ResourceDetail, self).delete(*args, **kwargs)
+
+    def check_if_match(self, args, kwargs):
+        """Raise ObjectNotFound if there is no object, and PreconditionFailed if the object
+        does not match the If-Match header"""
+        if not request.if_match or request.if_match.star_tag:
+            return
+
+        # the ETag of the GET request without querystring parameters, whatever the
+        # parameters of the write
+        result = self.get_document(args, kwargs, QSManager(dict(), self.schema))
+        if result.get('data') is None:
+            url_field = getattr(self._data_layer, 'url_field', 'id')
+            raise ObjectNotFound('{}: {} not found'.format(self._data_layer.model.__name__, kwargs.get(url_field)),
+                                 source={'parameter': url_field})
+        result.update({'jsonapi': {'version': '1.0'}})
+        if not request.if_match.contains(generate_etag(encode_document(result))):
+            raise PreconditionFailed("The object has been modified", source={'header': 'If-Match'})
+
+
+class ResourceRelationship(ConditionalResource, CachedResource, EncodedResource,
+                           resource.ResourceRelationship):
+    """Resource relationship manager whose GET responses are cached"""
+
+    def get_written_types(self):
+        """Return the resource types changed by the write of the current request"""
+        relationship_field, model_relationship_field, related_type_, related_id_field = \
+            self._get_relationship_data()
+        return {get_schema_type(self.schema), related_type_}
+
+
+class ResourceExport(EncodedResource, resource.Resource, metaclass=resource.ResourceMeta):
+    """Resource manager exporting all the objects of a resource, as NDJSON or CSV rows
+
+    The objects are filtered and sorted with the filter and sort querystring parameters of
+    the resource list, and the fields[type] parameter selects the exported fields. The rows
+    are read from the columns of the fields (see get_exported_columns) and written as they
+    are fetched, without building objects or dumping them with the schema.
+
+    The format querystring parameter is one of EXPORT_FORMATS, 'ndjson' by default.
+    """
+
+    @check_method_requirements
+    def get(self, *args, **kwargs):
+        """Export the objects"""
+        format_ = request.args.get('format', 'ndjson')
+        if format_ not in EXPORT_FORMATS:
+            raise BadRequest("format must be one of {}".format(', '.join(sorted(EXPORT_FORMATS))),
+                             source={'parameter': 'format'})
+        mimetype, write_rows = EXPORT_FORMATS[format_]
+
+        qs = QSManager(request.args, self.schema)
+        names, rows = self._data_layer.export_rows(qs, kwargs)
+
+        return Response(stream_with_context(write_rows(names, rows)), status=200, mimetype=mimetype)
@@ -14,7 +14,8 @@ class PersonSchema(Schema):
     name = fields.Str(requried=True, load_only=True)
     email = fields.Email(load_only=True)
     birth_date = fields.Date()
-    display_name = fields.Function(lambda obj: "{} <{}>".format(obj.name.upper(), obj.email))
+    display_name = fields.Function(lambda obj: "{} <{}>".format(obj.name.upper(), obj.email),
+                                   depends_on=('name', 'email'))
     computers = Relationship(self_view='person_computers',
                              self_view_kwargs={'id': '<id>'},
                              related_view='computer_list',
@@ -0,0 +1,379 @@
+"""Precompiled dump of the schemas, producing the same documents as Schema.dump
+
+marshmallow-jsonapi dumps an object by looking up the accessor and the serialization of every
+field, and by building every link with url_for. A CompiledSchema resolves them once per schema
+class: the fields of common types are serialized by plain functions, and the links are built
+once with url_for and then formatted by substituting the view arguments into the URL.
+"""
+
+import itertools
+import re
+
+from application.instrumentation import timed_serialization
+from flask import current_app, request, url_for
+from marshmallow import Schema as BaseSchema
+from marshmallow import fields
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from marshmallow.utils import get_func_args, missing
+from marshmallow_jsonapi.fields import BaseRelationship, Meta
+from marshmallow_jsonapi.flask import Relationship, Schema
+from marshmallow_jsonapi.utils import tpl
+from werkzeug.routing import BuildError
+
+
+# View arguments used to build the URL templates, that can not be confused with the rest of the URL
+SENTINEL = 7318530000000
+
+# The strings that the int and string converters of werkzeug both convert to themselves
+PATH_INTEGER = re.compile(r'(0|[1-9][0-9]*)$')
+
+# The methods of the jsonapi schema reproduced by the compiled dump
+FORMAT_METHODS = ('format_json_api_response', 'format_items', 'format_item', 'wrap_response',
+                  'get_top_level_links', 'get_resource_links', 'render_included_data', 'generate_url',
+                  'inflect', 'get_attribute')
+
+
+def dump(schema, obj):
+    """Dump an object, or the objects of a many schema, like schema.dump(obj).data
+
+    :param Schema schema: the schema, as computed by compute_schema
+    :param obj: the object or the list of objects
+    :return dict: the document
+    """
+    with timed_serialization():
+        compiled = get_compiled_schema(type(schema))
+        if compiled is None or obj is None:
+            return schema.dump(obj).data
+        return compiled.dump(schema, obj)
+
+
+def dump_items(schema, objects):
+    """Dump the objects of a many schema one at a time, like the items of schema.dump(objects).data['data']
+
+    The objects they include are added to schema.included_data, see dump_tail.
+
+    :param Schema schema: the schema, as computed by compute_schema
+    :param iterable objects: the objects
+    :return generator: the resource objects
+    """
+    compiled = get_compiled_schema(type(schema))
+    if compiled is None:
+        for obj in objects:
+            with timed_serialization():
+                item = schema.dump(obj, many=False).data['data']
+            yield item
+        return
+
+    schema._update_fields(many=schema.many)
+    plans = dict()
+    for obj in objects:
+        with timed_serialization():
+            item = compiled.format_item(schema, obj, plans)
+        yield item
+
+
+def dump_tail(schema):
+    """Return the document of the objects dumped by dump_items, without its data
+
+    :param Schema schema: the schema given to dump_items
+    :return dict: the top level links and the included objects of the document
+    """
+    document = schema.render_included_data(schema.wrap_response([], True))
+    del document['data']
+    return document
+
+
+def get_compiled_schema(schema_cls):
+    """Return the compiled schema of a schema class, None if its dump can not be compiled"""
+    compiled_schemas = current_app.extensions['compiled_schemas']
+    if schema_cls not in compiled_schemas:
+        compiled_schemas[schema_cls] = CompiledSchema(schema_cls) if is_compilable(schema_cls) else None
+    return compiled_schemas[schema_cls]
+
+
+def is_compilable(schema_cls):
+    """Return True if the dump of a schema class is the default dump of marshmallow-jsonapi"""
+    if not issubclass(schema_cls, Schema) or schema_cls.opts.ordered:
+        return False
+    if any(getattr(schema_cls, method) is not getattr(Schema, method) for method in FORMAT_METHODS
+           if method != 'get_attribute') or schema_cls.get_attribute is not BaseSchema.get_attribute:
+        return False
+    processors = {tag: names for (tag, names) in schema_cls.__processors__.items()
+                  if tag[0] in (PRE_DUMP, POST_DUMP) and names}
+    return processors == {(POST_DUMP, True): ['format_json_api_response']}
+
+
+def stringify(value):
+    """Convert the id of a resource linkage to a string, like marshmallow-jsonapi"""
+    return str(value) if value is not None else value
+
+
+class URLTemplate(object):
+    """URL of a view, built once with url_for and formatted by substituting the view arguments
+
+    :param str endpoint: the view name
+    :param dict view_kwargs: the view arguments, where '<attribute>' is an attribute of the object
+    """
+
+    def __init__(self, endpoint, view_kwargs):
+        self.endpoint = endpoint
+        self.view_kwargs = view_kwargs
+        self.attributes = []
+        self.parts = None
+
+        values = dict()
+        sentinels = dict()
+        for name, value in view_kwargs.items():
+            attribute = tpl(str(value))
+            if attribute:
+                sentinel = str(SENTINEL + len(sentinels))
+                sentinels[sentinel] = attribute
+                values[name] = int(sentinel)
+            else:
+                values[name] = value
+
+        try:
+            url = url_for(endpoint, **values)
+        except (BuildError, ValueError, TypeError):
+            return
+
+        parts = re.split('({})'.format('|'.join(sentinels)), url) if sentinels else [url]
+        if sorted(parts[1::2]) != sorted(sentinels):
+            return
+        self.attributes = [sentinels[sentinel] for sentinel in parts[1::2]]
+        self.parts = parts[::2]
+
+    def format(self, get_value):
+        """Return the URL for the attributes returned by get_value, None if they can not be substituted
+
+        An attribute can be substituted if it converts to the same path segment with the int and
+        the string converters of werkzeug, that is an integer or a string of its digits.
+        """
+        if self.parts is None:
+            return None
+
+        segments = []
+        for attribute in self.attributes:
+            value = get_value(attribute)
+            if type(value) is int and value >= 0:
+                segments.append(str(value))
+            elif type(value) is str and PATH_INTEGER.match(value):
+                segments.append(value)
+            else:
+                return None
+        return ''.join(itertools.chain.from_iterable(itertools.zip_longest(self.parts, segments,
+                                                                            fillvalue='')))
+
+
+class CompiledSchema(object):
+    """The compiled dump of a schema class
+
+    The fields are compiled once, and the URL templates are built on first use for the script
+    root of the request. The dump of a schema instance follows its fields, which depend on the
+    sparse fieldsets of the request, and the include_data of its relationships.
+
+    :param type schema_cls: the schema class
+    """
+
+    def __init__(self, schema_cls):
+        self.schema_cls = schema_cls
+        self.serializers = {name: self.compile_field(name, field)
+                            for (name, field) in schema_cls._declared_fields.items()}
+        self.url_templates = dict()
+
+    @staticmethod
+    def compile_field(name, field):
+        """Return a function serializing a field of an object like Field.serialize, or None
+
+        The function returns missing when the field has to be serialized by Field.serialize.
+        """
+        attribute = field.attribute or name
+        if '.' in attribute:
+            return None
+
+        field_type = type(field)
+        if field_type is fields.Integer:
+            as_string = field.as_string
+
+            def serialize(obj):
+                value = getattr(obj, attribute, missing)
+                if value is None:
+                    return None
+                if type(value) is not int:
+                    return missing
+                return str(value) if as_string else value
+        elif field_type in (fields.String, fields.Email):
+            def serialize(obj):
+                value = getattr(obj, attribute, missing)
+                if value is None or type(value) is str:
+                    return value
+                return missing
+        elif field_type is fields.Date:
+            def serialize(obj):
+                value = getattr(obj, attribute, missing)
+                if value is None:
+                    return None
+                try:
+                    return value.isoformat()
+                except AttributeError:
+                    return missing
+        elif field_type is fields.Function and field.serialize_func is not None\
+                and len(get_func_args(field.serialize_func)) == 1:
+            serialize = field.serialize_func
+        else:
+            return None
+        return serialize
+
+    def get_url_template(self, endpoint, view_kwargs):
+        """Return the URL template of a view, for the script root of the request"""
+        key = (endpoint, tuple(sorted(view_kwargs.items())), request.script_root)
+        if key not in self.url_templates:
+            self.url_templates[key] = URLTemplate(endpoint, view_kwargs)
+        return self.url_templates[key]
+
+    def get_url(self, endpoint, view_kwargs, get_value, build_url):
+        """Format the URL of a view from its template, or build it if the template does not apply"""
+        url = self.get_url_template(endpoint, view_kwargs).format(get_value)
+        return url if url is not None else build_url()
+
+    def dump(self, schema, obj):
+        """Dump an object, or the objects of a many schema, like schema.dump(obj).data"""
+        many = schema.many
+        if many:
+            obj = list(obj)
+        # the fields of the request, in the order of Schema.dump
+        schema._update_fields(obj, many=many)
+        plans = dict()
+
+        if many:
+            data = [self.format_item(schema, item, plans) for item in obj]
+        else:
+            data = self.format_item(schema, obj, plans)
+
+        result = {'data': data}
+        if many or data:
+            self_link = None
+            if many:
+                if schema.opts.self_url_many:
+                    self_link = url_for(schema.opts.self_url_many)
+            elif schema.opts.self_url:
+                self_link = data.get('links', {}).get('self', None)
+            if self_link:
+                result['links'] = {'self': self_link}
+
+        if schema.included_data:
+            result['included'] = list(schema.included_data.values())
+        return result
+
+    def get_plan(self, schema, plans):
+        """Return the fields of a schema instance to dump, as (name, key, kind, field, serialize) tuples
+
+        :param dict plans: the plans of the schemas of the current dump, by schema id
+        """
+        if id(schema) in plans:
+            return plans[id(schema)]
+
+        plan = []
+        for name, field in schema.fields.items():
+            if getattr(field, 'load_only', False):
+                continue
+            if name == 'id':
+                kind = 'id'
+            elif isinstance(field, Meta):
+                kind = 'meta'
+            elif isinstance(field, BaseRelationship):
+                kind = 'relationship'
+            else:
+                kind = 'attribute'
+            plan.append((name, field.dump_to or name, kind, field, self.serializers.get(name)))
+        plans[id(schema)] = plan
+        return plan
+
+    def format_item(self, schema, obj, plans):
+        """Dump an object into a resource object, like Schema.format_item"""
+        # the serialized fields, the item formatted by Schema.format_item
+        item = dict()
+        ret = {'type': schema.opts.type_}
+        for name, key, kind, field, serialize in self.get_plan(schema, plans):
+            if kind == 'relationship' and type(field) is Relationship:
+                value = self.serialize_relationship(schema, field, name, obj, plans)
+            else:
+                value = serialize(obj) if serialize is not None else missing
+                if value is missing:
+                    value = field.serialize(name, obj, accessor=schema.get_attribute)
+            if value is missing:
+                continue
+            item[key] = value
+
+            if kind == 'id':
+                ret['id'] = value
+            elif kind == 'meta':
+                ret.setdefault('meta', dict()).update(value)
+            elif kind == 'relationship':
+                if value:
+                    ret.setdefault('relationships', dict())[schema.inflect(key)] = value
+            else:
+                ret.setdefault('attributes', dict())[schema.inflect(key)] = value
+
+        if not item:
+            return None
+
+        if schema.opts.self_url:
+            view_kwargs = schema.opts.self_url_kwargs or {}
+            ret['links'] = {'self': self.get_url(schema.opts.self_url, view_kwargs, item.get,
+                                                 lambda: Schema.get_resource_links(schema, item)['self'])}
+        return ret
+
+    def serialize_relationship(self, schema, field, name, obj, plans):
+        """Dump a relationship of an object, like Relationship.serialize"""
+        value = getattr(obj, field.attribute or name, missing)
+        if value is missing:
+            return field.serialize(name, obj, accessor=schema.get_attribute)
+
+        def get_value(attribute):
+            return getattr(obj, attribute) if '.' not in attribute else missing
+
+        ret = dict()
+        self_url = related_url = None
+        if field.self_view:
+            self_url = self.get_url(field.self_view, field.self_view_kwargs, get_value,
+                                    lambda: field.get_self_url(obj))
+        if field.related_view:
+            related_url = self.get_url(field.related_view, field.related_view_kwargs, get_value,
+                                       lambda: field.get_related_url(obj))
+        if self_url or related_url:
+            ret['links'] = dict()
+            if self_url:
+                ret['links']['self'] = self_url
+            if related_url:
+                ret['links']['related'] = related_url
+
+        if field.include_resource_linkage or field.include_data:
+            if value is None:
+                ret['data'] = [] if field.many else None
+            elif '.' in field.id_field or get_compiled_schema(type(field.schema)) is None:
+                ret['data'] = field.get_resource_linkage(value)
+            elif field.many:
+                ret['data'] = [{'type': field.type_, 'id': stringify(getattr(each, field.id_field, each))}
+                               for each in value]
+            else:
+                ret['data'] = {'type': field.type_, 'id': stringify(getattr(value, field.id_field, value))}
+
+        if field.include_data and value is not None:
+            for item in (value if field.many else [value]):
+                self.include(schema, field.schema, item, plans)
+        return ret
+
+    @staticmethod
+    def include(schema, related_schema, obj, plans):
+        """Add a related object, and the objects it includes, to the included objects of a schema"""
+        compiled = get_compiled_schema(type(related_schema))
+        if compiled is None:
+            item = related_schema.dump(obj).data['data']
+        else:
+            if id(related_schema) not in plans:
+                related_schema._update_fields(obj, many=False)
+            item = compiled.format_item(related_schema, obj, plans)
+        schema.included_data[(item['type'], item['id'])] = item
+        for key, value in related_schema.included_data.items():
+            schema.included_data[key] = value
@@ -0,0 +1,246 @@
+"""ASGI serving mode: the routes of the application on an asyncio server, with async database sessions
+
+The requests are read and the responses written by the event loop, so a server such as
+uvicorn keeps any number of connections open.
+
+    $ uvicorn --factory application.asgi:create_asgi_app
+
+The views of ASYNC_RESOURCES (the lists and details of the persons and computers) are served
+by coroutines: their resource managers read the database through an AsyncSession of
+SQLAlchemy, so a request waiting for the database does not hold a thread, and the number
+of requests in progress is only bounded by the connections of the async engine. They use
+the schemas, the filters, the count modes and the eager loads of the WSGI resource managers,
+see api_bp/async_resources.py and api_bp/async_data_layers.py.
+
+The other requests are handled by the WSGI application, at most ASGI_MAX_WORKERS at a time,
+in a pool of threads: the relationships, the exports, the bulk requests, the keyset pages,
+the streamed pages, the conditional writes, /stats and /metrics. The requests served by
+coroutines are counted by the metrics, but not by the instrumentation of /stats, and they
+neither read from the replicas nor use the response cache, whose entries they invalidate.
+
+The async engine connects to ASGI_DATABASE_URI, or to SQLALCHEMY_DATABASE_URI with the
+aiosqlite driver. The factory does not create the tables, quickstart3.py does.
+"""
+
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from application import create_app
+from application.api_bp.endpoints import ASYNC_RESOURCES
+from application.database import configure_engine
+from config import Config
+from sqlalchemy import orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine as create_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.exceptions import HTTPException
+
+# The drivers of SQLAlchemy whose databases are opened with aiosqlite by default
+SQLITE_DRIVERS = ('sqlite', 'sqlite+pysqlite')
+
+
+def create_asgi_app(config_class=Config):
+    """Factory function to create the application, served with ASGI"""
+    return AsgiApplication(create_app(config_class))
+
+
+def create_async_engine(app):
+    """Create the async engine of the database of an application
+
+    The engine is pooled like the engine of the database (see SQLALCHEMY_POOL_SIZE in
+    config.py), and its SQLite connections get the pragmas of SQLITE_PRAGMAS.
+
+    :param Flask app: the application
+    :return AsyncEngine: the engine
+    """
+    url = make_url(app.config['ASGI_DATABASE_URI'] or app.config['SQLALCHEMY_DATABASE_URI'])
+    if app.config['ASGI_DATABASE_URI'] is None:
+        if url.drivername not in SQLITE_DRIVERS:
+            raise ValueError('Set ASGI_DATABASE_URI to the database with an async driver')
+        if url.database in (None, '', ':memory:'):
+            raise ValueError('An in-memory SQLite database can not be shared with an async engine')
+        url = url.set(drivername='sqlite+aiosqlite')
+
+    options = dict()
+    if app.config['SQLALCHEMY_POOL_SIZE']:
+        options.update({'poolclass': AsyncAdaptedQueuePool,
+                        'pool_size': app.config['SQLALCHEMY_POOL_SIZE'],
+                        'max_overflow': app.config['SQLALCHEMY_MAX_OVERFLOW'],
+                        'pool_timeout': app.config['SQLALCHEMY_POOL_TIMEOUT'],
+                        'pool_recycle': app.config['SQLALCHEMY_POOL_RECYCLE'],
+                        'pool_pre_ping': bool(app.config['SQLALCHEMY_POOL_PRE_PING'])})
+    engine = create_engine(url, **options)
+    configure_engine(app, engine.sync_engine)
+    return engine
+
+
+class AsgiApplication(object):
+    """ASGI 3 application that serves the views of ASYNC_RESOURCES with coroutines, and runs
+    a Flask application in a pool of threads for the other requests
+
+    Every request run by the Flask application runs in a single thread of the pool, from the
+    call of the WSGI application to the end of its response, so the responses streamed with
+    stream_with_context keep their request context. The chunks of the response are sent one
+    at a time, the thread waits for the server to send each of them.
+
+    :param Flask app: the application
+    :param int max_workers: the maximum number of requests handled at a time by the Flask
+                            application, ASGI_MAX_WORKERS by default
+    """
+
+    def __init__(self, app, max_workers=None):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers or app.config['ASGI_MAX_WORKERS'])
+        self.engine = create_async_engine(app)
+        self.sessionmaker = orm.sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError('Unsupported scope type {}'.format(scope['type']))
+
+    async def lifespan(self, receive, send):
+        """Answer the startup and shutdown events of the server"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        """Read the body of a request, and serve it with a coroutine or in the pool of threads"""
+        body = io.BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+
+        environ = get_environ(scope, body)
+        response = await self.dispatch(environ)
+        if response is not None:
+            app_iter, status, headers = response.get_wsgi_response(environ)
+            await send({'type': 'http.response.start',
+                        'status': int(status.split(' ', 1)[0]),
+                        'headers': encode_headers(headers)})
+            await send({'type': 'http.response.body', 'body': b''.join(app_iter), 'more_body': False})
+            return
+
+        body.seek(0)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self.run_wsgi, environ,
+                                   lambda message: asyncio.run_coroutine_threadsafe(send(message), loop).result())
+
+    async def dispatch(self, environ):
+        """Serve a request with the async resource manager of its view
+
+        :param dict environ: the WSGI environ of the request
+        :return Response: the response, or None if the request is left to the WSGI application
+        """
+        adapter = self.app.url_map.bind_to_environ(environ, server_name=self.app.config['SERVER_NAME'])
+        try:
+            rule, view_kwargs = adapter.match(return_rule=True)
+        except HTTPException:
+            return None
+        resource_cls = ASYNC_RESOURCES.get(rule.endpoint)
+        if resource_cls is None:
+            return None
+
+        start = time.perf_counter()
+        async with self.sessionmaker() as session:
+            response = await resource_cls(self.app, rule.endpoint, environ, session).dispatch(view_kwargs)
+        if response is not None and 'metrics' in self.app.extensions:
+            self.app.extensions['metrics'].observe(rule.rule, environ['REQUEST_METHOD'], response.status_code,
+                                                   time.perf_counter() - start)
+        return response
+
+    def run_wsgi(self, environ, send):
+        """Call the WSGI application and send its response, in a thread of the pool
+
+        :param dict environ: the WSGI environ of the request
+        :param callable send: sends an ASGI message and waits until it is sent
+        """
+        start = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and not start:
+                raise exc_info[1].with_traceback(exc_info[2])
+            start[:] = [{'type': 'http.response.start',
+                         'status': int(status.split(' ', 1)[0]),
+                         'headers': encode_headers(headers)}]
+            return write
+
+        def write(data):
+            if start:
+                send(start.pop())
+            if data:
+                send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        iterable = self.app(environ, start_response)
+        try:
+            for data in iterable:
+                write(data)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        write(b'')
+        send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+def get_environ(scope, body):
+    """Build the WSGI environ of an ASGI http scope
+
+    :param dict scope: the scope of the request
+    :param file body: the body of the request
+    :return dict: the environ
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = environ[name] + ',' + value if name in environ else value
+
+    # the whole body is read, whether it was sent with a length or in chunks
+    environ['CONTENT_LENGTH'] = str(len(body.getbuffer()))
+
+    return environ
+
+
+def encode_headers(headers):
+    """Encode the headers of a WSGI response for the http.response.start message"""
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
@@ -0,0 +1,195 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class CacheBackend(object):
+    """Interface of the storages used by ResponseCache
+
+    Implement it to share the cache between processes, e.g. on top of a Redis client.
+    Values are tuples of strings, bytes and integers.
+    """
+
+    def get(self, key, default=None):
+        """Return the value of a key, or default if the key is missing or expired"""
+        raise NotImplementedError
+
+    def set(self, key, value, timeout=None):
+        """Set the value of a key, expiring after timeout seconds"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove a key from the cache"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove all keys from the cache"""
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Thread safe in-process cache that evicts the least recently used entries
+
+    :param int max_size: the maximum number of entries
+    :param float timeout: the number of seconds after which an entry expires, None to never expire
+    """
+
+    def __init__(self, max_size=1024, timeout=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the value of a key, or default if the key is missing or expired"""
+        with self._lock:
+            try:
+                value, expires = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Set the value of a key
+
+        :param timeout: the number of seconds after which the entry expires, defaults to the
+                        timeout of the cache
+        """
+        timeout = self.timeout if timeout is None else timeout
+        expires = time.time() + timeout if timeout is not None else None
+
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove a key from the cache"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all keys from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class GenerationCache(object):
+    """Cache whose keys contain the generation tokens of resource types
+
+    Each resource type has a generation token, renewed by every write to that type.
+    The key of an entry contains the tokens of all the types the entry depends on,
+    so a write makes the entries that depend on it unreachable, and they expire from
+    the backend on their own.
+
+    :param CacheBackend backend: the storage of entries and generation tokens
+    :param float timeout: the number of seconds an entry is cached, None to use the
+                          timeout of the backend. Generation tokens are set without timeout.
+    """
+
+    def __init__(self, backend, timeout=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_generations(self, types):
+        """Return the 'type:token' strings of resource types, sorted by type"""
+        return ['{}:{}'.format(type_, self.get_generation(type_)) for type_ in sorted(types)]
+
+    def get_generation(self, type_):
+        """Return the generation token of a resource type"""
+        generation = self.backend.get('generation:' + type_)
+        if generation is None:
+            # a token evicted from the backend is replaced by a new one,
+            # so the entries cached with the old one are never served
+            generation = self.invalidate([type_])[type_]
+        return generation
+
+    def invalidate(self, types):
+        """Renew the generation tokens of resource types
+
+        :param iterable types: the resource types that were written to
+        :return dict: the new token of each type
+        """
+        generations = dict()
+        for type_ in types:
+            generations[type_] = uuid.uuid4().hex
+            self.backend.set('generation:' + type_, generations[type_])
+        return generations
+
+    def lookup(self, key):
+        """Return the cached value of a key, or None, counting the hits and misses"""
+        cached = self.backend.get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached
+
+
+class ResponseCache(GenerationCache):
+    """Cache of the responses of GET requests, invalidated by the writes of the types they show"""
+
+    def make_key(self, types, request):
+        """Return the cache key of a request
+
+        :param iterable types: the resource types the response can show
+        :param Request request: the request
+        """
+        key = '\n'.join([request.full_path, request.headers.get('Accept', '')] + self.get_generations(types))
+        return 'response:' + hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached (status, headers, data) tuple of a key, or None"""
+        return self.lookup(key)
+
+    def set(self, key, response):
+        """Cache a response"""
+        self.backend.set(key,
+                         (response.status_code, list(response.headers.items()), response.get_data()),
+                         timeout=self.timeout)
+
+
+class CountCache(GenerationCache):
+    """Cache of meta.count, used by the 'cached' COUNT_MODE, invalidated by the writes of the types
+    the counted objects can be filtered on"""
+
+    def make_key(self, types, key):
+        """Return the cache key of a count
+
+        :param iterable types: the resource types the count depends on
+        :param tuple key: the key of the count, see DataLayer.get_count_key
+        """
+        return ('count',) + tuple(key) + tuple(self.get_generations(types))
+
+    def get(self, key):
+        """Return the cached count of a key, or None"""
+        return self.lookup(key)
+
+    def set(self, key, count):
+        """Cache a count"""
+        self.backend.set(key, count, timeout=self.timeout)
+
+    def clear(self):
+        """Remove all the counts and generation tokens"""
+        self.backend.clear()
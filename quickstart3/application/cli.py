@@ -0,0 +1,264 @@
+"""Commands of the flask command line: index advisor, NDJSON import and benchmarks
+
+    $ FLASK_APP=quickstart3.py flask index-advisor
+"""
+
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import timeit
+
+import click
+from application import create_app, db
+from application.api_bp.querystring import QueryStringManager as QSManager
+from application.api_bp.schemas import ComputerSchema
+from application.api_bp.serializer import dump
+from application.asgi import AsgiApplication
+from application.importer import import_ndjson
+from application.index_advisor import advise, parse_usage_log
+from application.models import Computer, Person
+from config import Config
+from flask import current_app, request
+from flask.cli import with_appcontext
+from flask_rest_jsonapi.schema import compute_schema
+
+
+@click.command('index-advisor')
+@with_appcontext
+@click.argument('logfile', required=False, type=click.File())
+def index_advisor(logfile):
+    """Report the filtered columns whose filters no index serves, with their query plan.
+
+    The filtered columns and their operators are read from LOGFILE, FILTER_USAGE_LOG by default.
+    """
+    if logfile is None:
+        if not current_app.config['FILTER_USAGE_LOG']:
+            raise click.UsageError('Give a LOGFILE or set FILTER_USAGE_LOG')
+        logfile = open(current_app.config['FILTER_USAGE_LOG'])
+    with logfile:
+        counts = parse_usage_log(logfile)
+
+    report = advise(db.engine, counts)
+
+    for row in report:
+        click.echo('{table}.{column} {operator}: {count} filters, {status}'
+                   .format(status=row['advice'] or 'indexed', **row))
+        if row['advice'] is not None and row['plan'] is not None:
+            click.echo('    ' + row['plan'].replace('\n', '\n    '))
+
+
+@click.command('import-ndjson')
+@with_appcontext
+@click.argument('file', type=click.File())
+@click.option('--chunk-size', type=int, help='Number of lines per transaction, IMPORT_CHUNK_SIZE by default.')
+def import_ndjson_command(file, chunk_size):
+    """Import the persons and computers of FILE, one JSON:API resource object per line.
+
+    Computers refer to their owner by id, or by email. Invalid lines are reported
+    and skipped.
+    """
+    with file:
+        report = import_ndjson(db.session, file, chunk_size or current_app.config['IMPORT_CHUNK_SIZE'])
+
+    for error in report.errors:
+        pointer = error.get('source', dict()).get('pointer')
+        click.echo('line {}: {}{}'.format(error['line'], error['detail'], ' ({})'.format(pointer) if pointer else ''),
+                   err=True)
+    click.echo('{} imported ({}), {} errors, in {:.2f} s: {:.0f} objects/s'
+               .format(report.rows, ', '.join('{} {}'.format(count, type_) for type_, count in sorted(report.counts.items())),
+                       len(report.errors), report.seconds, report.rows_per_second))
+
+
+@click.command('benchmark-serializer')
+@with_appcontext
+@click.option('--objects', default=500, help='Number of computers in the page.')
+@click.option('--repeat', default=20, help='Number of dumps of the page.')
+@click.option('--include', default='owner', help='The include parameter of the page.')
+def benchmark_serializer(objects, repeat, include):
+    """Compare the compiled dump of a page of computers with Schema.dump.
+
+    The computers and their owners are built in memory, so the time is the
+    time of the dump and the encoding of the document.
+    """
+    persons = [Person(id=id_, name='Person {}'.format(id_), email='person{}@example.com'.format(id_),
+                      birth_date=datetime.date(1990, 1, 1) + datetime.timedelta(days=id_))
+               for id_ in range(1, objects // 2 + 2)]
+    computers = [Computer(id=id_, serial='Computer {}'.format(id_), person=persons[id_ // 2])
+                 for id_ in range(1, objects + 1)]
+    encode = current_app.extensions['jsonapi_encoder']
+
+    with current_app.test_request_context('/computers', query_string={'include': include} if include else None):
+        qs = QSManager(request.args, ComputerSchema)
+
+        def schema_dump():
+            return encode(compute_schema(ComputerSchema, {'many': True}, qs, qs.include).dump(computers).data)
+
+        def compiled_dump():
+            return encode(dump(compute_schema(ComputerSchema, {'many': True}, qs, qs.include), computers))
+
+        if compiled_dump() != schema_dump():
+            raise click.ClickException('The compiled dump differs from Schema.dump')
+
+        for name, function in (('Schema.dump', schema_dump), ('compiled dump', compiled_dump)):
+            seconds = min(timeit.repeat(function, number=1, repeat=repeat))
+            click.echo('{}: {:.1f} ms per page, {:.1f} us per object'
+                       .format(name, seconds * 1e3, seconds * 1e6 / objects))
+
+
+@contextlib.contextmanager
+def temporary_app(settings):
+    """Create an application on a temporary SQLite database, for the benchmarks
+
+    :param dict settings: the settings that override the ones of Config
+    """
+    directory = tempfile.mkdtemp()
+    settings = dict(settings, SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(directory, 'benchmark.db'))
+    benchmark_app = create_app(type('BenchmarkConfig', (Config,), settings))
+    with benchmark_app.app_context():
+        db.create_all()
+    try:
+        yield benchmark_app
+    finally:
+        with benchmark_app.app_context():
+            db.get_engine(benchmark_app).dispose()
+        shutil.rmtree(directory)
+
+
+BENCHMARK_HEADERS = {'Content-Type': 'application/vnd.api+json', 'Accept': 'application/vnd.api+json'}
+BENCHMARK_PERSON = json.dumps({'data': {'type': 'person',
+                                        'attributes': {'name': 'John', 'email': 'john@gmail.com'}}})
+
+
+@click.command('benchmark-database')
+@with_appcontext
+@click.option('--writers', default=4, help='Number of threads creating persons.')
+@click.option('--readers', default=4, help='Number of threads reading pages of persons.')
+@click.option('--requests', default=200, help='Number of requests per thread.')
+def benchmark_database(writers, readers, requests):
+    """Compare the throughput of concurrent requests with and without the engine settings.
+
+    The requests run on a temporary SQLite database, once with the pool and the
+    pragmas of the configuration, and once with the defaults of Flask-SQLAlchemy
+    and SQLite.
+    """
+    def run(benchmark_app):
+        client = benchmark_app.test_client()
+        errors = []
+
+        def write():
+            for index in range(requests):
+                if client.post('/persons', headers=BENCHMARK_HEADERS, data=BENCHMARK_PERSON).status_code != 201:
+                    errors.append('write')
+
+        def read():
+            for index in range(requests):
+                if client.get('/persons?page[size]=20', headers=BENCHMARK_HEADERS).status_code != 200:
+                    errors.append('read')
+
+        threads = [threading.Thread(target=write) for index in range(writers)]
+        threads += [threading.Thread(target=read) for index in range(readers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, len(errors)
+
+    for name, settings in (('defaults', {'SQLALCHEMY_POOL_SIZE': None, 'SQLALCHEMY_MAX_OVERFLOW': None,
+                                         'SQLALCHEMY_POOL_TIMEOUT': None, 'SQLALCHEMY_POOL_PRE_PING': False,
+                                         'SQLITE_PRAGMAS': {}}),
+                           ('configured', {})):
+        with temporary_app(settings) as benchmark_app:
+            seconds, errors = run(benchmark_app)
+        click.echo('{}: {:.0f} requests/s, {} errors'
+                   .format(name, (writers + readers) * requests / seconds, errors))
+
+
+@click.command('benchmark-asgi')
+@with_appcontext
+@click.option('--concurrency', default=64, help='Number of requests in flight.')
+@click.option('--requests', default=20, help='Number of requests per client.')
+def benchmark_asgi(concurrency, requests):
+    """Compare the throughput of concurrent requests served with WSGI and with ASGI.
+
+    With WSGI every client is a thread, with ASGI every client is a task of the
+    event loop, and the requests read and write with async sessions. Half of the
+    clients create persons, the other half read pages of persons.
+    """
+    def run_wsgi(benchmark_app):
+        client = benchmark_app.test_client()
+        statuses = []
+
+        def run_client(index):
+            for request_index in range(requests):
+                if index % 2:
+                    statuses.append(client.get('/persons?page[size]=20', headers=BENCHMARK_HEADERS).status_code)
+                else:
+                    statuses.append(client.post('/persons', headers=BENCHMARK_HEADERS,
+                                                data=BENCHMARK_PERSON).status_code)
+
+        threads = [threading.Thread(target=run_client, args=(index,)) for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def run_asgi(benchmark_app):
+        asgi = AsgiApplication(benchmark_app)
+        headers = [(name.lower().encode(), value.encode()) for name, value in BENCHMARK_HEADERS.items()]
+        statuses = []
+
+        async def request(method, path, query_string=b'', body=b''):
+            async def receive():
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            await asgi({'type': 'http', 'method': method, 'path': path, 'query_string': query_string,
+                        'headers': headers}, receive, send)
+
+        async def run_client(index):
+            for request_index in range(requests):
+                if index % 2:
+                    await request('GET', '/persons', b'page[size]=20')
+                else:
+                    await request('POST', '/persons', body=BENCHMARK_PERSON.encode())
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(asyncio.gather(*[run_client(index) for index in range(concurrency)]))
+        finally:
+            asgi.executor.shutdown()
+            loop.run_until_complete(asgi.engine.dispose())
+            loop.close()
+            asyncio.set_event_loop(None)
+        return statuses
+
+    for name, run in (('WSGI', run_wsgi), ('ASGI', run_asgi)):
+        with temporary_app({}) as benchmark_app:
+            start = time.perf_counter()
+            statuses = run(benchmark_app)
+            seconds = time.perf_counter() - start
+        click.echo('{}: {:.0f} requests/s, {} errors'
+                   .format(name, len(statuses) / seconds,
+                           len([status for status in statuses if status not in (200, 201)])))
+
+
+# The commands added to the flask command line by register_commands
+COMMANDS = (index_advisor, import_ndjson_command, benchmark_serializer, benchmark_database, benchmark_asgi)
+
+
+def register_commands(app):
+    """Add the commands of this module to the command line of an application"""
+    for command in COMMANDS:
+        app.cli.add_command(command)
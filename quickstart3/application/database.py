@@ -0,0 +1,185 @@
+"""Engine configuration: connection pool options, the pragmas of SQLite connections,
+and the routing of the reads to the replicas of the database"""
+
+import functools
+import itertools
+import threading
+import time
+from collections import Counter
+
+import flask_sqlalchemy
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool, StaticPool
+
+# The options of the pools that keep a queue of connections
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+# The methods of the requests that can read from a replica
+READ_METHODS = ('GET', 'HEAD')
+
+# The ways ReplicaRouter chooses the replica of a request, see REPLICA_STRATEGY in config.py
+REPLICA_STRATEGIES = ('round-robin', 'least-loaded')
+
+
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+    """Session that reads from the replica chosen for the current request, see route_to_replica
+
+    Only the models of the database are read from its replicas, the models with a
+    __bind_key__ keep using the database of their bind.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('replica_bind') if has_app_context() else None
+        if mapper is not None and getattr(mapper.persist_selectable, 'info', {}).get('bind_key') is not None:
+            replica = None
+        if replica is not None:
+            return flask_sqlalchemy.get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """Flask-SQLAlchemy extension that also reads SQLALCHEMY_POOL_PRE_PING, pools the
+    connections of SQLite databases stored in files when SQLALCHEMY_POOL_SIZE is set,
+    and whose sessions read from the replica of the request, see RoutingSession
+
+    Flask-SQLAlchemy opens a new connection for every session of a file-backed SQLite database,
+    so the pragmas of SQLITE_PRAGMAS would be run again by each request. A pooled connection is
+    used by one thread at a time, but not always the thread that opened it.
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_pool_defaults(self, app, options):
+        options = super(SQLAlchemy, self).apply_pool_defaults(app, options)
+        if app.config.get('SQLALCHEMY_POOL_PRE_PING'):
+            options['pool_pre_ping'] = True
+        return options
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super(SQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        if sa_url.drivername != 'sqlite':
+            return sa_url, options
+
+        if options.get('poolclass') is StaticPool:
+            # an in-memory database has a single connection
+            for option in QUEUE_POOL_OPTIONS:
+                options.pop(option, None)
+        elif options.get('pool_size'):
+            options['poolclass'] = QueuePool
+            options.setdefault('connect_args', dict())['check_same_thread'] = False
+        return sa_url, options
+
+
+def set_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    """Run PRAGMA statements on a new SQLite connection
+
+    :param dict pragmas: the value of each pragma, see SQLITE_PRAGMAS in config.py
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+    finally:
+        cursor.close()
+
+
+def configure_engine(app, engine):
+    """Set the pragmas of SQLITE_PRAGMAS on the connections of an SQLite engine
+
+    Must be called before the engine opens its first connection.
+
+    :param Flask app: the application
+    :param Engine engine: the engine of the database, or of one of its binds
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if engine.dialect.name == 'sqlite' and pragmas:
+        event.listen(engine, 'connect', functools.partial(set_sqlite_pragmas, dict(pragmas)))
+
+
+class ReplicaRouter(object):
+    """Chooses the replica each read request is routed to
+
+    :param list binds: the bind keys of the replicas
+    :param str strategy: 'round-robin' to use the replicas in turn, 'least-loaded' to use
+                         the replica with the fewest requests in progress
+    """
+
+    def __init__(self, binds, strategy='round-robin'):
+        if strategy not in REPLICA_STRATEGIES:
+            raise ValueError('Unknown replica strategy {}, must be one of {}'
+                             .format(strategy, ', '.join(REPLICA_STRATEGIES)))
+        self.binds = list(binds)
+        self.strategy = strategy
+        self.in_progress = Counter({bind: 0 for bind in self.binds})
+        self._turns = itertools.cycle(self.binds)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return the bind key of the replica of a request, to release when the request ends"""
+        with self._lock:
+            if self.strategy == 'least-loaded':
+                bind = min(self.binds, key=lambda bind: self.in_progress[bind])
+            else:
+                bind = next(self._turns)
+            self.in_progress[bind] += 1
+            return bind
+
+    def release(self, bind):
+        """Count the end of a request routed to a replica"""
+        with self._lock:
+            self.in_progress[bind] -= 1
+
+
+def init_replicas(app):
+    """Register the replicas of SQLALCHEMY_REPLICAS as binds, and route the reads to them
+
+    Must be called before the engines are created.
+
+    :param Flask app: the application
+    """
+    binds = dict(app.config['SQLALCHEMY_BINDS'] or ())
+    replicas = []
+    for index, uri in enumerate(app.config['SQLALCHEMY_REPLICAS']):
+        replicas.append('replica_{}'.format(index))
+        binds[replicas[-1]] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+    app.extensions['replica_router'] = ReplicaRouter(replicas, app.config['REPLICA_STRATEGY'])
+    app.before_request(route_to_replica)
+    app.after_request(stick_to_primary)
+    app.teardown_request(release_replica)
+
+
+def route_to_replica():
+    """Route the reads of a GET request to a replica, unless the client has written recently
+
+    A client that wrote less than REPLICA_STICKINESS seconds ago reads from the primary,
+    so it reads its writes while they are being replicated.
+    """
+    if request.method not in READ_METHODS:
+        return
+    try:
+        primary_until = float(request.cookies.get(current_app.config['REPLICA_STICKY_COOKIE'], 0))
+    except ValueError:
+        primary_until = 0
+    if primary_until > time.time():
+        return
+    g.replica_bind = current_app.extensions['replica_router'].acquire()
+
+
+def stick_to_primary(response):
+    """Make the client of a successful write read from the primary for REPLICA_STICKINESS seconds"""
+    if request.method not in READ_METHODS and response.status_code < 400:
+        stickiness = current_app.config['REPLICA_STICKINESS']
+        response.set_cookie(current_app.config['REPLICA_STICKY_COOKIE'], str(int(time.time() + stickiness)),
+                            max_age=stickiness, httponly=True)
+    return response
+
+
+def release_replica(exc):
+    """Release the replica of a request, at the end of its response"""
+    bind = g.pop('replica_bind', None)
+    if bind is not None:
+        current_app.extensions['replica_router'].release(bind)
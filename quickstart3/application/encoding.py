@@ -0,0 +1,69 @@
+"""Encoders of the JSON:API documents, see JSONAPI_ENCODER in config.py"""
+
+import datetime
+import decimal
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def default(obj):
+    """Serialize the values the JSON encoders do not support
+
+    Dates and times are serialized in ISO 8601, like the Date fields of the schemas.
+    """
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+
+def encode_orjson(obj):
+    """Encode a document with orjson"""
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def encode_ujson(obj):
+    """Encode a document with ujson, 5.2 or later for the default argument"""
+    return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False, default=default).encode()
+
+
+def encode_json(obj):
+    """Encode a document with the json module of the standard library"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=default).encode()
+
+
+# The encoders selectable with JSONAPI_ENCODER, with their module, in the order of preference of 'auto'
+ENCODERS = {'orjson': (encode_orjson, orjson),
+            'ujson': (encode_ujson, ujson),
+            'json': (encode_json, json)}
+ENCODER_PREFERENCE = ('orjson', 'ujson', 'json')
+
+
+def get_encoder(name='auto'):
+    """Return an encoder of documents into compact UTF-8 JSON
+
+    :param str name: the name of the encoder, or 'auto' for the fastest one installed
+    :return callable: a function that encodes a document into bytes
+    """
+    if name == 'auto':
+        name = next(name for name in ENCODER_PREFERENCE if ENCODERS[name][1] is not None)
+
+    if name not in ENCODERS:
+        raise ValueError("Unknown JSON encoder {}, expected one of auto, {}"
+                         .format(name, ', '.join(ENCODER_PREFERENCE)))
+
+    encoder, module = ENCODERS[name]
+    if module is None:
+        raise ImportError("The {} JSON encoder is not installed".format(name))
+    return encoder
@@ -0,0 +1,265 @@
+"""Bulk import of persons and computers from newline delimited JSON
+
+Each line is a JSON:API resource object, as in the data of a POST request:
+
+    {"type": "person", "attributes": {"name": "John", "email": "john@gmail.com"}}
+    {"type": "computer", "attributes": {"serial": "Amstrad"},
+     "relationships": {"owner": {"data": {"type": "person", "email": "john@gmail.com"}}}}
+
+A relationship refers to an object by id, or by the natural key of its type (see NATURAL_KEYS),
+so the lines can refer to the objects created by the previous lines of the file.
+
+The lines are imported by chunks, one transaction per chunk. Within a chunk the objects of
+each type are validated by the schema of the type, the references of the relationships are
+resolved with one query per related type, and the valid objects are inserted with a single
+executemany. Invalid lines are reported and skipped, the other lines of their chunk are imported.
+"""
+
+import json
+import time
+from collections import Counter
+
+from application.api_bp.data_layers import BULK_CHUNK_SIZE, chunked, invalidate_caches
+from application.api_bp.schemas import ComputerSchema, PersonSchema
+from application.models import Computer, Person
+from flask_rest_jsonapi.schema import get_model_field, get_relationships
+from sqlalchemy import orm
+from sqlalchemy.exc import SQLAlchemyError
+
+# The types that can be imported, with their schema and model, in the order they are inserted
+# within a chunk, so the objects of a chunk can refer to the persons of the same chunk
+IMPORTED_TYPES = (('person', PersonSchema, Person),
+                  ('computer', ComputerSchema, Computer))
+
+# The attribute that identifies the objects of a type in the relationships of the imported lines,
+# besides their id, eg. {"type": "person", "email": "john@gmail.com"}
+NATURAL_KEYS = {'person': 'email'}
+
+
+class ImportReport(object):
+    """Result of an import: the number of objects created by type, and the errors of each line"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.errors = []
+        self.seconds = 0.0
+
+    @property
+    def rows(self):
+        """The number of objects created"""
+        return sum(self.counts.values())
+
+    @property
+    def rows_per_second(self):
+        """The throughput of the import"""
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add_error(self, line_number, detail, pointer=None):
+        """Report the error of a line
+
+        :param int line_number: the number of the line in the file, from 1
+        :param str detail: the description of the error
+        :param str pointer: the JSON pointer of the erroneous member of the line
+        """
+        error = {'line': line_number, 'detail': detail}
+        if pointer is not None:
+            error['source'] = {'pointer': pointer}
+        self.errors.append(error)
+
+
+def import_ndjson(session, lines, chunk_size):
+    """Import the persons and computers of lines of NDJSON
+
+    :param Session session: the sqlalchemy session
+    :param iterable lines: the lines, eg. an open file
+    :param int chunk_size: the number of lines imported per transaction
+    :return ImportReport: the number of objects imported, and the errors of the lines
+    """
+    report = ImportReport()
+    start = time.perf_counter()
+
+    chunk = []
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        chunk.append((line_number, line))
+        if len(chunk) >= chunk_size:
+            import_chunk(session, chunk, report)
+            chunk = []
+    if chunk:
+        import_chunk(session, chunk, report)
+
+    report.seconds = time.perf_counter() - start
+    report.errors.sort(key=lambda error: error['line'])
+    return report
+
+
+def import_chunk(session, chunk, report):
+    """Import lines of NDJSON in a single transaction
+
+    :param Session session: the sqlalchemy session
+    :param list chunk: the (line number, line) tuples
+    :param ImportReport report: the report the counts and the errors are added to
+    """
+    items = {type_: [] for type_, schema_cls, model in IMPORTED_TYPES}
+    for line_number, line in chunk:
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            report.add_error(line_number, 'Invalid JSON: {}'.format(e))
+            continue
+        if not isinstance(item, dict) or item.get('type') not in items:
+            report.add_error(line_number, 'The type must be one of: {}'.format(', '.join(items)), '/type')
+            continue
+        items[item['type']].append((line_number, item))
+
+    counts = Counter()
+    errors = len(report.errors)
+    try:
+        for type_, schema_cls, model in IMPORTED_TYPES:
+            resolve_references(session, schema_cls, items[type_], report)
+            rows = []
+            for line_number, item in items[type_]:
+                row = load_row(schema_cls, model, line_number, item, report)
+                if row is not None:
+                    rows.append(row)
+            if rows:
+                session.bulk_insert_mappings(model, rows)
+                counts[type_] = len(rows)
+        session.commit()
+    except SQLAlchemyError as e:
+        session.rollback()
+        # the lines of the chunk are not imported, only the database error is reported for them
+        del report.errors[errors:]
+        for line_number, line in chunk:
+            report.add_error(line_number, 'Import error: {}'.format(e))
+        return
+
+    report.counts.update(counts)
+    invalidate_caches(counts)
+
+
+def resolve_references(session, schema_cls, items, report):
+    """Replace the natural keys of the relationships of items by ids, and check that the ids exist,
+    with one query per related type and BULK_CHUNK_SIZE references
+
+    The items that refer to a missing object are reported, and removed from items.
+
+    :param Session session: the sqlalchemy session
+    :param Schema schema_cls: the schema of the items
+    :param list items: the (line number, resource object) tuples
+    :param ImportReport report: the report the errors are added to
+    """
+    imported_types = {type_: (related_schema_cls, model) for type_, related_schema_cls, model in IMPORTED_TYPES}
+    for field in get_relationships(schema_cls):
+        related_type = schema_cls._declared_fields[field].type_
+        if related_type not in imported_types:
+            continue
+        related_schema_cls, related_model = imported_types[related_type]
+        pk_column = orm.class_mapper(related_model).primary_key[0]
+        natural_key = NATURAL_KEYS.get(related_type)
+        if natural_key is not None:
+            natural_column = getattr(related_model, get_model_field(related_schema_cls, natural_key))
+
+        ids, keys = set(), set()
+        for line_number, item in items:
+            for identifier in get_identifiers(item, field):
+                if 'id' in identifier:
+                    try:
+                        ids.add(pk_column.type.python_type(identifier['id']))
+                    except (ValueError, TypeError):
+                        pass
+                elif natural_key is not None and isinstance(identifier.get(natural_key), str):
+                    keys.add(identifier[natural_key])
+
+        existing_ids = set()
+        for chunk in chunked(sorted(ids), BULK_CHUNK_SIZE):
+            existing_ids.update(id_ for id_, in session.query(pk_column).filter(pk_column.in_(chunk)))
+        key_ids = dict()
+        for chunk in chunked(sorted(keys), BULK_CHUNK_SIZE):
+            for id_, key in session.query(pk_column, natural_column).filter(natural_column.in_(chunk)):
+                # a key shared by several objects is ambiguous
+                key_ids[key] = id_ if key not in key_ids else None
+
+        pointer = '/relationships/{}/data'.format(field)
+        resolved = []
+        for line_number, item in items:
+            error = None
+            for identifier in get_identifiers(item, field):
+                if 'id' in identifier:
+                    try:
+                        id_ = pk_column.type.python_type(identifier['id'])
+                    except (ValueError, TypeError):
+                        id_ = None
+                    if id_ not in existing_ids:
+                        error = '{} {} not found'.format(related_type, identifier['id'])
+                elif natural_key is not None and natural_key in identifier:
+                    key = identifier[natural_key]
+                    if not isinstance(key, str) or key not in key_ids:
+                        error = '{} with {} {} not found'.format(related_type, natural_key, key)
+                    elif key_ids[key] is None:
+                        error = 'Several {} objects have the {} {}'.format(related_type, natural_key, key)
+                    else:
+                        del identifier[natural_key]
+                        identifier['id'] = str(key_ids[key])
+            if error is None:
+                resolved.append((line_number, item))
+            else:
+                report.add_error(line_number, error, pointer)
+        items[:] = resolved
+
+
+def get_identifiers(item, field):
+    """Return the resource identifiers of a relationship of a resource object
+
+    :param dict item: the resource object
+    :param str field: the name of the relationship
+    :return list: the identifier objects
+    """
+    relationship = (item.get('relationships') or dict()).get(field)
+    if not isinstance(relationship, dict):
+        return []
+    data = relationship.get('data')
+    if isinstance(data, dict):
+        return [data]
+    if isinstance(data, list):
+        return [identifier for identifier in data if isinstance(identifier, dict)]
+    return []
+
+
+def load_row(schema_cls, model, line_number, item, report):
+    """Validate a resource object with its schema, and return the column values of its row
+
+    Only the many-to-one relationships are imported, the other ones are reported as errors.
+
+    :param Schema schema_cls: the schema of the resource object
+    :param Model model: the sqlalchemy model of the resource object
+    :param int line_number: the number of the line of the resource object
+    :param dict item: the resource object
+    :param ImportReport report: the report the errors are added to
+    :return dict: the values of the columns, or None if the resource object is invalid
+    """
+    data, errors = schema_cls().load({'data': item})
+    if errors:
+        for error in errors['errors']:
+            pointer = error.get('source', dict()).get('pointer')
+            if pointer is not None and pointer.startswith('/data'):
+                pointer = pointer[len('/data'):]
+            report.add_error(line_number, error['detail'], pointer)
+        return None
+
+    mapper = orm.class_mapper(model)
+    row = dict()
+    for key, value in data.items():
+        prop = mapper.attrs.get(key)
+        if isinstance(prop, orm.RelationshipProperty):
+            if prop.direction is not orm.interfaces.MANYTOONE:
+                report.add_error(line_number, 'The relationship {} cannot be imported'.format(key),
+                                 '/relationships')
+                return None
+            for column in prop.local_columns:
+                row[mapper.get_property_by_column(column).key] =\
+                    column.type.python_type(value) if value is not None else None
+        elif isinstance(prop, orm.ColumnProperty):
+            row[key] = value
+    return row
@@ -0,0 +1,153 @@
+"""Advise on the indexes of the database, from the filters that clients actually use"""
+
+import logging
+import re
+import threading
+from collections import Counter
+
+from sqlalchemy import column as column_clause, inspect, literal_column, select, table as table_clause, text
+from sqlalchemy.exc import SQLAlchemyError
+
+
+logger = logging.getLogger(__name__)
+
+LOG_PATTERN = re.compile(r'filter columns: (.*)$')
+
+# The operators compared to a string pattern, and the value of their query plan
+PATTERN_OPERATORS = ('like', 'ilike', 'notlike', 'notilike', 'startswith', 'endswith', 'contains')
+PATTERN_VALUE = 'a%'
+
+# The operators compared to a list, see LIST_OPERATORS in api_bp/filtering.py
+LIST_OPERATORS = ('in', 'in_', 'notin', 'notin_')
+
+# The case-insensitive operators, compiled to lower(column) LIKE lower(value) by SQLite,
+# which no index on the column can serve
+CASE_INSENSITIVE_OPERATORS = ('ilike', 'notilike')
+
+
+class FilterUsage(object):
+    """Thread safe count of the columns compared by the filters of the requests, and of their
+    operators, see get_filtered_columns
+
+    Each record is also logged to the application.index_advisor logger, see FILTER_USAGE_LOG
+    in config.py, so the usage of all processes can be collected and fed to advise.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, columns):
+        """Count the columns compared by the filters of a request
+
+        :param list columns: (table, column, operator) names
+        """
+        with self._lock:
+            self.counts.update(columns)
+        logger.info('filter columns: %s', ' '.join('{}.{}:{}'.format(*column) for column in columns))
+
+
+def parse_usage_log(lines):
+    """Count the filtered columns logged by FilterUsage
+
+    The columns logged without operator are counted as equality filters.
+
+    :param iterable lines: the lines of the log
+    :return Counter: the number of filters on each (table, column, operator)
+    """
+    counts = Counter()
+    for line in lines:
+        match = LOG_PATTERN.search(line.rstrip())
+        if match is not None:
+            for logged in match.group(1).split():
+                name, _, operator = logged.partition(':')
+                counts[tuple(name.split('.', 1)) + (operator or 'eq',)] += 1
+    return counts
+
+
+def is_indexed(inspector, table, column):
+    """Return True if a column is the first column of the primary key or of an index"""
+    if inspector.get_pk_constraint(table).get('constrained_columns', [None])[:1] == [column]:
+        return True
+    return any(index['column_names'][:1] == [column] for index in inspector.get_indexes(table))
+
+
+def get_predicate(column, operator):
+    """Return the predicate of a filter on a column, with a sample value
+
+    The operator is resolved like the filters of the requests do, see the Node of
+    flask_rest_jsonapi: a filter {"name": ..., "op": "in", ...} calls column.in_(value).
+
+    :param ColumnClause column: the column
+    :param str operator: the operator of the filter
+    :return ClauseElement: the predicate, or None if the column has no such operator
+    """
+    for name in (operator, operator + '_', '__' + operator + '__'):
+        if hasattr(column, name):
+            break
+    else:
+        return None
+    if operator == 'between':
+        return column.between(0, 0)
+    if operator in PATTERN_OPERATORS:
+        value = PATTERN_VALUE
+    elif operator in LIST_OPERATORS:
+        value = [0]
+    else:
+        value = 0
+    return getattr(column, name)(value)
+
+
+def explain(connection, table, column, operator='eq'):
+    """Return the SQLite query plan of a filter on a column, None for other databases and
+    unknown operators"""
+    if connection.dialect.name != 'sqlite':
+        return None
+    table_ = table_clause(table, column_clause(column))
+    predicate = get_predicate(table_.c[column], operator)
+    if predicate is None:
+        return None
+    statement = select([literal_column('*')]).select_from(table_).where(predicate)
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    try:
+        rows = connection.execute(text('EXPLAIN QUERY PLAN ' + sql))
+    except SQLAlchemyError:
+        return None
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def get_advice(dialect_name, table, column, operator, indexed):
+    """Return the advice on the index of a filtered column, None if the filter can use its index"""
+    if operator in CASE_INSENSITIVE_OPERATORS and dialect_name == 'sqlite':
+        # like is case-insensitive on SQLite, and can use an index with the NOCASE collation
+        return 'NO INDEX CAN SERVE {op}, filter with like on an index of {table}({column} COLLATE NOCASE)'\
+            .format(op=operator, table=table, column=column)
+    if not indexed:
+        return 'MISSING INDEX'
+    return None
+
+
+def advise(engine, counts):
+    """Report on the indexes of the filtered columns, the most used first
+
+    :param Engine engine: the sqlalchemy engine
+    :param dict counts: the number of filters on each (table, column, operator)
+    :return list: a dict per column and operator, with its table, column, operator, count,
+                  indexed, plan and advice
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    report = []
+    with engine.connect() as connection:
+        for (table, column, operator), count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            if table not in tables:
+                continue
+            indexed = is_indexed(inspector, table, column)
+            report.append({'table': table,
+                           'column': column,
+                           'operator': operator,
+                           'count': count,
+                           'indexed': indexed,
+                           'plan': explain(connection, table, column, operator),
+                           'advice': get_advice(engine.dialect.name, table, column, operator, indexed)})
+    return report
@@ -0,0 +1,195 @@
+"""Instrumentation of the requests: SQL statements, SQL time, serialization time and response size
+
+The statements of every engine are counted and timed by event listeners, and added to the
+stats of the request that executes them. At the end of a request its stats are added to
+the totals of its endpoint (person_list, computer_detail, ...), see EndpointStats.
+
+The totals are served as JSON by INSTRUMENTATION_ENDPOINT, to the clients of
+INSTRUMENTATION_ADDRESSES only. In debug, or when SERVER_TIMING
+is set, the responses report the stats of their request in a Server-Timing header.
+"""
+
+import contextlib
+import threading
+import time
+from collections import defaultdict
+
+from flask import abort, current_app, has_request_context, jsonify, request
+from sqlalchemy import event
+
+# The key of the stats of a request in its environ
+REQUEST_STATS_KEY = 'application.request_stats'
+
+
+class RequestStats(object):
+    """Stats of a request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.response_bytes = 0
+
+
+class EndpointStats(object):
+    """Thread safe totals of the stats of the requests of each endpoint"""
+
+    FIELDS = ('requests', 'statements', 'sql_seconds', 'serialization_seconds', 'response_bytes', 'seconds')
+
+    def __init__(self):
+        self._totals = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, stats):
+        """Add the stats of a finished request to the totals of its endpoint
+
+        :param str endpoint: the endpoint of the request
+        :param RequestStats stats: the stats of the request
+        """
+        seconds = time.perf_counter() - stats.start
+        with self._lock:
+            totals = self._totals[endpoint]
+            totals['requests'] += 1
+            totals['statements'] += stats.statements
+            totals['sql_seconds'] += stats.sql_seconds
+            totals['serialization_seconds'] += stats.serialization_seconds
+            totals['response_bytes'] += stats.response_bytes
+            totals['seconds'] += seconds
+
+    def snapshot(self):
+        """Return a copy of the totals of each endpoint"""
+        with self._lock:
+            return {endpoint: dict(totals) for endpoint, totals in self._totals.items()}
+
+    def clear(self):
+        """Reset the totals"""
+        with self._lock:
+            self._totals.clear()
+
+
+def get_request_stats():
+    """Return the stats of the current request, None outside of an instrumented request"""
+    if not has_request_context():
+        return None
+    return request.environ.get(REQUEST_STATS_KEY)
+
+
+@contextlib.contextmanager
+def timed_serialization():
+    """Add the time spent in the block to the serialization time of the current request"""
+    stats = get_request_stats()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialization_seconds += time.perf_counter() - start
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Start the timer of a statement"""
+    conn.info.setdefault('statement_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Add a statement and its time to the stats of the current request"""
+    seconds = time.perf_counter() - conn.info['statement_start'].pop()
+    stats = get_request_stats()
+    if stats is not None:
+        stats.statements += 1
+        stats.sql_seconds += seconds
+
+
+def instrument_engine(engine):
+    """Count and time the statements executed by an engine"""
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def init_instrumentation(app, engines):
+    """Instrument the engines and the requests of an application
+
+    :param Flask app: the application
+    :param iterable engines: the engines of the database and of its binds
+    """
+    for engine in engines:
+        instrument_engine(engine)
+
+    app.extensions['endpoint_stats'] = EndpointStats()
+    app.before_request(start_request)
+    app.after_request(add_server_timing)
+    app.teardown_request(finish_request)
+    if app.config['INSTRUMENTATION_ENDPOINT']:
+        app.add_url_rule(app.config['INSTRUMENTATION_ENDPOINT'], 'instrumentation', get_endpoint_stats)
+
+
+def start_request():
+    """Start collecting the stats of a request"""
+    request.environ[REQUEST_STATS_KEY] = RequestStats()
+
+
+def add_server_timing(response):
+    """Report the stats of a request in a Server-Timing header, when debugging
+
+    The size of the response is counted here, or as it is sent for a streamed response,
+    whose header only reports the time spent before the streaming.
+    """
+    stats = get_request_stats()
+    if stats is None:
+        return response
+
+    if response.is_streamed:
+        response.response = count_bytes(response.response, stats)
+    else:
+        stats.response_bytes = response.calculate_content_length() or 0
+
+    server_timing = current_app.config['SERVER_TIMING']
+    if server_timing is None:
+        server_timing = current_app.debug
+    if server_timing:
+        response.headers['Server-Timing'] = \
+            'sql;dur={:.3f};desc="{} statements", serialization;dur={:.3f}, total;dur={:.3f}'\
+            .format(stats.sql_seconds * 1e3, stats.statements, stats.serialization_seconds * 1e3,
+                    (time.perf_counter() - stats.start) * 1e3)
+    return response
+
+
+def count_bytes(chunks, stats):
+    """Count the bytes of the chunks of a streamed response"""
+    for chunk in chunks:
+        stats.response_bytes += len(chunk)
+        yield chunk
+
+
+def finish_request(exc):
+    """Add the stats of a finished request to the totals of its endpoint"""
+    stats = request.environ.pop(REQUEST_STATS_KEY, None)
+    if stats is not None and request.endpoint is not None and request.endpoint != 'instrumentation':
+        current_app.extensions['endpoint_stats'].add(request.endpoint, stats)
+
+
+def check_client_address(addresses):
+    """Answer 404 to the clients whose address is not one of addresses
+
+    The address is the one of the connection: behind a reverse proxy on the same host,
+    every client has the address of the proxy, e.g. 127.0.0.1.
+
+    :param iterable addresses: the allowed addresses
+    """
+    if request.remote_addr not in addresses:
+        abort(404)
+
+
+def get_endpoint_stats():
+    """Serve the totals of each endpoint, with their averages per request"""
+    check_client_address(current_app.config['INSTRUMENTATION_ADDRESSES'])
+    endpoints = current_app.extensions['endpoint_stats'].snapshot()
+    for totals in endpoints.values():
+        totals['statements_per_request'] = totals['statements'] / totals['requests']
+        totals['sql_ms_per_request'] = totals['sql_seconds'] * 1e3 / totals['requests']
+        totals['serialization_ms_per_request'] = totals['serialization_seconds'] * 1e3 / totals['requests']
+        totals['response_bytes_per_request'] = totals['response_bytes'] / totals['requests']
+    return jsonify({'endpoints': endpoints})
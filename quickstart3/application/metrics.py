@@ -0,0 +1,283 @@
+"""Prometheus metrics: rate, errors and latency of each route, connection pools and caches
+
+Every request is counted by route ('/persons/<int:id>', ...), method and status, so the
+error rate is the rate of the 5xx statuses, and its duration, streaming included, is counted
+in a histogram by route and method. The routes of the resources of create_api_endpoints are
+reported from the start, with no requests.
+
+The other metrics are read when METRICS_ENDPOINT is scraped: the connections of the pools
+of the engines, the hits and misses of the caches, and the totals of the instrumentation.
+They are served in the Prometheus text format, to the clients of METRICS_ADDRESSES only:
+behind a reverse proxy on the same host, every client has the address of the proxy.
+"""
+
+import bisect
+import threading
+import time
+
+from application.instrumentation import check_client_address
+from flask import Response, current_app, request
+from sqlalchemy.pool import QueuePool
+
+# The keys of the start and status of a request in its environ
+START_KEY = 'application.metrics_start'
+STATUS_KEY = 'application.metrics_status'
+
+# The content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# The caches of app.extensions whose hits and misses are reported
+CACHES = ('count_cache', 'filter_cache', 'response_cache')
+
+# The totals of the instrumentation reported per endpoint, with their metric
+INSTRUMENTATION_METRICS = (('statements', 'sql_statements_total', 'SQL statements executed'),
+                           ('sql_seconds', 'sql_seconds_total', 'Time spent executing SQL statements'),
+                           ('serialization_seconds', 'serialization_seconds_total',
+                            'Time spent serializing the responses'),
+                           ('response_bytes', 'response_bytes_total', 'Bytes of the responses'))
+
+
+class ShardedCounters(object):
+    """Counters updated without locks by multi-threaded workers
+
+    Each thread adds to its own shard, a dict that only this thread writes to, and the shards
+    are summed when the counters are read. Copying a dict is atomic in CPython, so a read
+    never sees a shard in the middle of an update. The lock only guards the list of shards:
+    it is taken once by each thread, to register its shard, and by the reads. Both fold the
+    shards of the threads that ended into the totals of the past threads, so the shards of
+    a server that starts a thread per request do not pile up between scrapes.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = dict()
+        self._lock = threading.Lock()
+
+    def get_shard(self):
+        """Return the shard of the current thread"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = dict()
+            with self._lock:
+                self._retire_shards()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def add(self, key, amount=1):
+        """Add to a counter
+
+        :param tuple key: the key of the counter
+        :param amount: the amount added
+        """
+        shard = self.get_shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def snapshot(self):
+        """Return the totals of the counters"""
+        with self._lock:
+            self._retire_shards()
+            totals = dict(self._retired)
+            copies = [shard.copy() for thread, shard in self._shards]
+        for copy in copies:
+            add_counts(totals, copy)
+        return totals
+
+    def _retire_shards(self):
+        """Fold the shards of the threads that ended into the totals of the past threads,
+        with the lock held"""
+        shards = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                shards.append((thread, shard))
+            else:
+                add_counts(self._retired, shard)
+        self._shards = shards
+
+
+def add_counts(totals, counts):
+    """Add counts to totals, in place"""
+    for key, value in counts.items():
+        totals[key] = totals.get(key, 0) + value
+
+
+class RequestMetrics(object):
+    """Counts and durations of the requests of each route
+
+    :param iterable buckets: the upper bounds of the buckets of the latency histogram, in seconds
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counters = ShardedCounters()
+        self.routes = set()
+
+    def declare_route(self, route, method):
+        """Report a route before it is requested"""
+        self.routes.add((route, method))
+
+    def observe(self, route, method, status, seconds):
+        """Count a finished request
+
+        :param str route: the url rule of the request
+        :param str method: the method of the request
+        :param int status: the status of the response
+        :param float seconds: the duration of the request
+        """
+        self.counters.add(('requests', route, method, status))
+        self.counters.add(('bucket', route, method, bisect.bisect_left(self.buckets, seconds)))
+        self.counters.add(('seconds', route, method), seconds)
+
+
+def init_metrics(app, api, engines):
+    """Count the requests of an application, and serve its metrics on METRICS_ENDPOINT
+
+    :param Flask app: the application
+    :param Api api: the api whose routes are reported from the start
+    :param dict engines: the engine of each bind, None for the database
+    """
+    metrics = RequestMetrics(app.config['METRICS_LATENCY_BUCKETS'])
+    for resource in api.resources:
+        for url in resource['urls']:
+            for method in resource['resource'].methods:
+                metrics.declare_route(url, method)
+
+    app.extensions['metrics'] = metrics
+    app.extensions['metrics_engines'] = dict(engines)
+    app.before_request(start_timer)
+    app.after_request(record_status)
+    app.teardown_request(record_request)
+    app.add_url_rule(app.config['METRICS_ENDPOINT'], 'metrics', get_metrics)
+
+
+def start_timer():
+    """Start the timer of a request"""
+    request.environ[START_KEY] = time.perf_counter()
+
+
+def record_status(response):
+    """Keep the status of a response, until its request is counted"""
+    request.environ[STATUS_KEY] = response.status_code
+    return response
+
+
+def record_request(exc):
+    """Count a request at its end, once a streamed response is sent
+
+    A request that failed before its response was made is counted as a 500.
+    """
+    start = request.environ.pop(START_KEY, None)
+    status = request.environ.pop(STATUS_KEY, 500)
+    if start is None or request.endpoint == 'metrics':
+        return
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    current_app.extensions['metrics'].observe(route, request.method, status, time.perf_counter() - start)
+
+
+def get_metrics():
+    """Serve the metrics in the Prometheus text format"""
+    check_client_address(current_app.config['METRICS_ADDRESSES'])
+    return Response(render_metrics(current_app), content_type=CONTENT_TYPE)
+
+
+def render_metrics(app):
+    """Return the metrics of an application in the Prometheus text format"""
+    lines = []
+    render_requests(lines, app.extensions['metrics'])
+    render_pools(lines, app.extensions['metrics_engines'])
+    render_caches(lines, app.extensions)
+    if 'endpoint_stats' in app.extensions:
+        render_instrumentation(lines, app.extensions['endpoint_stats'].snapshot())
+    return '\n'.join(lines) + '\n'
+
+
+def render_requests(lines, metrics):
+    """Render the request counts and the latency histogram of each route"""
+    counts = metrics.counters.snapshot()
+
+    add_header(lines, 'http_requests_total', 'counter', 'Requests by route, method and status')
+    for key in sorted(key for key in counts if key[0] == 'requests'):
+        lines.append(format_sample('http_requests_total',
+                                   [('route', key[1]), ('method', key[2]), ('status', key[3])],
+                                   counts[key]))
+
+    add_header(lines, 'http_request_duration_seconds', 'histogram', 'Duration of the requests')
+    routes = metrics.routes.union(key[1:3] for key in counts if key[0] == 'seconds')
+    for route, method in sorted(routes):
+        labels = [('route', route), ('method', method)]
+        total = 0
+        for index, bound in enumerate(metrics.buckets + (float('inf'),)):
+            total += counts.get(('bucket', route, method, index), 0)
+            lines.append(format_sample('http_request_duration_seconds_bucket',
+                                       labels + [('le', format_value(bound))], total))
+        lines.append(format_sample('http_request_duration_seconds_sum', labels,
+                                   counts.get(('seconds', route, method), 0.0)))
+        lines.append(format_sample('http_request_duration_seconds_count', labels, total))
+
+
+def render_pools(lines, engines):
+    """Render the connections of the pools that keep a queue of connections
+
+    The pool of a bind is saturated when its checked out connections reach its size
+    plus SQLALCHEMY_MAX_OVERFLOW, further requests wait for SQLALCHEMY_POOL_TIMEOUT seconds.
+    """
+    pools = sorted((bind or 'default', engine.pool) for bind, engine in engines.items()
+                   if isinstance(engine.pool, QueuePool))
+    for name, help_, get_value in (('db_pool_size', 'Connections kept open by the pool', QueuePool.size),
+                                   ('db_pool_checked_out', 'Connections in use', QueuePool.checkedout),
+                                   ('db_pool_overflow', 'Connections opened beyond the size of the pool',
+                                    QueuePool.overflow)):
+        add_header(lines, name, 'gauge', help_)
+        for bind, pool in pools:
+            lines.append(format_sample(name, [('bind', bind)], max(get_value(pool), 0)))
+
+
+def render_caches(lines, extensions):
+    """Render the hits and misses of the caches"""
+    caches = [(name, extensions[name]) for name in CACHES if hasattr(extensions.get(name), 'hits')]
+    for name, help_ in (('hits', 'Lookups that found their key'), ('misses', 'Lookups that missed their key')):
+        add_header(lines, 'cache_{}_total'.format(name), 'counter', help_)
+        for cache_name, cache in caches:
+            lines.append(format_sample('cache_{}_total'.format(name), [('cache', cache_name)],
+                                       getattr(cache, name)))
+
+
+def render_instrumentation(lines, endpoints):
+    """Render the totals of the instrumentation of each endpoint"""
+    for field, name, help_ in INSTRUMENTATION_METRICS:
+        add_header(lines, name, 'counter', help_)
+        for endpoint, totals in sorted(endpoints.items()):
+            lines.append(format_sample(name, [('endpoint', endpoint)], totals[field]))
+
+
+def add_header(lines, name, type_, help_):
+    """Add the HELP and TYPE lines of a metric"""
+    lines.append('# HELP {} {}'.format(name, help_))
+    lines.append('# TYPE {} {}'.format(name, type_))
+
+
+def format_sample(name, labels, value):
+    """Return the line of a sample
+
+    :param str name: the name of the metric
+    :param list labels: the (name, value) pairs of the labels of the sample
+    :param value: the value of the sample
+    """
+    if not labels:
+        return '{} {}'.format(name, format_value(value))
+    return '{}{{{}}} {}'.format(name,
+                                ','.join('{}="{}"'.format(label, escape_label(value)) for label, value in labels),
+                                format_value(value))
+
+
+def escape_label(value):
+    """Escape the value of a label"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    """Format the value of a sample, or the bound of a bucket"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
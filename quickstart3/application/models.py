@@ -4,15 +4,15 @@ from application import db
 # Flask-REST-JSONAPI: Create data storage
 class Person(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    email = db.Column(db.String)
+    name = db.Column(db.String, index=True)
+    email = db.Column(db.String, index=True)
     birth_date = db.Column(db.Date)
     password = db.Column(db.String)
 
 
 class Computer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    serial = db.Column(db.String)
-    person_id = db.Column(db.Integer, db.ForeignKey('person.id'))
+    serial = db.Column(db.String, index=True)
+    person_id = db.Column(db.Integer, db.ForeignKey('person.id'), index=True)
     person = db.relationship('Person', backref=db.backref('computers'))
 
@@ -11,3 +11,114 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool of the engine. The connections are checked with a ping when they are
+    # taken from the pool, and reopened after SQLALCHEMY_POOL_RECYCLE seconds.
+    # A file-backed SQLite database is pooled too, so its pragmas are set once per connection.
+    SQLALCHEMY_POOL_SIZE = 5
+    SQLALCHEMY_MAX_OVERFLOW = 10
+    SQLALCHEMY_POOL_TIMEOUT = 30
+    SQLALCHEMY_POOL_RECYCLE = 3600
+    SQLALCHEMY_POOL_PRE_PING = True
+
+    # Pragmas set on every new SQLite connection, {} to keep the defaults of SQLite.
+    # In WAL mode readers do not block the writer and the writer does not block the readers,
+    # and with synchronous=NORMAL a commit does not wait for the disk (the database stays
+    # consistent, the last commits can be lost by a power failure). A writer waits up to
+    # busy_timeout milliseconds for another one, instead of failing with "database is locked".
+    # mmap_size is in bytes, a negative cache_size is in KiB.
+    SQLITE_PRAGMAS = {'journal_mode': 'wal',
+                      'synchronous': 'normal',
+                      'busy_timeout': 5000,
+                      'mmap_size': 256 * 1024 * 1024,
+                      'cache_size': -64 * 1024}
+
+    # Read replicas: the GET requests read from one of the SQLALCHEMY_REPLICAS database URIs,
+    # chosen by REPLICA_STRATEGY ('round-robin' or 'least-loaded' for the fewest requests in
+    # progress), the other requests use SQLALCHEMY_DATABASE_URI. After a write, the client
+    # reads from the primary for REPLICA_STICKINESS seconds (REPLICA_STICKY_COOKIE cookie),
+    # so it reads its own writes while they are replicated. [] to read from the primary.
+    SQLALCHEMY_REPLICAS = []
+    REPLICA_STRATEGY = 'round-robin'
+    REPLICA_STICKINESS = 10
+    REPLICA_STICKY_COOKIE = 'read_primary_until'
+
+    # Flask-REST-JSONAPI: how resource lists report meta.count
+    # - 'exact' : count all objects matching the filters
+    # - 'none'  : omit meta.count, and the last page link
+    # - 'capped': count up to COUNT_CAP objects, and report "COUNT_CAP+" beyond
+    # - 'cached': exact count, cached for COUNT_CACHE_TIMEOUT seconds, or until a write
+    #             to the counted type or a type it can be filtered on
+    # Can be overwritten per resource with the 'count_mode' data layer option,
+    # and per request with the page[count] querystring parameter.
+    COUNT_MODE = 'exact'
+    COUNT_CAP = 1000
+    COUNT_CACHE_TIMEOUT = 60
+    COUNT_CACHE_SIZE = 1024
+
+    # Flask-REST-JSONAPI: cache of the responses of GET requests
+    # Writes through the API invalidate the cached responses of the types they change,
+    # writes made outside of the API are only seen once the responses expire.
+    # RESPONSE_CACHE_BACKEND is a CacheBackend (see application/cache.py) shared by
+    # the processes, None for an in-process cache of RESPONSE_CACHE_SIZE responses.
+    RESPONSE_CACHE = False
+    RESPONSE_CACHE_TIMEOUT = 60
+    RESPONSE_CACHE_SIZE = 1024
+    RESPONSE_CACHE_BACKEND = None
+
+    # Instrumentation of the requests (see application/instrumentation.py): the SQL statements,
+    # SQL time, serialization time and response size of each endpoint are served as JSON by
+    # INSTRUMENTATION_ENDPOINT, None to not serve them, to the client addresses of
+    # INSTRUMENTATION_ADDRESSES only (behind a local reverse proxy, every client is 127.0.0.1).
+    # SERVER_TIMING reports the stats of each request in a Server-Timing header, None to
+    # report them in debug only.
+    INSTRUMENTATION = True
+    INSTRUMENTATION_ENDPOINT = '/stats'
+    INSTRUMENTATION_ADDRESSES = ('127.0.0.1', '::1')
+    SERVER_TIMING = None
+
+    # Prometheus metrics (see application/metrics.py): the requests, errors and latency of each
+    # route, the connections of the pools and the hits of the caches, served in the Prometheus
+    # text format by METRICS_ENDPOINT to the client addresses of METRICS_ADDRESSES only
+    # (behind a local reverse proxy, every client is 127.0.0.1).
+    # The latencies are counted in histogram buckets of METRICS_LATENCY_BUCKETS seconds.
+    METRICS = True
+    METRICS_ENDPOINT = '/metrics'
+    METRICS_ADDRESSES = ('127.0.0.1', '::1')
+    METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    # Index advisor: the columns compared by the filters of the requests, and their operators,
+    # are counted in app.extensions['filter_usage'], and logged to FILTER_USAGE_LOG if it is set.
+    # Run `flask index-advisor` to report the filtered columns whose filters no index serves.
+    FILTER_USAGE_LOG = None
+
+    # Flask-REST-JSONAPI: number of compiled filter templates kept in the cache,
+    # filters that only differ by their values share a template
+    FILTER_CACHE_SIZE = 256
+
+    # Flask-REST-JSONAPI: encoder of the documents returned by the resources
+    # 'orjson' or 'ujson' if installed, 'json' for the standard library, or 'auto'
+    # for the fastest one installed. The documents are encoded in compact UTF-8 JSON.
+    JSONAPI_ENCODER = 'auto'
+
+    # Flask-REST-JSONAPI: resource lists stream the pages of STREAM_PAGE_SIZE objects or more,
+    # and the unpaginated ones (page[size]=0), instead of building them in memory.
+    # The objects are fetched and serialized STREAM_YIELD_PER at a time.
+    # Streamed responses have no ETag and are not cached. None to never stream.
+    STREAM_PAGE_SIZE = 1000
+    STREAM_YIELD_PER = 100
+
+    # Flask-REST-JSONAPI: number of rows fetched, and written, at a time by the exports
+    # (/persons/export, /computers/export)
+    EXPORT_YIELD_PER = 1000
+
+    # Number of lines of NDJSON imported per transaction by `flask import-ndjson`
+    IMPORT_CHUNK_SIZE = 500
+
+    # ASGI serving mode (see application/asgi.py): the lists and details of the resources are
+    # served with async sessions, on ASGI_DATABASE_URI, or on SQLALCHEMY_DATABASE_URI with the
+    # aiosqlite driver if it is None. Its engine is pooled like the engine of the database.
+    # The other requests are handled at most ASGI_MAX_WORKERS at a time, in a pool of threads,
+    # more requests wait in the event loop of the server.
+    # Keep it below SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW.
+    ASGI_DATABASE_URI = None
+    ASGI_MAX_WORKERS = 15
@@ -1,4 +1,5 @@
 from application import create_app, db
+from application.cli import register_commands
 
 # Create an instance of the application
 app = create_app()
@@ -8,6 +9,9 @@ app = create_app()
 with app.app_context():
     db.create_all()
 
+# Commands of the flask command line, see application/cli.py
+register_commands(app)
+
 
 if __name__ == '__main__':
     # Start application
@@ -1,3 +1,9 @@
+import json
+
+from application import db
+from sqlalchemy import event
+
+
 def ordered(obj):
     """Sorts a json dictionary, so we can do a compare.
 
@@ -16,3 +22,94 @@ def ordered(obj):
         return sorted(ordered(x) for x in obj)
     else:
         return obj
+
+
+class QueryCounter(object):
+    """Counts the SQL statements executed on an engine within a with block.
+
+    For example:
+        with QueryCounter(db.engine) as counter:
+            self.client().get('/computers')
+        self.assertEqual(counter.count, 2)
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+class ApiTestMixin(object):
+    """Requests of the api for the test cases, with their headers and a count of their statements.
+
+    The test case has a client attribute, the test client factory of the application.
+    """
+    headers = {
+        'Content-Type': 'application/vnd.api+json',
+        'Accept': 'application/vnd.api+json'
+        }
+
+    def request(self, method, url, data=None, **headers):
+        """Returns the response of a request and the number of statements it executed."""
+        headers = dict(self.headers, **headers)
+        with QueryCounter(db.engine) as counter:
+            response = getattr(self.client(), method)(url,
+                                                      headers=headers,
+                                                      data=json.dumps(data) if data is not None else None)
+        return response, counter.count
+
+    def get(self, url, **headers):
+        """Returns the response of a GET request, its decoded document and its QueryCounter."""
+        headers = dict(self.headers, **headers)
+        with QueryCounter(db.engine) as counter:
+            response = self.client().get(url, headers=headers)
+        response_data = json.loads(response.data.decode()) if response.data else None
+        return response, response_data, counter
+
+    def create_computer(self, serial):
+        """Adds a computer, without owner."""
+        response, count = self.request('post', '/computers', {
+            "data": {
+                "type": "computer",
+                "attributes": {
+                    "serial": serial
+                }
+            }
+        })
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def create_person(self, name, email=None, birth_date=None, computer_ids=()):
+        """Adds a person, who owns the computers of the given ids."""
+        data = {
+            "data": {
+                "type": "person",
+                "attributes": {
+                  "name": name,
+                  "email": email or "{}@gmail.com".format(name.lower())
+                }
+              }
+            }
+        if birth_date is not None:
+            data["data"]["attributes"]["birth_date"] = birth_date
+        if computer_ids:
+            data["data"]["relationships"] = {
+                "computers": {
+                    "data": [{"type": "computer", "id": str(id_)} for id_ in computer_ids]
+                }
+            }
+        response, count = self.request('post', '/persons', data)
+        self.assertEqual(response.status_code, 201)
+        return response
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import asyncio
+import shutil
+import tempfile
+from config import Config
+from application import create_app, db
+from application.asgi import AsgiApplication, get_environ
+from application.models import Computer, Person
+import io
+import json
+
+"""Tests of the ASGI serving mode"""
+
+class TestConfig(Config):
+    TESTING = True
+    ASGI_MAX_WORKERS = 4
+    EXPORT_YIELD_PER = 2
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        # the requests run in several threads, which share a file-backed database
+        self.directory = tempfile.mkdtemp()
+        config_class = type('FileConfig', (TestConfig,),
+                            {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.directory, 'test.db')})
+        self.app = create_app(config_class)
+        self.asgi = AsgiApplication(self.app)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        self.asgi.executor.shutdown()
+        self.loop.run_until_complete(self.asgi.engine.dispose())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        db.session.remove()
+        db.drop_all()
+        db.get_engine(self.app).dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    async def request(self, method, path, query_string=b'', data=None, headers=()):
+        body = json.dumps(data).encode() if data is not None else b''
+        # the body is received in two parts
+        messages = [{'type': 'http.request', 'body': body[:10], 'more_body': True},
+                    {'type': 'http.request', 'body': body[10:], 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string,
+                 'headers': [(b'content-type', b'application/vnd.api+json'),
+                             (b'accept', b'application/vnd.api+json')] + list(headers)}
+        await self.asgi(scope, receive, send)
+        return sent
+
+    def run_request(self, *args, **kwargs):
+        return self.loop.run_until_complete(self.request(*args, **kwargs))
+
+    def create_person(self, name):
+        return {'data': {'type': 'person', 'attributes': {'name': name, 'email': 'john@gmail.com'}}}
+
+    def test_request(self):
+        """Requests are handled by the routes of the application"""
+        sent = self.run_request('POST', '/persons', data=self.create_person('John'))
+        self.assertEqual(sent[0]['type'], 'http.response.start')
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertIn((b'content-type', b'application/vnd.api+json'), sent[0]['headers'])
+        self.assertFalse(sent[-1]['more_body'])
+
+        sent = self.run_request('GET', '/persons', b'fields[person]=display_name')
+        self.assertEqual(sent[0]['status'], 200)
+        document = json.loads(b''.join(message['body'] for message in sent[1:]).decode())
+        self.assertEqual(document['data'][0]['attributes'], {'display_name': 'JOHN <john@gmail.com>'})
+
+        sent = self.run_request('GET', '/persons/2/computers')
+        self.assertEqual(sent[0]['status'], 404)
+
+    def get_document(self, sent):
+        return json.loads(b''.join(message['body'] for message in sent[1:]).decode())
+
+    def test_async_routes(self):
+        """The lists and details are served with async sessions, like the WSGI application serves them"""
+        # the thread pool of the WSGI application is not used
+        self.asgi.executor.shutdown()
+
+        sent = self.run_request('POST', '/persons', data=self.create_person('John'))
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertIn((b'location', b'http://localhost/persons/1'), sent[0]['headers'])
+        computer = {'data': {'type': 'computer', 'attributes': {'serial': 'Amstrad'}}}
+        sent = self.run_request('POST', '/persons/1/computers', data=computer)
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertEqual(Computer.query.get(1).person_id, 1)
+        db.session.remove()
+        sent = self.run_request('PATCH', '/persons/1', data={'data': {'type': 'person', 'id': '1',
+                                                                      'attributes': {'name': 'Jane'}}})
+        self.assertEqual(sent[0]['status'], 200)
+
+        client = self.app.test_client()
+        headers = {'Accept': 'application/vnd.api+json'}
+        filter_ = json.dumps([{'name': 'computers', 'op': 'any', 'val': {'name': 'serial', 'op': 'eq',
+                                                                         'val': 'Amstrad'}}])
+        for path, query_string in (('/persons', 'include=computers&sort=-name&filter=' + filter_),
+                                   ('/persons', 'page[count]=capped&page[size]=1'),
+                                   ('/persons/1', 'include=computers.owner'),
+                                   ('/persons/1/computers', 'fields[computer]=serial'),
+                                   ('/computers/1/owner', ''),
+                                   ('/computers/1', 'include=owner')):
+            sent = self.run_request('GET', path, query_string.encode())
+            response = client.get(path, query_string=query_string, headers=headers)
+            db.session.remove()
+            self.assertEqual(sent[0]['status'], 200)
+            self.assertEqual(self.get_document(sent), json.loads(response.data.decode()))
+            self.assertIn((b'etag', response.headers['ETag'].encode()), sent[0]['headers'])
+
+        sent = self.run_request('DELETE', '/persons/1')
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(Person.query.count(), 0)
+
+    def test_async_errors(self):
+        """The errors of the requests served with async sessions are the ones of the WSGI application"""
+        sent = self.run_request('GET', '/persons/2/computers')
+        self.assertEqual(sent[0]['status'], 404)
+        self.assertEqual(self.get_document(sent)['errors'][0]['source'], {'parameter': 'id'})
+
+        sent = self.run_request('GET', '/computers/3/owner')
+        self.assertEqual(sent[0]['status'], 404)
+
+        sent = self.run_request('POST', '/persons', data={'data': {'type': 'computer', 'attributes': {}}})
+        self.assertEqual(sent[0]['status'], 409)
+
+        sent = self.run_request('PATCH', '/persons/1', data={'data': {'type': 'person', 'id': '2'}})
+        self.assertEqual(sent[0]['status'], 400)
+
+        sent = self.run_request('PATCH', '/persons/1', data={'data': {'type': 'person', 'id': '1'}})
+        self.assertEqual(sent[0]['status'], 404)
+
+        sent = self.run_request('POST', '/persons', data=self.create_person('John'),
+                                headers=[(b'content-type', b'application/vnd.api+json; charset=utf-8')])
+        self.assertEqual(sent[0]['status'], 415)
+
+    def test_async_conditional(self):
+        """The GET requests served with async sessions are conditional"""
+        self.run_request('POST', '/persons', data=self.create_person('John'))
+        sent = self.run_request('GET', '/persons/1')
+        etag = dict(sent[0]['headers'])[b'etag']
+
+        sent = self.run_request('GET', '/persons/1', headers=[(b'if-none-match', etag)])
+        self.assertEqual(sent[0]['status'], 304)
+        self.assertEqual(sent[1]['body'], b'')
+
+    def test_streamed_response(self):
+        """A streamed response is sent in several chunks"""
+        db.session.add_all([Person(name='Person {}'.format(index)) for index in range(5)])
+        db.session.commit()
+
+        sent = self.run_request('GET', '/persons/export', b'format=ndjson')
+        self.assertEqual(sent[0]['status'], 200)
+        chunks = [message['body'] for message in sent[1:] if message['body']]
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(b''.join(chunks).splitlines()), 5)
+
+    def test_concurrency(self):
+        """More requests than threads run concurrently"""
+        requests = [self.request('POST', '/persons', data=self.create_person('Person {}'.format(index)))
+                    for index in range(20)]
+        requests += [self.request('GET', '/persons') for index in range(20)]
+        responses = self.loop.run_until_complete(asyncio.gather(*requests))
+
+        self.assertEqual(sorted(sent[0]['status'] for sent in responses), [200] * 20 + [201] * 20)
+        self.assertEqual(Person.query.count(), 20)
+
+    def test_lifespan(self):
+        """The startup and shutdown of the server are acknowledged"""
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        self.loop.run_until_complete(self.asgi({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+    def test_environ(self):
+        """The WSGI environ is built from the scope"""
+        scope = {'type': 'http', 'method': 'GET', 'path': '/persons/é', 'query_string': b'a=1',
+                 'server': ('example.com', 8000), 'client': ('10.0.0.1', 1234), 'scheme': 'https',
+                 'headers': [(b'accept', b'a'), (b'accept', b'b'), (b'content-type', b'text/plain')]}
+        environ = get_environ(scope, io.BytesIO(b'body'))
+        self.assertEqual(environ['PATH_INFO'], '/persons/\xc3\xa9')
+        self.assertEqual(environ['QUERY_STRING'], 'a=1')
+        self.assertEqual((environ['SERVER_NAME'], environ['SERVER_PORT']), ('example.com', '8000'))
+        self.assertEqual(environ['REMOTE_ADDR'], '10.0.0.1')
+        self.assertEqual(environ['wsgi.url_scheme'], 'https')
+        self.assertEqual(environ['HTTP_ACCEPT'], 'a,b')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['CONTENT_LENGTH'], '4')
+
+
+if __name__ == "__main__":
+    unittest.main()
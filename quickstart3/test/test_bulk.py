@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.models import Computer, Person
+import json
+from my_utils import QueryCounter
+
+"""Tests of bulk requests, which create, update or delete many objects at once"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def request(self, method, url, data):
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        with QueryCounter(db.engine) as counter:
+            response = getattr(self.client(), method)(url,
+                                                      headers=headers,
+                                                      data=json.dumps(data))
+        response_data = json.loads(response.data.decode())
+        db.session.remove()
+        return response, response_data, counter
+
+    def create_computers(self, number_of_computers, url='/computers'):
+        data = {
+            "data": [
+                {
+                    "type": "computer",
+                    "attributes": {
+                        "serial": "Computer {}".format(i + 1)
+                    }
+                } for i in range(number_of_computers)
+            ]
+        }
+        return self.request('post', url, data)
+
+    def test_create(self):
+        """Creating computers in bulk returns them in order, without a query per computer"""
+        response, response_data, counter = self.create_computers(50)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([computer['id'] for computer in response_data['data']],
+                         [str(i + 1) for i in range(50)])
+        self.assertEqual(response_data['data'][49]['attributes']['serial'], 'Computer 50')
+        self.assertEqual(Computer.query.count(), 50)
+        # the computers are reloaded with a single query after the commit
+        self.assertEqual(len([statement for statement in counter.statements if statement.startswith('SELECT')]), 1)
+
+    def test_create_with_relationships(self):
+        """The related objects of a bulk request are loaded together"""
+        self.create_computers(4)
+
+        data = {
+            "data": [
+                {
+                    "type": "person",
+                    "attributes": {
+                        "name": name,
+                        "email": "{}@gmail.com".format(name.lower())
+                    },
+                    "relationships": {
+                        "computers": {
+                            "data": [{"type": "computer", "id": str(2 * i + 1)},
+                                     {"type": "computer", "id": str(2 * i + 2)}]
+                        }
+                    }
+                } for i, name in enumerate(["John", "Mary"])
+            ]
+        }
+        response, response_data, counter = self.request('post', '/persons', data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([person['attributes']['display_name'] for person in response_data['data']],
+                         ['JOHN <john@gmail.com>', 'MARY <mary@gmail.com>'])
+        self.assertEqual([computer.person_id for computer in Computer.query.order_by(Computer.id)], [1, 1, 2, 2])
+        # the computers before the commit, the persons and their computer ids after the commit
+        self.assertEqual(len([statement for statement in counter.statements if statement.startswith('SELECT')]), 3)
+
+    def test_create_in_nested_collection(self):
+        """Computers created in bulk in /persons/<id>/computers belong to the person"""
+        response, response_data, counter = self.request('post', '/persons', {
+            "data": {
+                "type": "person",
+                "attributes": {
+                    "name": "John",
+                    "email": "john@gmail.com"
+                }
+            }
+        })
+
+        response, response_data, counter = self.create_computers(3, url='/persons/1/computers')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([computer.person_id for computer in Computer.query], [1, 1, 1])
+
+    def test_invalid_create(self):
+        """Nothing is created if an object is invalid"""
+        data = {
+            "data": [
+                {"type": "computer", "attributes": {"serial": "Amstrad"}},
+                {"type": "computer", "attributes": {"serial": 3}}
+            ]
+        }
+        response, response_data, counter = self.request('post', '/computers', data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response_data['errors'][0]['source']['pointer'], '/data/1/attributes/serial')
+
+        data['data'][1] = {"type": "person", "attributes": {"name": "John"}}
+        response, response_data, counter = self.request('post', '/computers', data)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response_data['errors'][0]['source']['pointer'], '/data/1/type')
+
+        data['data'][1] = {"type": "computer", "relationships": {"owner": {"data": {"type": "person", "id": "9"}}}}
+        response, response_data, counter = self.request('post', '/computers', data)
+        self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(Computer.query.count(), 0)
+
+    def test_update(self):
+        """Updating computers in bulk"""
+        self.create_computers(3)
+
+        data = {
+            "data": [
+                {"type": "computer", "id": "3", "attributes": {"serial": "Amstrad"}},
+                {"type": "computer", "id": "1", "attributes": {"serial": "Halo"}}
+            ]
+        }
+        response, response_data, counter = self.request('patch', '/computers', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([computer['id'] for computer in response_data['data']], ['3', '1'])
+        self.assertEqual([computer.serial for computer in Computer.query.order_by(Computer.id)],
+                         ['Halo', 'Computer 2', 'Amstrad'])
+
+    def test_invalid_update(self):
+        """Nothing is updated if an object is missing or invalid"""
+        self.create_computers(2)
+
+        data = {
+            "data": [
+                {"type": "computer", "id": "1", "attributes": {"serial": "Amstrad"}},
+                {"type": "computer", "id": "5", "attributes": {"serial": "Halo"}}
+            ]
+        }
+        response, response_data, counter = self.request('patch', '/computers', data)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response_data['errors'][0]['source']['pointer'], '/data/1/id')
+
+        data['data'][1] = {"type": "person", "id": "2", "attributes": {"name": "John"}}
+        response, response_data, counter = self.request('patch', '/computers', data)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response_data['errors'][0]['source']['pointer'], '/data/1/type')
+
+        data['data'][1] = {"type": "computer", "attributes": {"serial": "Halo"}}
+        response, response_data, counter = self.request('patch', '/computers', data)
+        self.assertEqual(response.status_code, 400)
+
+        response, response_data, counter = self.request('patch', '/computers', data['data'][0])
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual([computer.serial for computer in Computer.query.order_by(Computer.id)],
+                         ['Computer 1', 'Computer 2'])
+
+    def test_delete(self):
+        """Deleting computers in bulk"""
+        self.create_computers(4)
+
+        data = {
+            "data": [
+                {"type": "computer", "id": "2"},
+                {"type": "computer", "id": "4"}
+            ]
+        }
+        response, response_data, counter = self.request('delete', '/computers', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([computer.id for computer in Computer.query.order_by(Computer.id)], [1, 3])
+
+        # computer 2 has been deleted already
+        data['data'][1]['id'] = "1"
+        response, response_data, counter = self.request('delete', '/computers', data)
+        self.assertEqual(response.status_code, 404)
+
+        data['data'][0] = {"type": "person", "id": "3"}
+        response, response_data, counter = self.request('delete', '/computers', data)
+        self.assertEqual(response.status_code, 409)
+
+        self.assertEqual([computer.id for computer in Computer.query.order_by(Computer.id)], [1, 3])
+
+
+    def create_persons(self, number_of_persons):
+        db.session.add_all([Person(name='Person {}'.format(i + 1)) for i in range(number_of_persons)])
+        db.session.commit()
+
+    def relationship_data(self, ids):
+        return {"data": [{"type": "computer", "id": str(id_)} for id_ in ids]}
+
+    def get_person_ids(self):
+        return [computer.person_id for computer in Computer.query.order_by(Computer.id)]
+
+    def test_relationship_queries(self):
+        """Writing the computers of a person takes the same queries for 2 or 40 computers"""
+        self.create_computers(40)
+        self.create_persons(1)
+
+        counts = []
+        for ids in (range(1, 3), range(1, 41)):
+            for method in ('post', 'delete', 'patch'):
+                response, response_data, counter = self.request(method, '/persons/1/relationships/computers',
+                                                                self.relationship_data(ids))
+                self.assertEqual(response.status_code, 200)
+                updates = [statement for statement in counter.statements if statement.startswith('UPDATE')]
+                self.assertEqual(len(updates), 1)
+                counts.append(counter.count)
+        self.assertEqual(counts[:3], counts[3:])
+
+    def test_create_relationship(self):
+        """Computers are added to a person, and taken from their previous owner"""
+        self.create_computers(4)
+        self.create_persons(2)
+
+        response, response_data, counter = self.request('post', '/persons/2/relationships/computers',
+                                                        self.relationship_data([3]))
+        self.assertEqual(response.status_code, 200)
+        response, response_data, counter = self.request('post', '/persons/1/relationships/computers',
+                                                        self.relationship_data([1, 3, 1]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(computer['id'] for computer in response_data['data']['relationships']['computers']['data']),
+                         ['1', '3'])
+        self.assertEqual(self.get_person_ids(), [1, None, 1, None])
+
+        # nothing changes
+        response = self.client().post('/persons/1/relationships/computers',
+                                      headers={'Content-Type': 'application/vnd.api+json'},
+                                      data=json.dumps(self.relationship_data([3])))
+        self.assertEqual(response.status_code, 204)
+
+    def test_update_relationship(self):
+        """The computers of a person are replaced"""
+        self.create_computers(4)
+        self.create_persons(2)
+        self.request('patch', '/persons/2/relationships/computers', self.relationship_data([4]))
+        self.request('patch', '/persons/1/relationships/computers', self.relationship_data([1, 2]))
+
+        response, response_data, counter = self.request('patch', '/persons/1/relationships/computers',
+                                                        self.relationship_data([2, 3, 4]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_person_ids(), [None, 1, 1, 1])
+
+        response, response_data, counter = self.request('patch', '/persons/1/relationships/computers',
+                                                        self.relationship_data([]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_person_ids(), [None, None, None, None])
+
+    def test_delete_relationship(self):
+        """Computers are removed from a person, the computers of other persons are ignored"""
+        self.create_computers(4)
+        self.create_persons(2)
+        self.request('patch', '/persons/1/relationships/computers', self.relationship_data([1, 2]))
+        self.request('patch', '/persons/2/relationships/computers', self.relationship_data([3]))
+
+        response, response_data, counter = self.request('delete', '/persons/1/relationships/computers',
+                                                        self.relationship_data([2, 3, 4]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_person_ids(), [1, None, 2, None])
+
+    def test_relationship_not_found(self):
+        """A missing computer fails the whole request"""
+        self.create_computers(2)
+        self.create_persons(1)
+
+        for method in ('post', 'patch'):
+            response, response_data, counter = self.request(method, '/persons/1/relationships/computers',
+                                                            self.relationship_data([1, 5, 2]))
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response_data['errors'][0]['detail'], 'Computer.id: 5 not found')
+            self.assertEqual(self.get_person_ids(), [None, None])
+
+        response, response_data, counter = self.request('post', '/persons/3/relationships/computers',
+                                                        self.relationship_data([1]))
+        self.assertEqual(response.status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
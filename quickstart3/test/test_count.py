@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from my_utils import ApiTestMixin
+
+"""Tests of the ways resource lists report meta.count"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    COUNT_CAP = 5
+
+
+class Tests(ApiTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_database(self, names=None):
+        """Adds 8 persons, or the persons of the given names."""
+        if names is None:
+            names = ["John", "Mary", "Dopey", "Halo", "Nestor", "Amstrad", "Comodor", "Sinclair"]
+
+        for name in names:
+            self.create_person(name)
+
+        db.session.remove()
+
+    def test_exact(self):
+        """By default, meta.count is the number of persons matching the filters"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/persons?page[size]=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_data['meta']['count'], 8)
+        self.assertIn('last', response_data['links'])
+
+    def test_none(self):
+        """page[count]=none skips the count query and the last link"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/persons?page[size]=3&page[count]=none')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('meta', response_data)
+        self.assertNotIn('last', response_data['links'])
+        self.assertNotIn('prev', response_data['links'])
+        self.assertIn('page%5Bnumber%5D=2', response_data['links']['next'])
+        self.assertFalse(any('count(' in statement for statement in counter.statements))
+
+        response, response_data, counter = self.get(response_data['links']['next'])
+        self.assertEqual([person['id'] for person in response_data['data']], ['4', '5', '6'])
+        self.assertIn('page%5Bnumber%5D=1', response_data['links']['prev'])
+
+        # the last page is not full, so there is no next page
+        response, response_data, counter = self.get(response_data['links']['next'])
+        self.assertEqual([person['id'] for person in response_data['data']], ['7', '8'])
+        self.assertNotIn('next', response_data['links'])
+
+    def test_capped(self):
+        """page[count]=capped counts up to COUNT_CAP persons"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/persons?page[size]=3&page[count]=capped')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_data['meta']['count'], '5+')
+        self.assertNotIn('last', response_data['links'])
+        self.assertIn('LIMIT', [statement for statement in counter.statements if 'count(' in statement][0])
+
+        # John, Dopey, Halo, Nestor and Comodor
+        response, response_data, counter = self.get('/persons?page[size]=3&page[count]=capped'
+                                                    '&filter=[{"name":"name","op":"like","val":"%o%"}]')
+        self.assertEqual(response_data['meta']['count'], 5)
+        self.assertIn('last', response_data['links'])
+
+    def test_cached(self):
+        """page[count]=cached reuses the count of a previous request with the same filters"""
+        self.populate_database(["John", "Mary"])
+
+        response, response_data, counter = self.get('/persons?page[count]=cached')
+        self.assertEqual(response_data['meta']['count'], 2)
+
+        response, response_data, counter = self.get('/persons?page[count]=cached&page[size]=1')
+        self.assertEqual(response_data['meta']['count'], 2)
+        self.assertFalse(any('count(' in statement for statement in counter.statements))
+
+        # other filters are counted separately
+        response, response_data, counter = self.get('/persons?page[count]=cached'
+                                                    '&filter=[{"name":"name","op":"eq","val":"John"}]')
+        self.assertEqual(response_data['meta']['count'], 1)
+
+        self.app.extensions['count_cache'].clear()
+        response, response_data, counter = self.get('/persons?page[count]=cached')
+        self.assertEqual(response_data['meta']['count'], 2)
+        self.assertTrue(any('count(' in statement for statement in counter.statements))
+
+    def test_cached_writes(self):
+        """The writes invalidate the cached counts of the types they change"""
+        self.populate_database(["John", "Mary"])
+
+        response, response_data, counter = self.get('/persons?page[count]=cached')
+        self.assertEqual(response_data['meta']['count'], 2)
+        response, response_data, counter = self.get('/persons/1/computers?page[count]=cached')
+        self.assertEqual(response_data['meta']['count'], 0)
+
+        # a creation
+        self.populate_database(["Dopey"])
+        response, response_data, counter = self.get('/persons?page[count]=cached')
+        self.assertEqual(response_data['meta']['count'], 3)
+
+        # a deletion
+        response, count = self.request('delete', '/persons/3')
+        self.assertEqual(response.status_code, 200)
+        response, response_data, counter = self.get('/persons?page[count]=cached')
+        self.assertEqual(response_data['meta']['count'], 2)
+
+        # a creation of a related type, in a nested collection
+        response, count = self.request('post', '/persons/1/computers', {
+            "data": {"type": "computer", "attributes": {"serial": "Amstrad"}}
+        })
+        self.assertEqual(response.status_code, 201)
+        response, response_data, counter = self.get('/persons/1/computers?page[count]=cached')
+        self.assertEqual(response_data['meta']['count'], 1)
+
+        # a filter on a related type
+        filter_ = '&filter=[{"name":"computers","op":"any","val":{"name":"serial","op":"eq","val":"Amstrad"}}]'
+        response, response_data, counter = self.get('/persons?page[count]=cached' + filter_)
+        self.assertEqual(response_data['meta']['count'], 1)
+        response, count = self.request('patch', '/computers/1', {
+            "data": {"type": "computer", "id": "1", "attributes": {"serial": "Sinclair"}}
+        })
+        self.assertEqual(response.status_code, 200)
+        response, response_data, counter = self.get('/persons?page[count]=cached' + filter_)
+        self.assertEqual(response_data['meta']['count'], 0)
+
+    def test_config(self):
+        """COUNT_MODE sets the count mode of requests without page[count]"""
+        self.populate_database()
+
+        self.app.config['COUNT_MODE'] = 'none'
+        response, response_data, counter = self.get('/persons')
+        self.assertNotIn('meta', response_data)
+
+        response, response_data, counter = self.get('/persons?page[count]=exact')
+        self.assertEqual(response_data['meta']['count'], 8)
+
+    def test_invalid_count(self):
+        """An unknown count mode is a bad request"""
+        response, response_data, counter = self.get('/persons?page[count]=approximate')
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import shutil
+import tempfile
+import threading
+from config import Config
+from application import create_app, db
+from application.models import Person
+import json
+from sqlalchemy.pool import QueuePool, StaticPool
+
+"""Tests of the connection pool and of the pragmas of the SQLite connections"""
+
+class TestConfig(Config):
+    TESTING = True
+
+
+# The engine options of Flask-SQLAlchemy and SQLite: no pool and no pragmas. The sqlite3 module
+# waits 5 seconds for a lock by default, SQLite itself does not wait.
+DEFAULT_SETTINGS = {'SQLALCHEMY_POOL_SIZE': None, 'SQLALCHEMY_MAX_OVERFLOW': None, 'SQLALCHEMY_POOL_TIMEOUT': None,
+                    'SQLALCHEMY_POOL_PRE_PING': False, 'SQLITE_PRAGMAS': {},
+                    'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 0}}}
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        # a file-backed database, WAL mode does not apply to in-memory databases
+        self.directory = tempfile.mkdtemp()
+        self.app = self.create_app('test.db', {})
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.get_engine(self.app).dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def create_app(self, filename, settings):
+        """Create an application on a database file of the temporary directory"""
+        settings = dict(settings, SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.directory, filename))
+        return create_app(type('FileConfig', (TestConfig,), settings))
+
+    def test_pragmas(self):
+        """The pragmas of SQLITE_PRAGMAS are set on the connections"""
+        connection = db.engine.connect()
+        self.assertEqual(connection.execute('PRAGMA journal_mode').scalar(), 'wal')
+        self.assertEqual(connection.execute('PRAGMA synchronous').scalar(), 1)
+        self.assertEqual(connection.execute('PRAGMA busy_timeout').scalar(), 5000)
+        self.assertEqual(connection.execute('PRAGMA cache_size').scalar(), -64 * 1024)
+        connection.close()
+
+    def test_pool(self):
+        """The connections of a file-backed database are pooled, the ones of an in-memory database are not"""
+        self.assertIsInstance(db.engine.pool, QueuePool)
+        self.assertEqual(db.engine.pool.size(), 5)
+        self.assertTrue(db.engine.pool._pre_ping)
+
+        class MemoryConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+        self.assertIsInstance(db.get_engine(create_app(MemoryConfig)).pool, StaticPool)
+
+    def test_concurrency(self):
+        """Concurrent readers and writers all succeed"""
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        statuses = []
+
+        def write(thread):
+            for index in range(20):
+                data = {'data': {'type': 'person', 'attributes': {'name': 'Person {} {}'.format(thread, index)}}}
+                response = self.client().post('/persons', headers=headers, data=json.dumps(data))
+                statuses.append(response.status_code)
+
+        def read():
+            for index in range(20):
+                response = self.client().get('/persons?page[size]=10', headers=headers)
+                statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=write, args=(thread,)) for thread in range(4)]
+        threads += [threading.Thread(target=read) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(set(statuses)), [200, 201])
+        self.assertEqual(statuses.count(201), 80)
+        self.assertEqual(Person.query.count(), 80)
+
+    def run_workload(self, app):
+        """Run concurrent writers while a reader streams an export, return the responses of the failed requests
+
+        The reader holds its read open from its first chunk until the writers are done.
+        """
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([Person(name='Person {}'.format(index)) for index in range(10)])
+            db.session.commit()
+            db.session.remove()
+
+        failures = []
+        reading = threading.Event()
+        written = threading.Event()
+
+        def stream():
+            response = app.test_client().get('/persons/export?format=ndjson', headers=headers, buffered=False)
+            try:
+                chunks = iter(response.response)
+                first_chunk = next(chunks)
+                reading.set()
+                written.wait(10)
+                rows = (first_chunk + b''.join(chunks)).splitlines()
+            finally:
+                reading.set()
+                response.close()
+            # the export reads the persons created before it
+            if len(rows) != 10:
+                failures.append(response)
+
+        def write(thread):
+            client = app.test_client()
+            for index in range(10):
+                data = {'data': {'type': 'person', 'attributes': {'name': 'Person {} {}'.format(thread, index)}}}
+                response = client.post('/persons', headers=headers, data=json.dumps(data))
+                if response.status_code != 201:
+                    failures.append(response)
+
+        def read():
+            client = app.test_client()
+            for index in range(10):
+                response = client.get('/persons?page[size]=10', headers=headers)
+                if response.status_code != 200:
+                    failures.append(response)
+
+        reader = threading.Thread(target=stream)
+        reader.start()
+        reading.wait(10)
+        threads = [threading.Thread(target=write, args=(thread,)) for thread in range(4)]
+        threads += [threading.Thread(target=read) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        written.set()
+        reader.join()
+
+        with app.app_context():
+            db.get_engine(app).dispose()
+        return failures
+
+    def test_defaults(self):
+        """The same workload fails with the defaults of SQLite, and succeeds with the configured engine"""
+        self.app.config['EXPORT_YIELD_PER'] = 2
+        self.assertEqual(self.run_workload(self.app), [])
+
+        default_app = self.create_app('defaults.db', dict(DEFAULT_SETTINGS, EXPORT_YIELD_PER=2))
+        failures = self.run_workload(default_app)
+        self.assertGreater(len(failures), 0)
+        self.assertIn(b'database is locked', failures[0].get_data())
+
+
+if __name__ == "__main__":
+    unittest.main()
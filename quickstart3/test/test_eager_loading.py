@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.api_bp.resource_managers import ComputerList
+from my_utils import ApiTestMixin
+
+"""Tests that serializing relationships does not lazy load them one object at a time"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(ApiTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_database(self, number_of_persons):
+        """Adds persons that each own 2 computers, and 1 computer without owner."""
+        for i in range(2 * number_of_persons + 1):
+            self.create_computer("Computer {}".format(i + 1))
+
+        for i in range(number_of_persons):
+            self.create_person("Person {}".format(i + 1),
+                               email="person{}@gmail.com".format(i + 1),
+                               computer_ids=[2 * i + 1, 2 * i + 2])
+
+        # start every request with an empty identity map
+        db.session.remove()
+
+    def test_computer_list(self):
+        """The owner of each computer is loaded in the same query as the computers"""
+        self.populate_database(10)
+
+        # 1 query for the count, 1 query for the computers with their owner
+        response, response_data, counter = self.get('/computers?page[size]=0')
+        self.assertEqual(len(response_data['data']), 21)
+        self.assertEqual(counter.count, 2)
+
+    def test_computer_list_include_owner(self):
+        """Included owners and their computers are loaded in one query each"""
+        self.populate_database(10)
+
+        response, response_data, counter = self.get('/computers?page[size]=0&include=owner')
+        self.assertEqual(len(response_data['data']), 21)
+        self.assertEqual(len(response_data['included']), 10)
+        self.assertEqual(counter.count, 3)
+
+    def test_computer_detail(self):
+        """The owner of a computer is loaded in the same query as the computer"""
+        self.populate_database(1)
+
+        response, response_data, counter = self.get('/computers/1')
+        self.assertEqual(response_data['data']['id'], '1')
+        self.assertEqual(counter.count, 1)
+
+        # the computers of the included owner are loaded in 1 additional query
+        response, response_data, counter = self.get('/computers/1?include=owner')
+        self.assertEqual(response_data['included'][0]['id'], '1')
+        self.assertEqual(counter.count, 2)
+
+    def test_person_list_include_computers(self):
+        """The computers of all persons are loaded in one query"""
+        self.populate_database(10)
+
+        response, response_data, counter = self.get('/persons?page[size]=0&include=computers')
+        self.assertEqual(len(response_data['data']), 10)
+        self.assertEqual(len(response_data['included']), 20)
+        self.assertEqual(counter.count, 3)
+
+    def test_person_list_query_count_is_constant(self):
+        """The computer ids of all persons of a page are loaded in one query"""
+        self.populate_database(20)
+
+        for page_size in (1, 5, 10, 20):
+            url = '/persons?page[size]={}'.format(page_size)
+            response, response_data, counter = self.get(url)
+            self.assertEqual(len(response_data['data']), page_size)
+            # 1 query for the count, 1 for the persons and 1 for their computer ids
+            self.assertEqual(counter.count, 3)
+
+    def test_person_list_loads_computer_ids_only(self):
+        """Only the ids of computers that are not included are read"""
+        self.populate_database(2)
+
+        response, response_data, counter = self.get('/persons')
+        self.assertEqual(response.status_code, 200)
+        computer_statements = [statement for statement in counter.statements
+                               if 'computer.id' in statement]
+        self.assertEqual(len(computer_statements), 1)
+        self.assertNotIn('computer.serial', computer_statements[0])
+
+    def test_sparse_fieldsets(self):
+        """Relationships excluded by a sparse fieldset are not loaded at all"""
+        self.populate_database(10)
+
+        response, response_data, counter = self.get('/persons?page[size]=0&fields[person]=birth_date')
+        self.assertEqual(len(response_data['data']), 10)
+        self.assertEqual(counter.count, 2)
+
+    def test_eagerload_strategies_override(self):
+        """A resource can override the loader strategy of a relationship"""
+        self.populate_database(10)
+
+        data_layer = ComputerList._data_layer
+        data_layer.eagerload_strategies = {'owner': 'selectin'}
+        try:
+            response, response_data, counter = self.get('/computers?page[size]=0')
+        finally:
+            del data_layer.eagerload_strategies
+        self.assertEqual(len(response_data['data']), 21)
+        self.assertEqual(counter.count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
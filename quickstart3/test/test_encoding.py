@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.encoding import ENCODERS, get_encoder
+import datetime
+import decimal
+import json
+
+"""Tests of the encoders of the documents, see JSONAPI_ENCODER in config.py"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class TestJsonConfig(TestConfig):
+    JSONAPI_ENCODER = 'json'
+
+
+class Tests(unittest.TestCase):
+    config_class = TestConfig
+
+    def setUp(self):
+        self.app = create_app(self.config_class)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_person(self):
+        """Adds John, born on 1990-12-18"""
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        data = {
+            "data": {
+                "type": "person",
+                "attributes": {
+                    "name": "John",
+                    "email": "john@gmail.com",
+                    "birth_date": "1990-12-18"
+                }
+            }
+        }
+        response = self.client().post('/persons',
+                                      headers=headers,
+                                      data=json.dumps(data))
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_documents(self):
+        """The documents are compact, and dates are in ISO 8601"""
+        response = self.create_person()
+        self.assertEqual(response.headers.getlist('Content-Type'), ['application/vnd.api+json'])
+        self.assertNotIn(b'\n', response.data)
+
+        response = self.client().get('/persons/1', headers={'Accept': 'application/vnd.api+json'})
+        self.assertEqual(response.status_code, 200)
+        document = json.loads(response.data.decode())
+        self.assertEqual(document['data']['attributes']['birth_date'], '1990-12-18')
+        self.assertEqual(document['jsonapi'], {'version': '1.0'})
+        self.assertEqual(document['links'], {'self': '/persons/1'})
+
+    def test_errors(self):
+        """The errors are encoded too"""
+        response = self.client().get('/persons?page[count]=all', headers={'Accept': 'application/vnd.api+json'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.headers.getlist('Content-Type'), ['application/vnd.api+json'])
+        self.assertEqual(json.loads(response.data.decode())['errors'][0]['source'],
+                         {'parameter': 'page[count]'})
+
+    def test_encoders(self):
+        """All the installed encoders encode the same documents"""
+        document = {'data': {'attributes': {'birth_date': datetime.date(1990, 12, 18),
+                                            'created': datetime.datetime(2018, 2, 1, 12, 30),
+                                            'price': decimal.Decimal('9.99'),
+                                            'name': 'Zoë'}},
+                    'links': {'self': '/persons/1'}}
+        expected = {'data': {'attributes': {'birth_date': '1990-12-18',
+                                            'created': '2018-02-01T12:30:00',
+                                            'price': '9.99',
+                                            'name': 'Zoë'}},
+                    'links': {'self': '/persons/1'}}
+        for name, (encoder, module) in ENCODERS.items():
+            if module is None:
+                continue
+            data = get_encoder(name)(document)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(json.loads(data.decode()), expected, name)
+            self.assertIn('"/persons/1"', data.decode(), name)
+
+        self.assertRaises(ValueError, get_encoder, 'simplejson')
+        for name, (encoder, module) in ENCODERS.items():
+            if module is None:
+                self.assertRaises(ImportError, get_encoder, name)
+
+
+class JsonTests(Tests):
+    """The same tests with the encoder of the standard library"""
+
+    config_class = TestJsonConfig
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
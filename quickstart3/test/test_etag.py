@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+import json
+from my_utils import ApiTestMixin
+from werkzeug.test import Client
+
+"""Tests of ETags, conditional GET requests (If-None-Match) and conditional writes (If-Match)"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class TestCacheConfig(TestConfig):
+    RESPONSE_CACHE = True
+
+
+class Tests(ApiTestMixin, unittest.TestCase):
+    config_class = TestConfig
+
+    def setUp(self):
+        self.app = create_app(self.config_class)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_database(self):
+        """Adds John, who owns the Amstrad and the Halo."""
+        for serial in ["Amstrad", "Halo"]:
+            self.create_computer(serial)
+        self.create_person("John", computer_ids=[1, 2])
+
+        db.session.remove()
+
+    def rename_computer(self, serial, **headers):
+        return self.request('patch', '/computers/1', {
+            "data": {
+                "type": "computer",
+                "id": "1",
+                "attributes": {
+                    "serial": serial
+                }
+            }
+        }, **headers)
+
+    def test_conditional_get(self):
+        """A GET request whose If-None-Match header matches the ETag gets a 304"""
+        self.populate_database()
+
+        for url in ['/computers/1', '/persons/1/computers']:
+            response, count = self.request('get', url, None)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+
+            response, count = self.request('get', url, None, **{'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b'')
+            self.assertEqual(response.headers['ETag'], etag)
+
+            response, count = self.request('get', url, None, **{'If-None-Match': '"other"'})
+            self.assertEqual(response.status_code, 200)
+
+        # the ETag changes with the document
+        response, count = self.request('get', '/persons/1/computers', None)
+        etag = response.headers['ETag']
+        self.rename_computer("Nestor")
+        response, count = self.request('get', '/persons/1/computers', None, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_conditional_head(self):
+        """A HEAD request gets the ETag of the GET request, and is conditional"""
+        self.populate_database()
+
+        response, count = self.request('get', '/computers/1', None)
+        etag = response.headers['ETag']
+
+        response, count = self.request('head', '/computers/1', None)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+        response, count = self.request('head', '/computers/1', None, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_errors_have_no_etag(self):
+        """Only successful responses have an ETag"""
+        response, count = self.request('get', '/persons/1/computers', None)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_conditional_patch(self):
+        """A PATCH request whose If-Match header does not match the ETag of the object fails"""
+        self.populate_database()
+
+        response, count = self.request('get', '/computers/1', None)
+        etag = response.headers['ETag']
+
+        response, count = self.rename_computer("Nestor", **{'If-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        # the computer has changed since the ETag was retrieved
+        response, count = self.rename_computer("Dopey", **{'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+        response, count = self.request('get', '/computers/1', None)
+        self.assertEqual(json.loads(response.data.decode())['data']['attributes']['serial'], 'Nestor')
+
+        response, count = self.rename_computer("Dopey", **{'If-Match': '*'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_patch_with_querystring(self):
+        """The If-Match header is compared to the ETag of the GET request without querystring"""
+        self.populate_database()
+
+        response, count = self.request('get', '/persons/1', None)
+        etag = response.headers['ETag']
+
+        response, count = self.request('patch', '/persons/1?include=computers', {
+            "data": {
+                "type": "person",
+                "id": "1",
+                "attributes": {
+                    "name": "Jack"
+                }
+            }
+        }, **{'If-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data.decode())['included']), 2)
+
+    def test_precondition_failed(self):
+        """A failed precondition gets an empty 412 response"""
+        self.populate_database()
+
+        response, count = self.rename_computer("Dopey", **{'If-Match': '"other"'})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.data, b'')
+
+        # the raw WSGI response, as the response wrapper of the test client adds a Content-Type
+        app_iter, status, headers = Client(self.app).patch('/computers/1', headers={
+            'Content-Type': 'application/vnd.api+json',
+            'If-Match': '"other"'
+            }, data=json.dumps({"data": {"type": "computer", "id": "1", "attributes": {"serial": "Dopey"}}}))
+        self.assertEqual(status.split(' ')[0], '412')
+        self.assertEqual(b''.join(app_iter), b'')
+        self.assertNotIn('Content-Type', headers)
+
+    def test_conditional_delete(self):
+        """A DELETE request whose If-Match header does not match the ETag of the object fails"""
+        self.populate_database()
+
+        response, count = self.request('delete', '/computers/1', None, **{'If-Match': '"other"'})
+        self.assertEqual(response.status_code, 412)
+
+        response, count = self.request('get', '/computers/1', None)
+        response, count = self.request('delete', '/computers/1', None, **{'If-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_write_not_found(self):
+        """A conditional write of an unknown object is not found, rather than failing its precondition"""
+        self.populate_database()
+
+        response, count = self.request('delete', '/computers/3', None, **{'If-Match': '"other"'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data.decode())['errors'][0]['source'], {'parameter': 'id'})
+
+        response, count = self.request('patch', '/computers/3', {
+            "data": {"type": "computer", "id": "3", "attributes": {"serial": "Dopey"}}
+        }, **{'If-Match': '"other"'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CacheTests(Tests):
+    config_class = TestCacheConfig
+
+    def test_cached_conditional_get(self):
+        """A conditional GET request of a cached response is answered without querying the database"""
+        self.populate_database()
+
+        response, count = self.request('get', '/computers/1', None)
+        response, count = self.request('get', '/computers/1', None, **{'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+import csv
+import io
+import json
+from my_utils import QueryCounter
+import test_filtering
+
+"""Tests of the NDJSON and CSV exports of the persons and computers"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    EXPORT_YIELD_PER = 3
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 4 computers and 4 persons, the fixtures of the filtering tests
+    populate_database = test_filtering.Tests.populate_database
+
+    def export(self, url):
+        response = self.client().get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def ndjson(self, url):
+        response = self.export(url)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        return [json.loads(line) for line in response.data.decode().splitlines()]
+
+    def test_ndjson(self):
+        self.populate_database()
+
+        self.assertEqual(self.ndjson('/persons/export'),
+                         [{'id': 1, 'birth_date': '1990-12-18'},
+                          {'id': 2, 'birth_date': '2010-12-18'},
+                          {'id': 3, 'birth_date': '1964-03-21'},
+                          {'id': 4, 'birth_date': '1931-01-12'}])
+        self.assertEqual(self.ndjson('/computers/export')[:2],
+                         [{'id': 1, 'serial': 'Amstrad', 'owner': 1},
+                          {'id': 2, 'serial': 'Halo', 'owner': 1}])
+
+    def test_filter_sort_fields(self):
+        """The filter, sort and fields parameters of the resource list"""
+        self.populate_database()
+
+        amstrad = [{"name": "computers", "op": "any", "val": {"name": "serial", "op": "ilike", "val": "%Amstrad%"}}]
+        self.assertEqual(self.ndjson('/persons/export?filter={}'.format(json.dumps(amstrad))),
+                         [{'id': 1, 'birth_date': '1990-12-18'}])
+        self.assertEqual([row['id'] for row in self.ndjson('/persons/export?sort=birth_date')], [4, 3, 1, 2])
+        self.assertEqual(self.ndjson('/computers/export?fields[computer]=owner&sort=-id'),
+                         [{'id': 4, 'owner': 3}, {'id': 3, 'owner': 2}, {'id': 2, 'owner': 1}, {'id': 1, 'owner': 1}])
+
+    def test_csv(self):
+        self.populate_database()
+        self.client().post('/computers',
+                           headers={'Content-Type': 'application/vnd.api+json'},
+                           data=json.dumps({"data": {"type": "computer", "attributes": {"serial": "Sinclair"}}}))
+
+        response = self.export('/computers/export?format=csv')
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertEqual(list(csv.reader(io.StringIO(response.data.decode()))),
+                         [['id', 'serial', 'owner'],
+                          ['1', 'Amstrad', '1'],
+                          ['2', 'Halo', '1'],
+                          ['3', 'Nestor', '2'],
+                          ['4', 'Comodor', '3'],
+                          ['5', 'Sinclair', '']])
+
+        response = self.export('/persons/export?format=csv&filter=[{"name":"birth_date","op":"gt","val":"2100-01-01"}]')
+        self.assertEqual(response.data.decode(), 'id,birth_date\r\n')
+
+    def test_rows(self):
+        """The export reads the columns of the rows only, in a single query"""
+        self.populate_database()
+
+        with QueryCounter(db.engine) as counter:
+            # the rows are queried as the response is streamed
+            self.export('/persons/export?format=csv').get_data()
+        self.assertEqual(counter.count, 1)
+        self.assertIn('SELECT person.id AS person_id, person.birth_date AS person_birth_date \nFROM person',
+                      counter.statements[0])
+
+    def test_invalid_format(self):
+        response = self.client().get('/persons/export?format=xml')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data.decode())['errors'][0]['source'], {'parameter': 'format'})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
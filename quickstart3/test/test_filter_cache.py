@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.api_bp.filtering import parameterize_filters
+import json
+from my_utils import QueryCounter
+import test_filtering
+
+"""Tests that filters which only differ by their values reuse the same compiled filters"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 4 computers and 4 persons, the fixtures of the filtering tests
+    populate_database = test_filtering.Tests.populate_database
+
+    def get_ids(self, url, filters):
+        """The ids found with filters, and the statements of the request"""
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        url = '{}?filter={}&page[size]=0'.format(url, json.dumps(filters))
+        with QueryCounter(db.engine) as counter:
+            response = self.client().get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return [obj['id'] for obj in json.loads(response.data.decode())['data']], counter.statements
+
+    def test_parameterize_filters(self):
+        """The values are replaced by bind parameters, except None and booleans"""
+        key, template, values = parameterize_filters(
+            [{"name": "name", "op": "eq", "val": "John"},
+             {"or": [{"name": "email", "op": "eq", "val": None},
+                     {"name": "serial", "op": "in_", "val": ["Amstrad", "Halo"]}]}])
+        self.assertEqual(values, {'filter_0': 'John', 'filter_1': ['Amstrad', 'Halo']})
+        self.assertIsNone(template[1]['or'][0]['val'])
+        self.assertTrue(template[1]['or'][1]['val'].expanding)
+
+        other_key, other_template, other_values = parameterize_filters(
+            [{"name": "name", "op": "eq", "val": "Mary"},
+             {"or": [{"name": "email", "op": "eq", "val": None},
+                     {"name": "serial", "op": "in_", "val": ["Nestor", "Commodore", "Halo"]}]}])
+        self.assertEqual(key, other_key)
+        self.assertEqual(other_values, {'filter_0': 'Mary', 'filter_1': ['Nestor', 'Commodore', 'Halo']})
+
+        # a value of another type is bound with another type
+        self.assertNotEqual(key, parameterize_filters(
+            [{"name": "name", "op": "eq", "val": 1},
+             {"or": [{"name": "email", "op": "eq", "val": None},
+                     {"name": "serial", "op": "in_", "val": ["Amstrad", "Halo"]}]}])[0])
+
+    def test_cache(self):
+        """The same filters with other values hit the cache, and send the same statement"""
+        self.populate_database()
+        filter_cache = self.app.extensions['filter_cache']
+
+        ids, statements = self.get_ids('/persons', [{"name": "name", "op": "eq", "val": "Dopey"}])
+        self.assertEqual(ids, ['4'])
+        self.assertEqual((filter_cache.hits, filter_cache.misses), (0, 1))
+
+        other_ids, other_statements = self.get_ids('/persons', [{"name": "name", "op": "eq", "val": "Mary"}])
+        self.assertEqual(other_ids, ['3'])
+        self.assertEqual((filter_cache.hits, filter_cache.misses), (1, 1))
+        self.assertEqual(statements, other_statements)
+
+        # other filters
+        ids, statements = self.get_ids('/persons', [{"name": "name", "op": "ne", "val": "John"}])
+        self.assertEqual(ids, ['3', '4'])
+        self.assertEqual((filter_cache.hits, filter_cache.misses), (1, 2))
+
+        # the same filters on another resource
+        ids, statements = self.get_ids('/computers', [{"name": "serial", "op": "eq", "val": "Halo"}])
+        self.assertEqual(ids, ['2'])
+        self.assertEqual((filter_cache.hits, filter_cache.misses), (1, 3))
+
+    def test_lists(self):
+        """Lists of any length share the compiled filters"""
+        self.populate_database()
+        filter_cache = self.app.extensions['filter_cache']
+
+        ids, statements = self.get_ids('/computers', [{"name": "serial", "op": "in_", "val": ["Amstrad"]}])
+        self.assertEqual(ids, ['1'])
+        ids, statements = self.get_ids('/computers',
+                                       [{"name": "serial", "op": "in_", "val": ["Amstrad", "Halo", "Apple"]}])
+        self.assertEqual(ids, ['1', '2'])
+        self.assertEqual((filter_cache.hits, filter_cache.misses), (1, 1))
+
+    def test_nested(self):
+        """Values nested in relationship filters are bound too"""
+        self.populate_database()
+        filter_cache = self.app.extensions['filter_cache']
+
+        def owned_by(birth_date):
+            return [{"name": "computers", "op": "any",
+                     "val": {"name": "owner", "op": "has",
+                             "val": {"name": "birth_date", "op": "gt", "val": birth_date}}}]
+
+        ids, statements = self.get_ids('/persons', owned_by('1980-01-01'))
+        self.assertEqual(ids, ['1', '2'])
+        ids, statements = self.get_ids('/persons', owned_by('1900-01-01'))
+        self.assertEqual(ids, ['1', '2', '3'])
+        self.assertEqual((filter_cache.hits, filter_cache.misses), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.importer import import_ndjson
+from application.models import Computer, Person
+import datetime
+import json
+from my_utils import QueryCounter
+
+"""Tests of the bulk import of persons and computers from NDJSON"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def person(name, email, birth_date=None):
+    attributes = {'name': name, 'email': email}
+    if birth_date is not None:
+        attributes['birth_date'] = birth_date
+    return json.dumps({'type': 'person', 'attributes': attributes})
+
+
+def computer(serial, owner=None):
+    item = {'type': 'computer', 'attributes': {'serial': serial}}
+    if owner is not None:
+        item['relationships'] = {'owner': {'data': dict(type='person', **owner)}}
+    return json.dumps(item)
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_owners(self):
+        return {computer.serial: computer.person.name if computer.person else None
+                for computer in Computer.query}
+
+    def test_import(self):
+        """Persons and computers are created, with their owners referred to by id or email"""
+        lines = [person('John', 'john@gmail.com', '1990-12-18'),
+                 person('Mary', 'mary@gmail.com'),
+                 computer('Amstrad', {'email': 'john@gmail.com'}),
+                 computer('Halo', {'id': '2'}),
+                 '',
+                 computer('Nestor')]
+        report = import_ndjson(db.session, lines, 500)
+
+        self.assertEqual(report.errors, [])
+        self.assertEqual(report.counts, {'person': 2, 'computer': 3})
+        self.assertEqual(report.rows, 5)
+        self.assertGreater(report.rows_per_second, 0)
+        self.assertEqual(Person.query.filter_by(name='John').one().birth_date, datetime.date(1990, 12, 18))
+        self.assertEqual(self.get_owners(), {'Amstrad': 'John', 'Halo': 'Mary', 'Nestor': None})
+
+    def test_chunks(self):
+        """A chunk refers to the persons of the previous chunks, and is imported with one insert per type"""
+        lines = [person('Person {}'.format(index), 'person{}@example.com'.format(index)) for index in range(3)]
+        lines += [computer('Computer {}'.format(index), {'email': 'person{}@example.com'.format(index % 3)})
+                  for index in range(6)]
+
+        with QueryCounter(db.engine) as counter:
+            report = import_ndjson(db.session, lines, 3)
+
+        self.assertEqual(report.errors, [])
+        self.assertEqual(report.counts, {'person': 3, 'computer': 6})
+        # the persons, then 2 chunks of computers with the query of their owners and their insert
+        inserts = [statement for statement in counter.statements if statement.startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(counter.count, 5)
+        self.assertEqual(self.get_owners()['Computer 4'], 'Person 1')
+
+    def test_errors(self):
+        """Invalid lines are reported and skipped, the other lines of their chunk are imported"""
+        db.session.add_all([Person(name='John', email='john@gmail.com'),
+                            Person(name='Johnny', email='john@gmail.com')])
+        db.session.commit()
+
+        lines = ['not json',
+                 json.dumps({'type': 'printer'}),
+                 person('Mary', 'not an email'),
+                 computer('Amstrad', {'id': '99'}),
+                 computer('Halo', {'email': 'nobody@gmail.com'}),
+                 computer('Nestor', {'email': 'john@gmail.com'}),
+                 computer('Comodor', {'id': '1'})]
+        report = import_ndjson(db.session, lines, 500)
+
+        self.assertEqual([error['line'] for error in report.errors], [1, 2, 3, 4, 5, 6])
+        self.assertTrue(report.errors[0]['detail'].startswith('Invalid JSON'))
+        self.assertEqual(report.errors[1]['source'], {'pointer': '/type'})
+        self.assertEqual(report.errors[2]['source'], {'pointer': '/attributes/email'})
+        self.assertEqual(report.errors[3], {'line': 4, 'detail': 'person 99 not found',
+                                            'source': {'pointer': '/relationships/owner/data'}})
+        self.assertEqual(report.errors[4]['detail'], 'person with email nobody@gmail.com not found')
+        self.assertEqual(report.errors[5]['detail'], 'Several person objects have the email john@gmail.com')
+        self.assertEqual(report.counts, {'computer': 1})
+        self.assertEqual(self.get_owners(), {'Comodor': 'John'})
+
+    def test_to_many_relationships(self):
+        """Only the many-to-one relationships are imported"""
+        line = json.dumps({'type': 'person', 'attributes': {'name': 'John'},
+                           'relationships': {'computers': {'data': []}}})
+        report = import_ndjson(db.session, [line], 500)
+
+        self.assertEqual(report.errors, [{'line': 1, 'detail': 'The relationship computers cannot be imported',
+                                          'source': {'pointer': '/relationships'}}])
+        self.assertEqual(Person.query.count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
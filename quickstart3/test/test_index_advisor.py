@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+from config import Config
+from application import create_app, db
+from application.index_advisor import advise, parse_usage_log
+import logging
+from sqlalchemy import inspect
+
+"""Tests of the indexes of the models, and of the index advisor"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url):
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        response = self.client().get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_indexes(self):
+        """The columns used by the nested endpoints and the filters have an index"""
+        inspector = inspect(db.engine)
+        indexed_columns = {(table, index['column_names'][0])
+                           for table in ('person', 'computer') for index in inspector.get_indexes(table)}
+        self.assertEqual(indexed_columns, {('person', 'name'),
+                                           ('person', 'email'),
+                                           ('computer', 'serial'),
+                                           ('computer', 'person_id')})
+
+    def test_filter_usage(self):
+        """The columns compared by the filters of the requests are counted with their operator"""
+        self.get('/persons?filter=[{"name":"name","op":"eq","val":"John"}]')
+        self.get('/persons?filter=[{"or":[{"name":"name","op":"ilike","val":"%o%"},'
+                 '{"not":{"name":"birth_date","op":"eq","val":"1990-12-18"}}]}]')
+        self.get('/persons?filter=[{"name":"computers","op":"any",'
+                 '"val":{"name":"serial","op":"ilike","val":"%Amstrad%"}}]')
+        self.get('/persons')
+
+        self.assertEqual(dict(self.app.extensions['filter_usage'].counts),
+                         {('person', 'name', 'eq'): 1,
+                          ('person', 'name', 'ilike'): 1,
+                          ('person', 'birth_date', 'eq'): 1,
+                          ('computer', 'person_id', 'eq'): 1,
+                          ('computer', 'serial', 'ilike'): 1})
+
+    def test_advise(self):
+        """The advisor reports the filtered columns without index, with their query plan"""
+        report = advise(db.engine, {('person', 'name', 'eq'): 1,
+                                    ('person', 'birth_date', 'eq'): 3,
+                                    ('person', 'id', 'eq'): 2,
+                                    ('unknown', 'column', 'eq'): 1})
+        self.assertEqual([(row['table'], row['column'], row['count'], row['indexed']) for row in report],
+                         [('person', 'birth_date', 3, False),
+                          ('person', 'id', 2, True),
+                          ('person', 'name', 1, True)])
+        self.assertEqual([row['advice'] for row in report], ['MISSING INDEX', None, None])
+        self.assertIn('SCAN', report[0]['plan'])
+        self.assertIn('USING INDEX', report[2]['plan'])
+
+    def test_advise_operators(self):
+        """The query plan of a filter is the one of its operator"""
+        report = advise(db.engine, {('person', 'name', 'ge'): 3,
+                                    ('person', 'name', 'in'): 2,
+                                    ('person', 'name', 'ilike'): 1})
+        self.assertEqual([row['operator'] for row in report], ['ge', 'in', 'ilike'])
+        self.assertIn('USING INDEX', report[0]['plan'])
+        self.assertIn('>', report[0]['plan'])
+        self.assertIsNone(report[0]['advice'])
+        self.assertIn('USING INDEX', report[1]['plan'])
+        self.assertIsNone(report[1]['advice'])
+        # lower(name) LIKE lower(?) can not use the index of name on SQLite
+        self.assertIn('SCAN', report[2]['plan'])
+        self.assertIn('COLLATE NOCASE', report[2]['advice'])
+        self.assertNotEqual(report[2]['advice'], 'MISSING INDEX')
+
+    def test_usage_log(self):
+        """The filtered columns logged to FILTER_USAGE_LOG can be parsed back"""
+        logger = logging.getLogger('application.index_advisor')
+        handlers = list(logger.handlers)
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, 'filters.log')
+            TestConfig.FILTER_USAGE_LOG = log_path
+            try:
+                app = create_app(TestConfig)
+            finally:
+                TestConfig.FILTER_USAGE_LOG = None
+
+            with app.app_context():
+                app.extensions['filter_usage'].record([('person', 'name', 'eq'), ('person', 'email', 'like')])
+                app.extensions['filter_usage'].record([('person', 'name', 'eq')])
+
+            for handler in logger.handlers:
+                if handler not in handlers:
+                    handler.close()
+                    logger.removeHandler(handler)
+
+            with open(log_path) as logfile:
+                counts = parse_usage_log(logfile)
+        self.assertEqual(dict(counts), {('person', 'name', 'eq'): 2, ('person', 'email', 'like'): 1})
+
+        # the lines logged without operator are equality filters
+        self.assertEqual(dict(parse_usage_log(['filter columns: person.name computer.serial:ilike'])),
+                         {('person', 'name', 'eq'): 1, ('computer', 'serial', 'ilike'): 1})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
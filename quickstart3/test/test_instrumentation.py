@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.models import Person
+import json
+
+"""Tests of the instrumentation of the requests"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(unittest.TestCase):
+    config_class = TestConfig
+
+    def setUp(self):
+        self.app = create_app(self.config_class)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([Person(name='Person {}'.format(index)) for index in range(3)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def request(self, method, url):
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        response = getattr(self.client(), method)(url, headers=headers)
+        db.session.remove()
+        return response
+
+    def get_stats(self):
+        response = self.request('get', '/stats')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode())['endpoints']
+
+    def test_endpoint_stats(self):
+        """The stats of the requests are added up per endpoint"""
+        responses = [self.request('get', '/persons/1'), self.request('get', '/persons/2'),
+                     self.request('get', '/persons')]
+        stats = self.get_stats()
+
+        self.assertEqual(sorted(stats), ['person_detail', 'person_list'])
+        detail = stats['person_detail']
+        self.assertEqual(detail['requests'], 2)
+        self.assertGreater(detail['statements'], 0)
+        self.assertEqual(detail['statements_per_request'], detail['statements'] / 2)
+        self.assertEqual(detail['response_bytes'], len(responses[0].data) + len(responses[1].data))
+        self.assertGreater(detail['sql_seconds'], 0)
+        self.assertGreater(detail['serialization_seconds'], 0)
+        self.assertEqual(stats['person_list']['requests'], 1)
+
+    def test_streamed_response(self):
+        """The size of a streamed response is counted as it is sent"""
+        response = self.request('get', '/persons/export?format=ndjson')
+        self.assertEqual(response.status_code, 200)
+        # the stats are added once the whole response is sent
+        size = len(response.data)
+        self.assertEqual(self.get_stats()['person_export']['response_bytes'], size)
+
+    def test_remote_clients(self):
+        """The stats are only served to the local clients"""
+        response = self.client().get('/stats', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_no_server_timing(self):
+        """The stats of a request are not reported in its headers outside of debug"""
+        response = self.request('get', '/persons/1')
+        self.assertNotIn('Server-Timing', response.headers)
+
+
+class ServerTimingTests(Tests):
+    config_class = type('ServerTimingConfig', (TestConfig,), {'SERVER_TIMING': True})
+
+    def test_no_server_timing(self):
+        pass
+
+    def test_server_timing(self):
+        """The stats of a request are reported in its Server-Timing header"""
+        response = self.request('get', '/persons/1')
+        metrics = [metric.strip().split(';') for metric in response.headers['Server-Timing'].split(',')]
+        self.assertEqual([metric[0] for metric in metrics], ['sql', 'serialization', 'total'])
+        self.assertRegex(metrics[0][2], r'^desc="[1-9][0-9]* statements"$')
+
+
+if __name__ == "__main__":
+    unittest.main()
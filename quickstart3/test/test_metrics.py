@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import shutil
+import tempfile
+import threading
+from config import Config
+from application import create_app, db
+from application.metrics import ShardedCounters
+from application.models import Person
+import json
+
+"""Tests of the Prometheus metrics"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    METRICS_LATENCY_BUCKETS = (0.001, 10)
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Person(name='John'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def request(self, method, url, data=None):
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        response = getattr(self.client(), method)(url, headers=headers, data=json.dumps(data) if data else None)
+        db.session.remove()
+        return response
+
+    def get_samples(self):
+        """Return the value of each sample of the metrics endpoint"""
+        response = self.client().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        samples = dict()
+        for line in response.data.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_requests(self):
+        """The requests are counted by route, method and status"""
+        self.request('get', '/persons/1')
+        self.request('get', '/persons/1')
+        self.request('get', '/persons/2/computers')
+        self.request('patch', '/persons/1', {'data': {'type': 'computer', 'id': '1'}})
+        samples = self.get_samples()
+
+        self.assertEqual(samples['http_requests_total{route="/persons/<int:id>",method="GET",status="200"}'], 2)
+        self.assertEqual(samples['http_requests_total{route="/persons/<int:id>/computers",method="GET",status="404"}'],
+                         1)
+        self.assertEqual(samples['http_requests_total{route="/persons/<int:id>",method="PATCH",status="409"}'], 1)
+        # the metrics endpoint does not count itself
+        self.assertNotIn('route="/metrics"', ''.join(samples))
+
+    def test_latency_histogram(self):
+        """The durations of the requests are counted in cumulative buckets"""
+        for index in range(3):
+            self.request('get', '/persons')
+        samples = self.get_samples()
+
+        labels = 'route="/persons",method="GET"'
+        self.assertEqual(samples['http_request_duration_seconds_count{' + labels + '}'], 3)
+        self.assertEqual(samples['http_request_duration_seconds_bucket{' + labels + ',le="+Inf"}'], 3)
+        self.assertLessEqual(samples['http_request_duration_seconds_bucket{' + labels + ',le="0.001"}'],
+                             samples['http_request_duration_seconds_bucket{' + labels + ',le="10"}'])
+        self.assertGreater(samples['http_request_duration_seconds_sum{' + labels + '}'], 0)
+        # the routes of the api are reported before they are requested
+        self.assertEqual(samples['http_request_duration_seconds_count{route="/computers",method="POST"}'], 0)
+
+    def test_unmatched(self):
+        """The requests of unknown urls are counted together"""
+        self.request('get', '/unknown/1')
+        self.assertEqual(self.get_samples()['http_requests_total{route="unmatched",method="GET",status="404"}'], 1)
+
+    def test_caches(self):
+        """The hits and misses of the caches are reported"""
+        for name in ('John', 'Jane'):
+            self.request('get', '/persons?filter=' + json.dumps([{'name': 'name', 'op': 'eq', 'val': name}]))
+        samples = self.get_samples()
+        self.assertEqual(samples['cache_misses_total{cache="filter_cache"}'], 1)
+        self.assertEqual(samples['cache_hits_total{cache="filter_cache"}'], 1)
+
+    def test_instrumentation(self):
+        """The totals of the instrumentation are reported per endpoint"""
+        self.request('get', '/persons/1')
+        self.assertGreater(self.get_samples()['sql_statements_total{endpoint="person_detail"}'], 0)
+
+    def test_remote_clients(self):
+        """The metrics are only served to the local clients"""
+        response = self.client().get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_sharded_counters(self):
+        """Counters added to by several threads, including threads that ended"""
+        counters = ShardedCounters()
+        counters.add('a')
+
+        def add():
+            for index in range(1000):
+                counters.add('a')
+                counters.add('b', 0.5)
+
+        threads = [threading.Thread(target=add) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counters.snapshot(), {'a': 4001, 'b': 2000})
+        # the shards of the threads that ended are folded into the totals
+        self.assertEqual(counters.snapshot(), {'a': 4001, 'b': 2000})
+
+    def test_short_lived_threads(self):
+        """The shards of the threads that ended are retired without reading the counters"""
+        counters = ShardedCounters()
+        for index in range(50):
+            thread = threading.Thread(target=counters.add, args=('a',))
+            thread.start()
+            thread.join()
+        self.assertLessEqual(len(counters._shards), 1)
+        self.assertEqual(counters.snapshot(), {'a': 50})
+
+
+class PoolTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        config_class = type('FileConfig', (TestConfig,),
+                            {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.directory, 'test.db')})
+        self.app = create_app(config_class)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.get_engine(self.app).dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_pool(self):
+        """The connections of the pool are reported"""
+        connection = db.engine.connect()
+        try:
+            lines = self.app.test_client().get('/metrics').data.decode().splitlines()
+        finally:
+            connection.close()
+        self.assertIn('db_pool_size{bind="default"} 5', lines)
+        self.assertIn('db_pool_checked_out{bind="default"} 1', lines)
+        self.assertIn('db_pool_overflow{bind="default"} 0', lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
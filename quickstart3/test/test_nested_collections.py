@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.api_bp.resource_managers import ComputerList
+from application.models import Computer, Person
+import json
+from my_utils import QueryCounter
+
+"""Tests of the nested endpoints /persons/<id>/computers and /computers/<id>/owner"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_database(self):
+        """Adds John, who owns 2 computers, Dopey, who owns none, and a computer without owner."""
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        for serial in ["Amstrad", "Halo", "Nestor"]:
+            data = {
+                "data": {
+                    "type": "computer",
+                    "attributes": {
+                        "serial": serial
+                    }
+                }
+            }
+            response = self.client().post('/computers',
+                                          headers=headers,
+                                          data=json.dumps(data))
+            self.assertEqual(response.status_code, 201)
+
+        data = {
+            "data": {
+                "type": "person",
+                "attributes": {
+                  "name": "John",
+                  "email": "john@gmail.com"
+                },
+                "relationships": {
+                  "computers": {
+                    "data": [
+                      {"type": "computer", "id": "1"},
+                      {"type": "computer", "id": "2"}
+                    ]
+                  }
+                }
+              }
+            }
+        response = self.client().post('/persons',
+                                      headers=headers,
+                                      data=json.dumps(data))
+        self.assertEqual(response.status_code, 201)
+
+        data = {
+            "data": {
+                "type": "person",
+                "attributes": {
+                  "name": "Dopey",
+                  "email": "dopey@gmail.com"
+                }
+              }
+            }
+        response = self.client().post('/persons',
+                                      headers=headers,
+                                      data=json.dumps(data))
+        self.assertEqual(response.status_code, 201)
+
+        db.session.remove()
+
+    def get(self, url):
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        with QueryCounter(db.engine) as counter:
+            response = self.client().get(url, headers=headers)
+        return response, counter.count
+
+    def test_person_computers(self):
+        """The computers of a person are found without looking up the person first"""
+        self.populate_database()
+
+        response, count = self.get('/persons/1/computers')
+        response_data = json.loads(response.data.decode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_data['meta']['count'], 2)
+        self.assertEqual([computer['id'] for computer in response_data['data']], ['1', '2'])
+        # 1 query for the count and 1 query for the computers
+        self.assertEqual(count, 2)
+
+    def test_person_without_computers(self):
+        """A person without computers has an empty collection"""
+        self.populate_database()
+
+        response, count = self.get('/persons/2/computers')
+        response_data = json.loads(response.data.decode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_data['meta']['count'], 0)
+        self.assertEqual(response_data['data'], [])
+        # the existence of the person is only checked for an empty result
+        self.assertEqual(count, 3)
+
+    def test_unknown_person(self):
+        """The computers of an unknown person are not found"""
+        self.populate_database()
+
+        response, count = self.get('/persons/3/computers')
+        self.assertEqual(response.status_code, 404)
+        error = json.loads(response.data.decode())['errors'][0]
+        self.assertEqual(error['detail'], 'Person: 3 not found')
+        self.assertEqual(error['source'], {'parameter': 'id'})
+
+    def test_computer_owner(self):
+        """The owner of a computer is loaded once, in the query that finds the computer"""
+        self.populate_database()
+
+        response, count = self.get('/computers/2/owner')
+        response_data = json.loads(response.data.decode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_data['data']['id'], '1')
+        self.assertEqual(response_data['data']['attributes']['display_name'], 'JOHN <john@gmail.com>')
+        # 1 query for the computer with its owner, 1 query for the computer ids of the owner
+        self.assertEqual(count, 2)
+
+    def test_computer_without_owner(self):
+        """A computer without owner has no owner"""
+        self.populate_database()
+
+        response, count = self.get('/computers/3/owner')
+        response_data = json.loads(response.data.decode())
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response_data['data'])
+        self.assertEqual(count, 1)
+
+    def test_unknown_computer(self):
+        """The owner of an unknown computer is not found"""
+        self.populate_database()
+
+        response, count = self.get('/computers/4/owner')
+        self.assertEqual(response.status_code, 404)
+        error = json.loads(response.data.decode())['errors'][0]
+        self.assertEqual(error['detail'], 'Computer: 4 not found')
+        self.assertEqual(error['source'], {'parameter': 'computer_id'})
+
+
+    def test_create_person_computer(self):
+        """A computer is created for a person, and not for an unknown person"""
+        self.populate_database()
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        data = {"data": {"type": "computer", "attributes": {"serial": "Comodor"}}}
+
+        response = self.client().post('/persons/2/computers', headers=headers, data=json.dumps(data))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Computer.query.filter_by(serial='Comodor').one().person_id, 2)
+
+        response = self.client().post('/persons/3/computers', headers=headers, data=json.dumps(data))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data.decode())['errors'][0]['source'], {'parameter': 'id'})
+        self.assertEqual(Computer.query.filter_by(serial='Comodor').count(), 1)
+
+    def test_load_object(self):
+        """An object is fetched at most once per request, and so is the absence of an object"""
+        self.populate_database()
+        data_layer = ComputerList._data_layer
+
+        with self.app.test_request_context('/persons/1/computers'):
+            with QueryCounter(db.engine) as counter:
+                person = data_layer.load_object(Person, '1')
+                self.assertIs(data_layer.load_object(Person, 1), person)
+                self.assertIs(data_layer.get_related_object(Person, 'id', {'id': '1'}), person)
+                self.assertIsNone(data_layer.load_object(Person, '3'))
+                self.assertIsNone(data_layer.load_object(Person, 3))
+                self.assertIsNone(data_layer.load_object(Person, 'three'))
+            self.assertEqual(counter.count, 2)
+
+        # the next request fetches the objects again
+        db.session.remove()
+        with self.app.test_request_context('/persons/1/computers'):
+            with QueryCounter(db.engine) as counter:
+                data_layer.load_object(Person, '1')
+            self.assertEqual(counter.count, 1)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from urllib.parse import urlencode
+from my_utils import ApiTestMixin
+
+"""Tests of keyset (cursor) pagination with page[after] and page[before]"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(ApiTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_database(self):
+        """Adds 10 persons, some of them sharing a name or a birth date, or without birth date."""
+        persons = [("John", "1990-12-18"),
+                   ("John", "2010-12-18"),
+                   ("Mary", "1964-03-21"),
+                   ("Dopey", "1931-01-12"),
+                   ("Mary", None),
+                   ("Halo", "1990-12-18"),
+                   ("Nestor", None),
+                   ("Amstrad", "1985-01-01"),
+                   ("John", "1964-03-21"),
+                   ("Comodor", "1977-07-07")]
+
+        for name, birth_date in persons:
+            self.create_person(name, birth_date=birth_date)
+
+        db.session.remove()
+
+    def page_through(self, url, link='next'):
+        """Follows the next (or prev) links and returns the ids of all pages"""
+        pages = []
+        while url is not None:
+            response, response_data, counter = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('meta', response_data)
+            pages.append([person['id'] for person in response_data['data']])
+            url = response_data['links'].get(link)
+        return pages
+
+    def expected_ids(self, sort):
+        """The ids of all persons in the order given by offset pagination"""
+        response, response_data, counter = self.get('/persons?page[size]=0&sort={}'.format(sort))
+        return [person['id'] for person in response_data['data']]
+
+    def test_page_through_all_persons(self):
+        """Following the next links returns every person once, in order"""
+        self.populate_database()
+
+        pages = self.page_through('/persons?page[size]=3&page[after]=')
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        self.assertEqual(sum(pages, []), [str(i) for i in range(1, 11)])
+
+    def test_page_through_sorted_persons(self):
+        """Keyset pagination follows the sort order, including descending and NULL values"""
+        self.populate_database()
+
+        for sort in ('name', '-name', 'birth_date', '-birth_date', 'name,-birth_date', '-birth_date,name'):
+            url = '/persons?' + urlencode({'page[size]': 3, 'page[after]': '', 'sort': sort})
+            pages = self.page_through(url)
+            self.assertEqual(sum(pages, []), self.expected_ids(sort), sort)
+
+    def test_page_backwards(self):
+        """Following the prev links from the last page returns the same pages"""
+        self.populate_database()
+
+        url = '/persons?' + urlencode({'page[size]': 4, 'page[after]': '', 'sort': '-birth_date'})
+        pages = self.page_through(url)
+        response, response_data, counter = self.get(url)
+        while 'next' in response_data['links']:
+            response, response_data, counter = self.get(response_data['links']['next'])
+        backward_pages = self.page_through(response_data['links']['prev'], link='prev')
+        self.assertEqual(list(reversed(backward_pages)), pages[:-1])
+
+    def test_no_count_query(self):
+        """A keyset page is retrieved without counting the persons"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/persons?page[size]=3&page[after]=')
+        response, response_data, counter = self.get(response_data['links']['next'])
+        self.assertEqual(response.status_code, 200)
+        # 1 query for the persons, 1 for their computer ids
+        self.assertEqual(counter.count, 2)
+        self.assertFalse(any('count(' in statement for statement in counter.statements))
+
+    def test_person_computers(self):
+        """The nested collection /persons/<id>/computers supports keyset pagination"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/persons/1/computers?page[after]=')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_data['data'], [])
+
+        response, response_data, counter = self.get('/persons/99/computers?page[after]=')
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_cursor(self):
+        """A cursor that can not be decoded is a bad request"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/persons?page[after]=abc')
+        self.assertEqual(response.status_code, 400)
+
+        response, response_data, counter = self.get('/persons?page[after]=&page[number]=2')
+        self.assertEqual(response.status_code, 400)
+
+        # a cursor of another sort order
+        response, response_data, counter = self.get('/persons?page[size]=3&page[after]=')
+        response, response_data, counter = self.get(response_data['links']['next'] + '&sort=name')
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
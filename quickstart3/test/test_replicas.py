@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import shutil
+import tempfile
+from config import Config
+from application import create_app, db
+from application.database import ReplicaRouter
+from application.models import Person
+import json
+from sqlalchemy.orm import Session
+
+"""Tests of the routing of the reads to the replicas of the database"""
+
+class TestConfig(Config):
+    TESTING = True
+
+
+class Audit(db.Model):
+    """A model of its own bind, which is not replicated"""
+    __bind_key__ = 'audit'
+    id = db.Column(db.Integer, primary_key=True)
+    message = db.Column(db.String)
+
+
+class ReplicaTestCase(unittest.TestCase):
+    strategy = 'round-robin'
+
+    def setUp(self):
+        # a primary and two replicas, each in its own file, each with a person named after it
+        self.directory = tempfile.mkdtemp()
+        uris = ['sqlite:///' + os.path.join(self.directory, name + '.db') for name in ('primary', 'replica0', 'replica1')]
+        audit_uri = 'sqlite:///' + os.path.join(self.directory, 'audit.db')
+        config_class = type('ReplicaConfig', (TestConfig,), {'SQLALCHEMY_DATABASE_URI': uris[0],
+                                                             'SQLALCHEMY_BINDS': {'audit': audit_uri},
+                                                             'SQLALCHEMY_REPLICAS': uris[1:],
+                                                             'REPLICA_STRATEGY': self.strategy})
+        self.app = create_app(config_class)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        for bind, name in ((None, 'primary'), ('replica_0', 'replica0'), ('replica_1', 'replica1')):
+            engine = db.get_engine(self.app, bind)
+            db.Model.metadata.create_all(engine)
+            session = Session(bind=engine)
+            session.add(Person(name=name))
+            session.commit()
+            session.close()
+        db.session.add(Audit(message='audited'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        for bind in (None, 'audit', 'replica_0', 'replica_1'):
+            db.get_engine(self.app, bind).dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def request(self, method, url, data=None, client=None):
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        client = client or self.client()
+        response = getattr(client, method)(url, headers=headers, data=json.dumps(data) if data else None)
+        db.session.remove()
+        return response
+
+    def get_name(self, url='/persons/1', client=None):
+        """Return the name of the database a request has read from"""
+        response = self.request('get', url + '?fields[person]=display_name', client=client)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode())['data']
+        data = data[0] if isinstance(data, list) else data
+        return data['attributes']['display_name'].split(' ')[0].lower()
+
+
+class Tests(ReplicaTestCase):
+    def test_round_robin(self):
+        """The reads of the GET requests go to the replicas in turn"""
+        self.assertEqual([self.get_name(url) for url in ('/persons/1', '/persons', '/persons/1', '/persons')],
+                         ['replica0', 'replica1', 'replica0', 'replica1'])
+        self.assertEqual(self.app.extensions['replica_router'].in_progress, {'replica_0': 0, 'replica_1': 0})
+
+    def test_writes(self):
+        """Writes go to the primary, then the client reads from the primary for a while"""
+        client = self.client()
+        response = self.request('patch', '/persons/1',
+                                {'data': {'type': 'person', 'id': '1', 'attributes': {'name': 'written'}}},
+                                client=client)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('read_primary_until=', response.headers['Set-Cookie'])
+        self.assertEqual(Person.query.get(1).name, 'written')
+
+        self.assertEqual([self.get_name(client=client) for index in range(2)], ['written', 'written'])
+        # other clients read from the replicas
+        self.assertEqual(self.get_name(), 'replica0')
+
+        # once the stickiness expired
+        client.set_cookie('localhost', 'read_primary_until', '0')
+        self.assertEqual(self.get_name(client=client), 'replica1')
+
+    def test_bound_models(self):
+        """The models of another bind are read from their own database"""
+        with self.app.test_request_context('/persons/1'):
+            self.app.preprocess_request()
+            try:
+                self.assertEqual(Person.query.get(1).name, 'replica0')
+                self.assertEqual([audit.message for audit in Audit.query], ['audited'])
+            finally:
+                self.app.do_teardown_request()
+                db.session.remove()
+
+    def test_failed_writes(self):
+        """A failed write does not make the client read from the primary"""
+        response = self.request('patch', '/persons/1', {'data': {'type': 'computer', 'id': '1'}})
+        self.assertEqual(response.status_code, 409)
+        self.assertNotIn('Set-Cookie', response.headers)
+
+
+class LeastLoadedTests(ReplicaTestCase):
+    strategy = 'least-loaded'
+
+    def test_sequential_requests(self):
+        """Without other requests in progress, the reads go to the first replica"""
+        self.assertEqual([self.get_name() for index in range(2)], ['replica0', 'replica0'])
+
+    def test_least_loaded(self):
+        """The replica with the fewest requests in progress is chosen"""
+        router = ReplicaRouter(['a', 'b', 'c'], 'least-loaded')
+        self.assertEqual([router.acquire() for index in range(4)], ['a', 'b', 'c', 'a'])
+        router.release('b')
+        self.assertEqual(router.acquire(), 'b')
+        with self.assertRaises(ValueError):
+            ReplicaRouter(['a'], 'random')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.cache import CacheBackend
+import json
+import pickle
+from my_utils import ApiTestMixin
+
+"""Tests of the cache of GET responses and its invalidation by writes"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    RESPONSE_CACHE = True
+
+
+class SharedBackend(CacheBackend):
+    """Stand-in of a cache server: values are serialized, and shared by all applications"""
+
+    entries = dict()
+
+    def get(self, key, default=None):
+        value = self.entries.get(key)
+        return default if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        self.entries[key] = pickle.dumps(value)
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class Tests(ApiTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_database(self):
+        """Adds John, who owns the Amstrad, Dopey, and the Halo, without owner."""
+        for serial in ["Amstrad", "Halo"]:
+            self.create_computer(serial)
+        self.create_person("John", computer_ids=[1])
+        self.create_person("Dopey")
+
+        db.session.remove()
+
+    def write(self, method, url, data):
+        response, count = self.request(method, url, data)
+        self.assertLess(response.status_code, 300)
+        return response
+
+    def owner(self, computer_id):
+        response, count = self.request('get', '/computers/{}/relationships/owner'.format(computer_id))
+        return json.loads(response.data.decode())['data']
+
+    def computers(self, person_id):
+        response, count = self.request('get', '/persons/{}/relationships/computers'.format(person_id))
+        return [computer['id'] for computer in json.loads(response.data.decode())['data']]
+
+    def test_cached_responses(self):
+        """A repeated GET is served without querying the database"""
+        self.populate_database()
+
+        for url in ['/persons/1', '/computers?include=owner', '/persons/1/relationships/computers']:
+            response, count = self.request('get', url)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(count, 0)
+
+            cached_response, count = self.request('get', url)
+            self.assertEqual(count, 0)
+            self.assertEqual(cached_response.status_code, 200)
+            self.assertEqual(cached_response.data, response.data)
+            self.assertEqual(cached_response.headers.getlist('Content-Type'),
+                             response.headers.getlist('Content-Type'))
+            self.assertEqual(cached_response.headers['ETag'], response.headers['ETag'])
+
+        # the key contains the query string and the Accept header
+        response, count = self.request('get', '/computers')
+        self.assertGreater(count, 0)
+        response, count = self.request('get', '/persons/1', Accept='*/*')
+        self.assertGreater(count, 0)
+
+    def test_errors_are_not_cached(self):
+        """Only successful responses are cached"""
+        self.populate_database()
+
+        response, count = self.request('get', '/persons/3/computers')
+        self.assertEqual(response.status_code, 404)
+        response, count = self.request('get', '/persons/3/computers')
+        self.assertGreater(count, 0)
+
+    def test_update(self):
+        """Updating a person invalidates the responses that show it"""
+        self.populate_database()
+
+        self.request('get', '/persons/1')
+        self.request('get', '/computers/1?include=owner')
+
+        self.write('patch', '/persons/1', {
+            "data": {
+                "type": "person",
+                "id": "1",
+                "attributes": {
+                  "name": "Johnny"
+                }
+              }
+            })
+
+        response, count = self.request('get', '/persons/1')
+        self.assertEqual(json.loads(response.data.decode())['data']['attributes']['display_name'],
+                         'JOHNNY <john@gmail.com>')
+        response, count = self.request('get', '/computers/1?include=owner')
+        self.assertEqual(json.loads(response.data.decode())['included'][0]['attributes']['display_name'],
+                         'JOHNNY <john@gmail.com>')
+
+    def test_relationship_update(self):
+        """Updating a relationship invalidates the responses of both sides"""
+        self.populate_database()
+
+        self.assertEqual(self.computers(2), [])
+        self.assertIsNone(self.owner(2))
+
+        self.write('post', '/persons/2/relationships/computers', {
+            "data": [
+                {"type": "computer", "id": "2"}
+            ]
+        })
+        self.assertEqual(self.computers(2), [2])
+        self.assertEqual(self.owner(2), {'type': 'person', 'id': 2})
+
+        self.write('patch', '/computers/2/relationships/owner', {
+            "data": {"type": "person", "id": "1"}
+        })
+        self.assertEqual(self.computers(1), [1, 2])
+        self.assertEqual(self.computers(2), [])
+
+    def test_nested_creation(self):
+        """Creating a computer in /persons/<id>/computers invalidates the responses of the person"""
+        self.populate_database()
+
+        self.assertEqual(self.computers(1), [1])
+
+        self.write('post', '/persons/1/computers', {
+            "data": {
+                "type": "computer",
+                "attributes": {
+                    "serial": "Nestor"
+                }
+            }
+        })
+        self.assertEqual(self.computers(1), [1, 3])
+
+    def test_deletion(self):
+        """Deleting a person invalidates the responses of its computers"""
+        self.populate_database()
+
+        self.assertEqual(self.owner(1), {'type': 'person', 'id': 1})
+        self.request('get', '/persons')
+
+        self.write('delete', '/persons/1', None)
+
+        response, count = self.request('get', '/persons')
+        self.assertEqual(json.loads(response.data.decode())['meta']['count'], 1)
+        self.assertIsNone(self.owner(1))
+
+    def test_shared_backend(self):
+        """Applications sharing a backend see the writes made through each other"""
+        self.app.extensions['response_cache'].backend = SharedBackend()
+        self.populate_database()
+
+        other_app = create_app(TestConfig)
+        other_app.extensions['response_cache'].backend = SharedBackend()
+
+        self.request('get', '/persons/2')
+        with other_app.test_request_context():
+            self.assertEqual(other_app.extensions['response_cache'].get_generation('person'),
+                             self.app.extensions['response_cache'].get_generation('person'))
+
+        generation = self.app.extensions['response_cache'].get_generation('person')
+        self.write('patch', '/persons/2', {
+            "data": {
+                "type": "person",
+                "id": "2",
+                "attributes": {
+                  "name": "Grumpy"
+                }
+              }
+            })
+        self.assertNotEqual(other_app.extensions['response_cache'].get_generation('person'), generation)
+
+        SharedBackend.entries.clear()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.api_bp.resource_managers import ComputerList, PersonList
+import json
+from my_utils import QueryCounter
+import test_filtering
+
+"""Tests that compiling relationship filters into IN subqueries finds the same objects as EXISTS"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 4 computers and 4 persons, the fixtures of the filtering tests
+    populate_database = test_filtering.Tests.populate_database
+
+    def add_computer_without_owner(self):
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        data = {
+            "data": {
+                "type": "computer",
+                "attributes": {
+                    "serial": "Sinclair"
+                }
+            }
+        }
+        response = self.client().post('/computers',
+                                      headers=headers,
+                                      data=json.dumps(data))
+        self.assertEqual(response.status_code, 201)
+
+    def get_ids(self, resource, url, strategy):
+        """The ids found with a relationship filter strategy, and the statements of the request"""
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        previous_strategy = resource._data_layer.relationship_filter_strategy
+        resource._data_layer.relationship_filter_strategy = strategy
+        try:
+            with QueryCounter(db.engine) as counter:
+                response = self.client().get(url, headers=headers)
+        finally:
+            resource._data_layer.relationship_filter_strategy = previous_strategy
+        self.assertEqual(response.status_code, 200)
+        return [obj['id'] for obj in json.loads(response.data.decode())['data']], counter.statements
+
+    def assertEquivalent(self, resource, url, filters, expected_ids):
+        url = '{}?filter={}&page[size]=0'.format(url, json.dumps(filters))
+        ids, statements = self.get_ids(resource, url, 'exists')
+        self.assertEqual(ids, expected_ids, filters)
+        self.assertIn('EXISTS', ' '.join(statements))
+
+        ids, statements = self.get_ids(resource, url, 'in')
+        self.assertEqual(ids, expected_ids, filters)
+        self.assertNotIn('EXISTS', ' '.join(statements))
+        self.assertIn(' IN (SELECT', ' '.join(statements))
+
+    def test_persons(self):
+        """Filters on the computers of the persons"""
+        self.populate_database()
+
+        # the showcase filter of the README
+        amstrad = {"name": "computers", "op": "any", "val": {"name": "serial", "op": "ilike", "val": "%Amstrad%"}}
+        self.assertEquivalent(PersonList, '/persons', [amstrad], ['1'])
+        self.assertEquivalent(PersonList, '/persons', [{"not": amstrad}], ['2', '3', '4'])
+        self.assertEquivalent(PersonList, '/persons',
+                              [{"or": [amstrad, {"name": "name", "op": "eq", "val": "Mary"}]}], ['1', '3'])
+        self.assertEquivalent(PersonList, '/persons',
+                              [amstrad, {"name": "email", "op": "eq", "val": "john@gmail.com"}], ['1'])
+        self.assertEquivalent(PersonList, '/persons',
+                              [{"name": "computers", "op": "any",
+                                "val": {"not": {"name": "serial", "op": "in_", "val": ["Amstrad", "Halo"]}}}],
+                              ['2', '3'])
+        # nested, back to the owner
+        self.assertEquivalent(PersonList, '/persons',
+                              [{"name": "computers", "op": "any",
+                                "val": {"name": "owner", "op": "has",
+                                        "val": {"name": "birth_date", "op": "gt", "val": "1980-01-01"}}}],
+                              ['1', '2'])
+
+    def test_computers(self):
+        """Filters on the owner of the computers, including a computer without owner"""
+        self.populate_database()
+        self.add_computer_without_owner()
+
+        john = {"name": "owner", "op": "has", "val": {"name": "name", "op": "eq", "val": "John"}}
+        self.assertEquivalent(ComputerList, '/computers', [john], ['1', '2', '3'])
+        self.assertEquivalent(ComputerList, '/computers', [{"not": john}], ['4', '5'])
+        self.assertEquivalent(ComputerList, '/computers',
+                              [{"or": [john, {"name": "serial", "op": "eq", "val": "Sinclair"}]}],
+                              ['1', '2', '3', '5'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.api_bp.querystring import QueryStringManager as QSManager
+from application.api_bp.schemas import ComputerSchema, PersonSchema
+from application.api_bp.serializer import dump
+from application.encoding import get_encoder
+from application.models import Computer, Person
+from flask import request
+from flask_rest_jsonapi.schema import compute_schema
+import test_filtering
+
+"""Tests that the compiled dump of the schemas produces the same documents as Schema.dump"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 4 computers and 4 persons, the fixtures of the filtering tests
+    populate_database = test_filtering.Tests.populate_database
+
+    def assertSameDocument(self, schema_cls, obj, url, many=False):
+        encode = get_encoder('json')
+        with self.app.test_request_context(url):
+            qs = QSManager(request.args, schema_cls)
+            expected = compute_schema(schema_cls, {'many': many}, qs, qs.include).dump(obj).data
+            document = dump(compute_schema(schema_cls, {'many': many}, qs, qs.include), obj)
+        self.assertEqual(encode(document), encode(expected), url)
+        return document
+
+    def test_persons(self):
+        self.populate_database()
+        persons = Person.query.order_by(Person.id).all()
+
+        for url in ('/persons',
+                    '/persons?include=computers',
+                    '/persons?include=computers.owner',
+                    '/persons?fields[person]=display_name',
+                    '/persons?fields[person]=computers&include=computers&fields[computer]=serial'):
+            document = self.assertSameDocument(PersonSchema, persons, url, many=True)
+        self.assertEqual(document['data'][0]['relationships']['computers'],
+                         {'data': [{'type': 'computer', 'id': '1'}, {'type': 'computer', 'id': '2'}],
+                          'links': {'self': '/persons/1/relationships/computers',
+                                    'related': '/persons/1/computers'}})
+        self.assertEqual([item['id'] for item in document['included']], ['1', '2', '3', '4'])
+
+        for url in ('/persons/1', '/persons/1?include=computers.owner', '/persons/1?fields[person]=birth_date'):
+            self.assertSameDocument(PersonSchema, persons[0], url)
+        self.assertSameDocument(PersonSchema, persons[3], '/persons/4?include=computers')
+        self.assertSameDocument(PersonSchema, None, '/persons/5')
+        self.assertSameDocument(PersonSchema, [], '/persons', many=True)
+
+        # the dump was compiled, for the included computers too
+        self.assertIsNotNone(self.app.extensions['compiled_schemas'][PersonSchema])
+        self.assertIsNotNone(self.app.extensions['compiled_schemas'][ComputerSchema])
+
+    def test_computers(self):
+        self.populate_database()
+        db.session.add(Computer(serial='Sinclair'))
+        db.session.commit()
+        computers = Computer.query.order_by(Computer.id).all()
+
+        for url in ('/computers', '/computers?include=owner', '/computers?include=owner.computers',
+                    '/computers?fields[computer]=owner&include=owner&fields[person]=name'):
+            self.assertSameDocument(ComputerSchema, computers, url, many=True)
+        for url in ('/computers/1', '/computers/5?include=owner'):
+            self.assertSameDocument(ComputerSchema, computers[0], url)
+        self.assertSameDocument(ComputerSchema, computers[4], '/computers/5?include=owner')
+
+    def test_script_root(self):
+        """The links of an application mounted under a prefix"""
+        self.populate_database()
+        person = Person.query.get(1)
+        encode = get_encoder('json')
+        for script_root in ('', '/api', ''):
+            with self.app.test_request_context('/persons/1', base_url='http://localhost' + script_root):
+                qs = QSManager(request.args, PersonSchema)
+                expected = compute_schema(PersonSchema, {}, qs, qs.include).dump(person).data
+                document = dump(compute_schema(PersonSchema, {}, qs, qs.include), person)
+            self.assertEqual(encode(document), encode(expected))
+            self.assertEqual(document['links']['self'], script_root + '/persons/1')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
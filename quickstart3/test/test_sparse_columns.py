@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+from application.api_bp.resource_managers import PersonList
+from my_utils import ApiTestMixin
+
+"""Tests that the data layer only reads the columns that are serialized"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class Tests(ApiTestMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_database(self):
+        """Adds John and Mary, who each own a computer."""
+        for i, (name, birth_date) in enumerate([("John", "1990-12-18"), ("Mary", "1964-03-21")]):
+            self.create_computer("{}'s computer".format(name))
+            self.create_person(name, birth_date=birth_date, computer_ids=[i + 1])
+
+        db.session.remove()
+
+    def person_statement(self, counter):
+        """The statement that selects the persons"""
+        return [statement for statement in counter.statements
+                if 'person' in statement and 'count(' not in statement][0]
+
+    def test_unserialized_columns(self):
+        """Columns that the schema does not dump are not read"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/persons')
+        self.assertEqual(response_data['data'][0]['attributes'],
+                         {'birth_date': '1990-12-18', 'display_name': 'JOHN <john@gmail.com>'})
+        statement = self.person_statement(counter)
+        self.assertNotIn('person.password', statement)
+        # display_name depends on them
+        self.assertIn('person.name', statement)
+        self.assertIn('person.email', statement)
+
+    def test_sparse_fieldsets(self):
+        """Only the columns of the requested fields are read"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/persons?fields[person]=birth_date')
+        self.assertEqual(response_data['data'][0]['attributes'], {'birth_date': '1990-12-18'})
+        statement = self.person_statement(counter)
+        self.assertIn('person.birth_date', statement)
+        self.assertNotIn('person.name', statement)
+        self.assertNotIn('person.email', statement)
+
+        response, response_data, counter = self.get('/persons/2?fields[person]=display_name')
+        self.assertEqual(response_data['data']['attributes'], {'display_name': 'MARY <mary@gmail.com>'})
+        self.assertNotIn('person.birth_date', self.person_statement(counter))
+        self.assertEqual(counter.count, 1)
+
+    def test_included_objects(self):
+        """Only the columns of the requested fields of included objects are read"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/computers?include=owner&fields[person]=birth_date')
+        self.assertEqual([person['attributes'] for person in response_data['included']],
+                         [{'birth_date': '1990-12-18'}, {'birth_date': '1964-03-21'}])
+        statement = self.person_statement(counter)
+        self.assertIn('birth_date', statement)
+        self.assertNotIn('email', statement)
+        self.assertEqual(counter.count, 2)
+
+        response, response_data, counter = self.get('/computers/1/owner?fields[person]=birth_date')
+        self.assertEqual(response_data['data']['attributes'], {'birth_date': '1990-12-18'})
+        self.assertNotIn('email', self.person_statement(counter))
+        self.assertEqual(counter.count, 1)
+
+    def test_sort_columns(self):
+        """The columns of the sort keys are read, so a keyset page does not load them one person at a time"""
+        self.populate_database()
+
+        response, response_data, counter = self.get('/persons?fields[person]=birth_date&sort=name&page[size]=1&page[after]=')
+        self.assertEqual(response_data['data'][0]['id'], '1')
+        self.assertEqual(counter.count, 1)
+
+        response, response_data, counter = self.get(response_data['links']['next'])
+        self.assertEqual(response_data['data'][0]['id'], '2')
+
+    def test_disabled(self):
+        """Setting 'load_dumped_columns' to False reads all the columns"""
+        self.populate_database()
+
+        PersonList._data_layer.load_dumped_columns = False
+        try:
+            response, response_data, counter = self.get('/persons?fields[person]=birth_date')
+        finally:
+            del PersonList._data_layer.load_dumped_columns
+        self.assertIn('person.password', self.person_statement(counter))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
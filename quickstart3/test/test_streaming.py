@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+from config import Config
+from application import create_app, db
+import json
+from my_utils import QueryCounter
+import test_filtering
+
+"""Tests that large pages are streamed, with the same documents as the pages built in memory"""
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    STREAM_PAGE_SIZE = 3
+    STREAM_YIELD_PER = 2
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        # initialize the test client
+        self.client = self.app.test_client
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # 4 computers and 4 persons, the fixtures of the filtering tests
+    populate_database = test_filtering.Tests.populate_database
+
+    def get(self, url):
+        headers = {
+            'Content-Type': 'application/vnd.api+json',
+            'Accept': 'application/vnd.api+json'
+            }
+        return self.client().get(url, headers=headers)
+
+    def assertStreamed(self, url):
+        """The streamed document of url is the same as the document built in memory"""
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        # a streamed response has no Content-Length
+        self.assertNotIn('Content-Length', response.headers, url)
+        self.assertEqual(response.headers.getlist('Content-Type'), ['application/vnd.api+json'])
+        self.assertNotIn('ETag', response.headers)
+
+        stream_page_size = self.app.config['STREAM_PAGE_SIZE']
+        self.app.config['STREAM_PAGE_SIZE'] = None
+        try:
+            expected = self.get(url)
+        finally:
+            self.app.config['STREAM_PAGE_SIZE'] = stream_page_size
+        self.assertIn('Content-Length', expected.headers)
+        self.assertEqual(response.data, expected.data, url)
+        return json.loads(response.data.decode())
+
+    def test_streamed_pages(self):
+        self.populate_database()
+
+        document = self.assertStreamed('/persons?page[size]=0')
+        self.assertEqual([person['id'] for person in document['data']], ['1', '2', '3', '4'])
+        self.assertEqual(document['meta'], {'count': 4})
+        self.assertStreamed('/persons?page[size]=0&include=computers&sort=-name')
+        self.assertStreamed('/persons?page[size]=0&include=computers.owner&fields[person]=display_name,computers')
+        self.assertStreamed('/persons?page[size]=3&page[number]=2')
+        self.assertStreamed('/persons?page[size]=3&page[count]=none')
+        self.assertStreamed('/computers?page[size]=0&include=owner')
+        self.assertStreamed('/persons/1/computers?page[size]=0')
+        self.assertStreamed('/persons/4/computers?page[size]=0')
+        self.assertStreamed('/persons?page[size]=0&filter=[{"name":"name","op":"eq","val":"Nobody"}]')
+
+        # small pages, and pages of cursors, are not streamed
+        self.assertIn('Content-Length', self.get('/persons?page[size]=2').headers)
+        self.assertIn('Content-Length', self.get('/persons?page[size]=5&page[after]=').headers)
+
+    def test_batches(self):
+        """The objects are fetched STREAM_YIELD_PER at a time, with their relationships"""
+        self.populate_database()
+
+        with QueryCounter(db.engine) as counter:
+            response = self.get('/persons?page[size]=0&page[count]=none')
+            self.assertEqual(len(json.loads(response.data.decode())['data']), 4)
+        # the persons, and the computers of each batch of 2 persons
+        self.assertEqual(counter.count, 3)
+
+    def test_unknown_person(self):
+        """The errors found with the first batch are reported before streaming"""
+        response = self.get('/persons/5/computers?page[size]=0')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('Content-Length', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)